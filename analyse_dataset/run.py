@@ -1,41 +1,86 @@
 """
-just a quick and dirty driver program to test the analysis on a collection of email headers
+driver program to test the analysis on a collection of email headers
 
 my dataset:-
     1. connect to a database with sequel pro
     2. select email source.
     3. export as xml
 
-you will need to make some adjustments to iterate over email headers as per your data
+the corpus is streamed (xml export, ndjson, mbox or maildir), memory use doesn't grow with its size.
+one json record per message is written out, a summary goes to stderr at the end.
 
 run (from project root):
-$ python -m analyse_dataset.run > out.txt
+$ python -m analyse_dataset.run analyse_dataset/dataset/query_result_10000.xml > out.ndjson
+$ python -m analyse_dataset.run ~/Maildir --workers 4 --output out.ndjson
 """
-import os
-from pprint import pprint
-import xmltodict
-from emailtrail import analyse_headers
 
-if __name__ == "__main__":
+import argparse
+import dataclasses
+import json
+import sys
+from collections import deque
+from time import perf_counter
+
+from emailtrail import Trail, analyse_many
+from emailtrail.sources import FORMATS, read_source
 
-    filename = "query_result_10000.xml"
-    dirname = "dataset"
 
-    current_dir = os.path.dirname(__file__)
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("path", help="xml export, ndjson file, mbox file or maildir")
+    parser.add_argument(
+        "--format", choices=FORMATS, help="guessed from the path if not given"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="processes, the CPU count by default"
+    )
+    parser.add_argument("--chunksize", type=int, default=64)
+    parser.add_argument(
+        "--output", default="-", help="file to write records to, stdout by default"
+    )
+    return parser.parse_args(argv)
 
-    with open(os.path.join(current_dir, dirname, filename)) as fd:
-        doc = xmltodict.parse(fd.read())
 
-    total_parse_error = 0
-    for row in doc["support_novo"]["custom"]["row"]:
+def run(path, format=None, workers=None, chunksize=64, out=sys.stdout, err=sys.stderr):
+    keys = deque()
 
-        mail_header = row["source"]
-        analysis = analyse_headers(mail_header)
+    def raw_messages():
+        for key, raw in read_source(path, format):
+            keys.append(key)
+            yield raw
 
-        if analysis is not None and analysis["trail"] is not None:
-            pprint(analysis)
-            print("\n\n----------------------------------------\n\n")
+    messages = parse_errors = hops = unparsed_timestamps = 0
+    start = perf_counter()
+    for _, result in analyse_many(raw_messages(), workers=workers, chunksize=chunksize):
+        key = keys.popleft()
+        messages += 1
+        if isinstance(result, Trail):
+            record = {"key": key, "trail": dataclasses.asdict(result)}
+            hops += len(result.hops)
+            unparsed_timestamps += sum(hop.timestamp is None for hop in result.hops)
         else:
-            total_parse_error += 1
+            parse_errors += 1
+            record = {"key": key, "error": repr(result)}
+        out.write(json.dumps(record, default=str) + "\n")
+    elapsed = perf_counter() - start
+
+    summary = {
+        "messages": messages,
+        "seconds": round(elapsed, 3),
+        "messages_per_second": round(messages / elapsed, 1) if elapsed else None,
+        "parse_errors": parse_errors,
+        "parse_error_rate": parse_errors / messages if messages else 0.0,
+        "hops": hops,
+        "timestamp_failure_rate": unparsed_timestamps / hops if hops else 0.0,
+    }
+    err.write(json.dumps(summary, indent=2) + "\n")
+    return summary
 
-    pprint(total_parse_error)
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.output == "-":
+        run(args.path, args.format, args.workers, args.chunksize)
+    else:
+        with open(args.output, "w") as out:
+            run(args.path, args.format, args.workers, args.chunksize, out)
@@ -0,0 +1,264 @@
+"""
+Deterministic generator of synthetic email headers, for benchmarks.
+
+Covers the Received styles of Gmail, Exchange, Postfix, qmail, Exim and SendGrid,
+odd timezones, long hop chains and malformed headers. The same seed always gives the same corpus.
+
+run (from project root):
+$ python -m benchmarks.corpus --count 10000 --seed 1 corpus.ndjson
+"""
+
+import argparse
+import json
+import random
+import time
+from typing import Iterator, List
+
+MONTHS = "Jan Feb Mar Apr May Jun Jul Aug Sep Oct Nov Dec".split()
+DAYS = "Mon Tue Wed Thu Fri Sat Sun".split()
+OFFSETS = ["+0000", "-0700", "-0800", "+0100", "+0530", "+1245", "-0330", "-0000"]
+ZONE_NAMES = ["GMT", "UT", "EST", "EDT", "PST", "PDT", "CST", "MDT"]
+DOMAINS = [
+    "example.com",
+    "example.org",
+    "mail.example.net",
+    "corp.example",
+    "relay.test",
+]
+
+
+class HeaderFactory:
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+
+    def host(self) -> str:
+        rng = self.rng
+        return "%s%d.%s" % (
+            rng.choice(["mail", "mx", "smtp", "relay", "out", "mta"]),
+            rng.randrange(1, 300),
+            rng.choice(DOMAINS),
+        )
+
+    def ip(self) -> str:
+        return ".".join(str(self.rng.randrange(1, 255)) for _ in range(4))
+
+    def ip6(self) -> str:
+        return ":".join("%x" % self.rng.randrange(0, 0xFFFF) for _ in range(4)) + "::1"
+
+    def token(self, length: int = 16) -> str:
+        return "".join(
+            self.rng.choice(
+                "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+            )
+            for _ in range(length)
+        )
+
+    def address(self) -> str:
+        return "%s@%s" % (self.token(8).lower(), self.rng.choice(DOMAINS))
+
+    def date(self, timestamp: int) -> str:
+        """A date in one of the forms seen in Received headers, mostly RFC 5322"""
+        rng = self.rng
+        roll = rng.random()
+        if roll < 0.05:
+            # SendGrid style
+            moment = time.gmtime(timestamp)
+            return time.strftime("%Y-%m-%d %H:%M:%S", moment) + ".%09d +0000 UTC" % (
+                rng.randrange(10**9)
+            )
+        if roll < 0.15:
+            zone, offset = rng.choice(ZONE_NAMES), 0
+            offset = {"EST": -300, "EDT": -240, "PST": -480, "PDT": -420}.get(zone, 0)
+            offset = {"CST": -360, "MDT": -360}.get(zone, offset)
+        else:
+            zone = rng.choice(OFFSETS)
+            offset = int(zone[0] + "1") * (int(zone[1:3]) * 60 + int(zone[3:5]))
+        moment = time.gmtime(timestamp + offset * 60)
+        text = "%s, %d %s %d %02d:%02d:%02d %s" % (
+            DAYS[moment.tm_wday],
+            moment.tm_mday,
+            MONTHS[moment.tm_mon - 1],
+            moment.tm_year,
+            moment.tm_hour,
+            moment.tm_min,
+            moment.tm_sec,
+            zone,
+        )
+        if zone[0] in "+-" and rng.random() < 0.5:
+            text += " (%s)" % rng.choice(["UTC", "PDT", "PST", "CET", "IST"])
+        return text
+
+    def gmail(self, timestamp: int, recipient: str) -> str:
+        if self.rng.random() < 0.5:
+            return "by 10.%d.%d.%d with SMTP id %s;\n        %s" % (
+                self.rng.randrange(255),
+                self.rng.randrange(255),
+                self.rng.randrange(255),
+                self.token(20),
+                self.date(timestamp),
+            )
+        host = self.host()
+        return (
+            "from %s (%s. [%s])\n        by mx.google.com with ESMTPS id %s\n"
+            "        for <%s>\n"
+            "        (version=TLS1_2 cipher=ECDHE-RSA-AES128-GCM-SHA256 bits=128/128);\n"
+            "        %s"
+            % (host, host, self.ip(), self.token(24), recipient, self.date(timestamp))
+        )
+
+    def exchange(self, timestamp: int, recipient: str) -> str:
+        return (
+            "from %s (%s) by\n %s (%s) with Microsoft SMTP\n Server "
+            "(version=TLS1_2, cipher=TLS_ECDHE_RSA_WITH_AES_256_CBC_SHA384_P384) id\n"
+            " 15.1.%d.%d; %s"
+            % (
+                self.host().upper(),
+                self.ip6(),
+                self.host().upper(),
+                self.ip6(),
+                self.rng.randrange(2000),
+                self.rng.randrange(30),
+                self.date(timestamp),
+            )
+        )
+
+    def postfix(self, timestamp: int, recipient: str) -> str:
+        if self.rng.random() < 0.2:
+            return "by %s (Postfix, from userid %d)\n\tid %s; %s" % (
+                self.host(),
+                self.rng.randrange(1000, 2000),
+                self.token(11).upper(),
+                self.date(timestamp),
+            )
+        host = self.host()
+        return (
+            "from %s (%s [%s])\n"
+            "\t(using TLSv1.2 with cipher ECDHE-RSA-AES256-GCM-SHA384 (256/256 bits))\n"
+            "\t(No client certificate requested)\n"
+            "\tby %s (Postfix) with ESMTPS id %s\n\tfor <%s>; %s"
+            % (
+                host,
+                host,
+                self.ip(),
+                self.host(),
+                self.token(11).upper(),
+                recipient,
+                self.date(timestamp),
+            )
+        )
+
+    def qmail(self, timestamp: int, recipient: str) -> str:
+        if self.rng.random() < 0.3:
+            return "(qmail %d invoked by uid %d); %s" % (
+                self.rng.randrange(1000, 99999),
+                self.rng.randrange(100, 999),
+                self.date(timestamp),
+            )
+        return "from unknown (HELO %s) (%s)\n  by %s with SMTP; %s" % (
+            self.host(),
+            self.ip(),
+            self.host(),
+            self.date(timestamp),
+        )
+
+    def exim(self, timestamp: int, recipient: str) -> str:
+        return (
+            "from [%s] (helo=%s)\n\tby %s with esmtpa (Exim 4.86)\n"
+            "\t(envelope-from <%s>)\n\tid %s-%s-%s\n\tfor %s; %s"
+            % (
+                self.ip(),
+                self.host(),
+                self.host(),
+                self.address(),
+                self.token(6),
+                self.token(6),
+                self.token(2),
+                recipient,
+                self.date(timestamp),
+            )
+        )
+
+    def sendgrid(self, timestamp: int, recipient: str) -> str:
+        return "by filter%dp1mdw1.sendgrid.net with SMTP id %s\n        %s" % (
+            self.rng.randrange(1000),
+            self.token(30),
+            self.date(timestamp),
+        )
+
+    def malformed(self, timestamp: int, recipient: str) -> str:
+        rng = self.rng
+        header = rng.choice(STYLES)(self, timestamp, recipient)
+        roll = rng.random()
+        if roll < 0.3:
+            return header[: rng.randrange(1, len(header))]
+        if roll < 0.5:
+            return header.rsplit(";", 1)[0]
+        if roll < 0.6:
+            return "(" * rng.randrange(50, 500) + header
+        if roll < 0.8:
+            return "by %s with %s; %s" % (self.host(), self.token(5), self.token(20))
+        return "???"
+
+
+STYLES = [
+    HeaderFactory.gmail,
+    HeaderFactory.exchange,
+    HeaderFactory.postfix,
+    HeaderFactory.qmail,
+    HeaderFactory.exim,
+    HeaderFactory.sendgrid,
+]
+
+
+def received_headers(factory: HeaderFactory, recipient: str) -> List[str]:
+    """Received headers of one message, newest first as they appear in the source"""
+    rng = factory.rng
+    hop_count = rng.choice([1, 2, 3, 3, 4, 4, 5, 6, 8]) if rng.random() > 0.02 else 30
+    timestamp = rng.randrange(1262304000, 1700000000)
+    headers = []
+    for _ in range(hop_count):
+        if rng.random() < 0.03:
+            timestamp -= rng.randrange(1, 120)  # a relay with a skewed clock
+        else:
+            timestamp += rng.choice([0, 0, 1, 1, 2, 5, 30, 600])
+        style = HeaderFactory.malformed if rng.random() < 0.05 else rng.choice(STYLES)
+        headers.append(style(factory, timestamp, recipient))
+    headers.reverse()
+    return headers
+
+
+def generate_messages(count: int, seed: int = 0) -> Iterator[str]:
+    """Yields `count` email sources (headers and a short body)"""
+    factory = HeaderFactory(random.Random(seed))
+    rng = factory.rng
+    for _ in range(count):
+        recipient = factory.address()
+        lines = [
+            "Received: " + header for header in received_headers(factory, recipient)
+        ]
+        lines.append("From: %s" % factory.address())
+        lines.append("To: %s" % recipient)
+        if rng.random() < 0.2:
+            lines.append("Cc: %s, %s" % (factory.address(), factory.address()))
+        lines.append("Subject: %s" % factory.token(30))
+        lines.append("")
+        lines.append(factory.token(rng.randrange(10, 500)))
+        yield "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "output", help="NDJSON file, one {'source': ...} object per line"
+    )
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(args.output, "w") as fd:
+        for source in generate_messages(args.count, args.seed):
+            fd.write(json.dumps({"source": source}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Tracks how long `import emailtrail` takes, as reported by `python -X importtime`.
+
+run (from project root):
+$ python -m benchmarks.import_time --runs 20 --json import_time.json
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+
+def measure_once() -> dict:
+    """Import times (in microseconds, cumulative) of the emailtrail modules in a fresh interpreter"""
+    process = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            "import emailtrail, sys; print('dateparser' in sys.modules)",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    timings = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        name = name.strip()
+        if name.startswith("emailtrail"):
+            timings[name] = int(cumulative)
+    timings["dateparser_loaded"] = process.stdout.strip() == "True"
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    runs = [measure_once() for _ in range(args.runs)]
+    result = {
+        "runs": args.runs,
+        "median_us": statistics.median(run["emailtrail"] for run in runs),
+        "min_us": min(run["emailtrail"] for run in runs),
+        "dateparser_loaded": any(run["dateparser_loaded"] for run in runs),
+        "modules_median_us": {
+            name: statistics.median(run[name] for run in runs)
+            for name in runs[0]
+            if name.startswith("emailtrail")
+        },
+    }
+
+    print("import emailtrail: median %(median_us)dus, min %(min_us)dus" % result)
+    if result["dateparser_loaded"]:
+        print("warning: dateparser is imported at startup")
+    if args.json:
+        with open(args.json, "w") as fd:
+            json.dump(result, fd, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Benchmarks the analysis stages on a synthetic corpus (see benchmarks/corpus.py).
+
+Times `analyse_headers`, `analyse_single_header`, `extract_timestring` and `get_timestamp`
+separately and reports items/sec, p50/p99 latency and peak memory.
+Results can be saved as JSON and compared with an earlier run.
+
+run (from project root):
+$ python -m benchmarks.run --count 5000 --json after.json --compare before.json
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Callable, List
+
+from emailtrail import (
+    analyse_headers,
+    analyse_single_header,
+    extract_timestring,
+    get_timestamp,
+)
+from emailtrail.headers import scan_headers
+from emailtrail.timestamps import timestamp_cache
+from emailtrail.utils import cleanup_text
+
+from .corpus import generate_messages
+
+
+def measure(function: Callable, inputs: List, repeat: int = 1) -> dict:
+    """Latency of every call, then peak memory in a separate (traced) pass"""
+    for item in inputs[:100]:
+        function(item)  # warm up
+
+    latencies = []
+    clock = time.perf_counter_ns
+    for _ in range(repeat):
+        for item in inputs:
+            start = clock()
+            function(item)
+            latencies.append(clock() - start)
+    latencies.sort()
+
+    tracemalloc.start()
+    for item in inputs:
+        function(item)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    total = sum(latencies)
+    return {
+        "items": len(latencies),
+        "items_per_sec": len(latencies) / (total / 1e9) if total else 0.0,
+        "p50_us": latencies[len(latencies) // 2] / 1000,
+        "p99_us": latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)] / 1000,
+        "max_us": latencies[-1] / 1000,
+        "peak_memory_kb": peak / 1024,
+    }
+
+
+def without_timestamp_cache(function: Callable) -> Callable:
+    def uncached(item):
+        timestamp_cache.clear()
+        return function(item)
+
+    return uncached
+
+
+def run(count: int, seed: int, repeat: int) -> dict:
+    messages = list(generate_messages(count, seed))
+    received = [
+        cleanup_text(header)
+        for message in messages
+        for header in scan_headers(message).get_all("Received", [])
+    ]
+    timestrings = [extract_timestring(header) for header in received]
+    timestrings = [timestring for timestring in timestrings if timestring is not None]
+
+    benchmarks = {
+        "analyse_headers": (analyse_headers, messages),
+        "analyse_headers_uncached": (
+            without_timestamp_cache(analyse_headers),
+            messages,
+        ),
+        "analyse_single_header": (analyse_single_header, received),
+        "extract_timestring": (extract_timestring, received),
+        "get_timestamp": (without_timestamp_cache(get_timestamp), timestrings),
+        "get_timestamp_cached": (get_timestamp, timestrings),
+    }
+    results = {}
+    for name, (function, inputs) in benchmarks.items():
+        timestamp_cache.clear()
+        results[name] = measure(function, inputs, repeat)
+    return {
+        "meta": {
+            "count": count,
+            "seed": seed,
+            "repeat": repeat,
+            "python": sys.version.split()[0],
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "results": results,
+    }
+
+
+def report(results: dict) -> None:
+    print(
+        "%-26s %12s %10s %10s %12s"
+        % ("benchmark", "items/sec", "p50 us", "p99 us", "peak KiB")
+    )
+    for name, result in results["results"].items():
+        print(
+            "%-26s %12.0f %10.1f %10.1f %12.0f"
+            % (
+                name,
+                result["items_per_sec"],
+                result["p50_us"],
+                result["p99_us"],
+                result["peak_memory_kb"],
+            )
+        )
+
+
+def compare(baseline: dict, results: dict, threshold: float) -> bool:
+    """Prints the change against `baseline`, returns False if anything got slower than `threshold`"""
+    ok = True
+    print("\n%-26s %12s %12s" % ("compared to baseline", "items/sec", "p99"))
+    for name, result in results["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        speed = result["items_per_sec"] / before["items_per_sec"] - 1
+        p99 = result["p99_us"] / before["p99_us"] - 1 if before["p99_us"] else 0.0
+        regressed = speed < -threshold
+        ok = ok and not regressed
+        print(
+            "%-26s %+11.1f%% %+11.1f%%%s"
+            % (name, speed * 100, p99 * 100, "  REGRESSION" if regressed else "")
+        )
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--count", type=int, default=2000, help="messages in the corpus"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results of an earlier run to compare with")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="throughput loss counted as a regression (default 0.1)",
+    )
+    args = parser.parse_args()
+
+    results = run(args.count, args.seed, args.repeat)
+    report(results)
+
+    if args.json:
+        with open(args.json, "w") as fd:
+            json.dump(results, fd, indent=2)
+
+    if args.compare:
+        with open(args.compare) as fd:
+            baseline = json.load(fd)
+        if not compare(baseline, results, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
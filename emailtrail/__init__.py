@@ -1,3 +1,9 @@
+__version__ = "0.4.0"
+
 from .module import *  # noqa
 
-from .models import Trail, Hop  # noqa
+from .models import Trail, Hop, Limits  # noqa
+from .mbox import analyse_mbox  # noqa
+from .batch import analyse_many  # noqa
+from .columnar import TrailBatch  # noqa
+from .delays import compute_delays  # noqa
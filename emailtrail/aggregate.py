@@ -0,0 +1,306 @@
+"""
+Fleet level delay statistics, per relay (`received_by_host`) and per (from_host, received_by_host) edge.
+
+    aggregator = RelayAggregator(max_keys=10000)
+    for trail in trails:
+        aggregator.add(trail)
+    aggregator.summary()  # {"relays": {host: {"count":, "p50":, "p95":, "p99": ...}}, "edges": ...}
+
+Delays go into quantile sketches with a fixed relative error, so memory doesn't grow with the
+number of hops. Hosts and edges past `max_keys` are dropped, rarest first. Like in a space-saving
+sketch, one added after a drop is ranked as if it had as many hops as the most seen dropped
+before it, so it isn't the first to go next time.
+Aggregators from parallel workers can be merged, directly or after a round trip through
+`to_dict`/`from_dict` (JSON-serializable).
+"""
+
+import math
+from typing import Dict, Iterable, Tuple
+
+from .models import Trail
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class DelaySketch:
+    """
+    Mergeable quantile sketch of non negative delays (DDSketch). Values are counted in buckets
+    growing by a factor of `gamma`, so a quantile is off by `relative_accuracy` at most.
+    Past `max_buckets` the lowest buckets are collapsed into one, losing accuracy on the
+    smallest delays first.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, max_buckets: int = 2048):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.zeros = 0
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+
+    def add(self, value: float, count: int = 1) -> None:
+        self.count += count
+        if value <= 0:
+            self.zeros += count
+            return
+        bucket = math.ceil(math.log(value) / self._log_gamma)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+
+    def merge(self, other: "DelaySketch") -> None:
+        if other.gamma != self.gamma:
+            raise ValueError("can't merge sketches with different accuracies")
+        self.count += other.count
+        self.zeros += other.zeros
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+
+    def quantile(self, q: float) -> float:
+        """Estimate of quantile `q` (0 to 1), None if the sketch is empty"""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if seen > rank:
+            return 0.0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen > rank:
+                return 2 * self.gamma**bucket / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def _collapse(self) -> None:
+        ordered = sorted(self.buckets)
+        excess = ordered[: len(ordered) - self.max_buckets + 1]
+        collapsed = sum(self.buckets.pop(bucket) for bucket in excess)
+        self.buckets[excess[-1]] = collapsed
+
+    def to_dict(self) -> dict:
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "max_buckets": self.max_buckets,
+            "zeros": self.zeros,
+            "buckets": [[bucket, count] for bucket, count in self.buckets.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "DelaySketch":
+        sketch = cls(state["relative_accuracy"], state["max_buckets"])
+        sketch.zeros = state["zeros"]
+        sketch.buckets = {bucket: count for bucket, count in state["buckets"]}
+        sketch.count = sketch.zeros + sum(sketch.buckets.values())
+        return sketch
+
+
+class RelayStats:
+    """
+    Hops seen for a relay or edge.
+    `unknown` hops lack a timestamp (theirs or the previous hop's) and have no delay,
+    `skewed` ones have a timestamp before the previous hop's and count as a delay of 0.
+    `floor` is how many hops it may have had before it was dropped, it only ranks it when
+    rarer ones are dropped.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, floor: int = 0):
+        self.floor = floor
+        self.count = 0
+        self.unknown = 0
+        self.skewed = 0
+        self.total = 0
+        self.max = 0
+        self.sketch = DelaySketch(relative_accuracy)
+
+    def add(self, delay: int) -> None:
+        self.count += 1
+        if delay is None:
+            self.unknown += 1
+            return
+        if delay < 0:
+            self.skewed += 1
+            delay = 0
+        self.total += delay
+        if delay > self.max:
+            self.max = delay
+        self.sketch.add(delay)
+
+    def merge(self, other: "RelayStats") -> None:
+        self.floor += other.floor
+        self.count += other.count
+        self.unknown += other.unknown
+        self.skewed += other.skewed
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+
+    def summary(self, quantiles: Tuple[float, ...] = QUANTILES) -> dict:
+        timed = self.count - self.unknown
+        summary = {
+            "count": self.count,
+            "unknown": self.unknown,
+            "skewed": self.skewed,
+            "mean": self.total / timed if timed else None,
+            "max": self.max,
+        }
+        for q in quantiles:
+            summary["p%g" % (q * 100)] = self.sketch.quantile(q)
+        return summary
+
+    def to_dict(self) -> dict:
+        return {
+            "floor": self.floor,
+            "count": self.count,
+            "unknown": self.unknown,
+            "skewed": self.skewed,
+            "total": self.total,
+            "max": self.max,
+            "sketch": self.sketch.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "RelayStats":
+        stats = cls()
+        # missing from states written before the floors were kept
+        stats.floor = state.get("floor", 0)
+        stats.count = state["count"]
+        stats.unknown = state["unknown"]
+        stats.skewed = state["skewed"]
+        stats.total = state["total"]
+        stats.max = state["max"]
+        stats.sketch = DelaySketch.from_dict(state["sketch"])
+        return stats
+
+
+class RelayAggregator:
+    """
+    Delay statistics per relay and per edge, fed with trails as they come.
+    max_keys: relays, and edges, kept at most. Past that the rarest quarter is dropped, their
+    hops are only counted, in `dropped_hops` for relays and `dropped_edge_hops` for edges.
+    Hosts seen often enough come back later.
+    relative_accuracy: of the delay quantiles.
+    """
+
+    def __init__(self, max_keys: int = 10000, relative_accuracy: float = 0.01):
+        self.max_keys = max_keys
+        self.relative_accuracy = relative_accuracy
+        self.relays: Dict[str, RelayStats] = {}
+        self.edges: Dict[Tuple[str, str], RelayStats] = {}
+        self.trails = 0
+        self.dropped_hops = 0
+        self.dropped_edge_hops = 0
+        # ranks of the most seen relay and edge dropped so far, see `RelayStats.floor`
+        self.relay_floor = 0
+        self.edge_floor = 0
+
+    def add(self, trail: Trail) -> None:
+        self.trails += 1
+        previous = None
+        for hop in trail.hops:
+            if hop.timestamp is None or previous is None:
+                delay = None
+            else:
+                delay = hop.timestamp - previous
+            previous = hop.timestamp
+            self._stats(self.relays, hop.received_by_host).add(delay)
+            self._stats(self.edges, (hop.from_host, hop.received_by_host)).add(delay)
+
+    def update(self, trails: Iterable[Trail]) -> None:
+        for trail in trails:
+            self.add(trail)
+
+    def _stats(self, table: dict, key) -> RelayStats:
+        stats = table.get(key)
+        if stats is None:
+            if len(table) >= self.max_keys:
+                self._prune(table)
+            floor = self.relay_floor if table is self.relays else self.edge_floor
+            stats = table[key] = RelayStats(self.relative_accuracy, floor)
+        return stats
+
+    def _prune(self, table: dict) -> None:
+        """Drops the rarest quarter of `table`, makes room for new keys in one go"""
+        keep = self.max_keys * 3 // 4
+
+        def rank(key):
+            return table[key].count + table[key].floor
+
+        ranked = sorted(table, key=rank, reverse=True)
+        dropped = ranked[keep:]
+        if not dropped:
+            return
+        floor = rank(dropped[0])
+        hops = sum(table.pop(key).count for key in dropped)
+        if table is self.relays:
+            self.dropped_hops += hops
+            self.relay_floor = max(self.relay_floor, floor)
+        else:
+            self.dropped_edge_hops += hops
+            self.edge_floor = max(self.edge_floor, floor)
+
+    def merge(self, other: "RelayAggregator") -> None:
+        self.trails += other.trails
+        self.dropped_hops += other.dropped_hops
+        self.dropped_edge_hops += other.dropped_edge_hops
+        self.relay_floor = max(self.relay_floor, other.relay_floor)
+        self.edge_floor = max(self.edge_floor, other.edge_floor)
+        for table, other_table in (
+            (self.relays, other.relays),
+            (self.edges, other.edges),
+        ):
+            for key, other_stats in other_table.items():
+                stats = table.get(key)
+                if stats is None:
+                    stats = self._stats(table, key)
+                stats.merge(other_stats)
+
+    def summary(self, quantiles: Tuple[float, ...] = QUANTILES) -> dict:
+        return {
+            "trails": self.trails,
+            "dropped_hops": self.dropped_hops,
+            "dropped_edge_hops": self.dropped_edge_hops,
+            "relays": {
+                host: stats.summary(quantiles) for host, stats in self.relays.items()
+            },
+            "edges": {
+                key: stats.summary(quantiles) for key, stats in self.edges.items()
+            },
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "max_keys": self.max_keys,
+            "relative_accuracy": self.relative_accuracy,
+            "trails": self.trails,
+            "dropped_hops": self.dropped_hops,
+            "dropped_edge_hops": self.dropped_edge_hops,
+            "relay_floor": self.relay_floor,
+            "edge_floor": self.edge_floor,
+            "relays": {host: stats.to_dict() for host, stats in self.relays.items()},
+            "edges": [
+                [from_host, by_host, stats.to_dict()]
+                for (from_host, by_host), stats in self.edges.items()
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "RelayAggregator":
+        aggregator = cls(state["max_keys"], state["relative_accuracy"])
+        aggregator.trails = state["trails"]
+        aggregator.dropped_hops = state["dropped_hops"]
+        # missing from states written before edges were counted and floors kept
+        aggregator.dropped_edge_hops = state.get("dropped_edge_hops", 0)
+        aggregator.relay_floor = state.get("relay_floor", 0)
+        aggregator.edge_floor = state.get("edge_floor", 0)
+        aggregator.relays = {
+            host: RelayStats.from_dict(stats) for host, stats in state["relays"].items()
+        }
+        aggregator.edges = {
+            (from_host, by_host): RelayStats.from_dict(stats)
+            for from_host, by_host, stats in state["edges"]
+        }
+        return aggregator
@@ -0,0 +1,79 @@
+import asyncio
+from collections import deque
+from concurrent.futures import Executor
+from typing import AsyncIterable, AsyncIterator, Iterable, Tuple, Union
+
+from .batch import Result
+from .models import Limits, Trail
+from .module import analyse_headers
+
+
+async def analyse_headers_async(
+    raw_headers: Union[str, bytes],
+    executor: Executor = None,
+    limit: asyncio.Semaphore = None,
+    limits: Limits = None,
+) -> Trail:
+    """
+    `analyse_headers` on `executor` (the loop's default executor if None).
+    limit: optional semaphore shared between callers to bound how many analyses are in flight.
+    limits: caps on the work done for the message, see `analyse_headers`.
+    """
+    loop = asyncio.get_running_loop()
+    if limit is None:
+        return await loop.run_in_executor(
+            executor, analyse_headers, raw_headers, limits
+        )
+    async with limit:
+        return await loop.run_in_executor(
+            executor, analyse_headers, raw_headers, limits
+        )
+
+
+async def analyse_many_async(
+    raw_messages: Union[Iterable, AsyncIterable],
+    executor: Executor = None,
+    max_in_flight: int = 8,
+    limits: Limits = None,
+) -> AsyncIterator[Tuple[int, Result]]:
+    """
+    Async counterpart of `analyse_many`: yields `(index, result)` pairs in input order,
+    result being the Trail or the exception raised for that input.
+    The next input is only pulled from `raw_messages` (a sync or async iterable) while fewer
+    than `max_in_flight` analyses are running, which pushes back on the producer.
+    limits: caps on the work done per message, see `analyse_headers`.
+    """
+    if max_in_flight < 1:
+        raise ValueError("max_in_flight must be >= 1")
+    loop = asyncio.get_running_loop()
+    pending = deque()
+    try:
+        index = 0
+        async for raw in aiterate(raw_messages):
+            if len(pending) >= max_in_flight:
+                yield await outcome(*pending.popleft())
+            pending.append(
+                (index, loop.run_in_executor(executor, analyse_headers, raw, limits))
+            )
+            index += 1
+        while pending:
+            yield await outcome(*pending.popleft())
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+async def outcome(index: int, future: asyncio.Future) -> Tuple[int, Result]:
+    try:
+        return index, await future
+    except Exception as error:
+        return index, error
+
+
+async def aiterate(items: Union[Iterable, AsyncIterable]) -> AsyncIterator:
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
@@ -0,0 +1,144 @@
+import os
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, wait
+from itertools import count, islice
+from typing import Iterable, Iterator, List, Tuple, Union
+
+from .interning import interner
+from .models import Limits, Trail
+from .module import analyse_headers
+from .timestamps import warm_up
+
+Result = Union[Trail, Exception]
+
+EXECUTORS = ("process", "thread")
+
+
+def analyse_many(
+    raw_messages: Iterable[Union[str, bytes]],
+    workers: int = None,
+    chunksize: int = 64,
+    ordered: bool = True,
+    limits: Limits = None,
+    executor: str = "process",
+) -> Iterator[Tuple[int, Result]]:
+    """
+    Analyses many email sources (anything `analyse_headers` takes) on a pool of worker processes.
+    Yields `(index, result)` pairs where index is the position in `raw_messages` and result
+    is the Trail, or the exception analysing that input raised.
+    workers: number of processes, the CPU count by default. With 1 everything runs in this process.
+    chunksize: inputs sent to a worker at a time.
+    ordered: yield results in input order, otherwise as soon as their chunk is done.
+    limits: caps on the work done per message, see `analyse_headers`.
+    executor: "process", or "thread" for a pool of threads in this process. Nothing is pickled
+    then, on free-threaded python they run in parallel too.
+    Inputs are read lazily, a few chunks per worker are in flight at any time.
+    """
+    if chunksize < 1:
+        raise ValueError("chunksize must be >= 1")
+    workers = workers or os.cpu_count() or 1
+    with worker_pool(workers, executor) as pool:
+        yield from analyse_chunks(
+            pool, workers, iter_chunks(raw_messages, chunksize), ordered, limits
+        )
+
+
+@contextmanager
+def worker_pool(workers: int, executor: str = "process"):
+    """
+    Process (or thread) pool for `analyse_chunks`, None with 1 worker: everything then
+    runs in this thread
+    """
+    if executor not in EXECUTORS:
+        raise ValueError("executor must be one of %s" % ", ".join(EXECUTORS))
+    if workers == 1:
+        yield None
+        return
+
+    if executor == "thread":
+        from concurrent.futures import ThreadPoolExecutor as Executor
+    else:
+        # imports multiprocessing, keep it out of `import emailtrail`
+        from concurrent.futures import ProcessPoolExecutor as Executor
+
+    with Executor(max_workers=workers, initializer=warm_up) as pool:
+        yield pool
+
+
+def analyse_chunks(
+    pool,
+    workers: int,
+    chunks: Iterable[Tuple[int, List]],
+    ordered: bool = True,
+    limits: Limits = None,
+) -> Iterator[Tuple[int, Result]]:
+    """Analyses `(start, chunk)` pairs on a `worker_pool` of `workers`, a few chunks each at a time"""
+    if pool is None:
+        for start, chunk in chunks:
+            yield from analyse_chunk(start, chunk, limits)
+        return
+
+    pending = deque() if ordered else set()
+    max_pending = workers * 2
+    try:
+        for start, chunk in chunks:
+            if len(pending) >= max_pending:
+                yield from drain(pending, ordered)
+            future = pool.submit(analyse_chunk, start, chunk, limits)
+            if ordered:
+                pending.append(future)
+            else:
+                pending.add(future)
+        while pending:
+            yield from drain(pending, ordered)
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def drain(pending, ordered: bool) -> Iterator[Tuple[int, Result]]:
+    """Yields the results of the oldest chunk (ordered) or of whichever chunks are done"""
+    if ordered:
+        yield from interned(pending.popleft().result())
+        return
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    for future in done:
+        pending.remove(future)
+        yield from interned(future.result())
+
+
+def interned(results: List[Tuple[int, Result]]) -> List[Tuple[int, Result]]:
+    """
+    Trails from a worker process hold strings of their own, interns them in this process.
+    From a thread they're already interned, it only costs lookups.
+    """
+    if interner.maxsize:
+        for _, result in results:
+            if isinstance(result, Trail):
+                interner.intern_trail(result)
+    return results
+
+
+def analyse_chunk(
+    start: int, chunk: List, limits: Limits = None
+) -> List[Tuple[int, Result]]:
+    results = []
+    for index, raw in zip(count(start), chunk):
+        try:
+            results.append((index, analyse_headers(raw, limits)))
+        except Exception as error:
+            results.append((index, error))
+    return results
+
+
+def iter_chunks(items: Iterable, chunksize: int) -> Iterator[Tuple[int, List]]:
+    """Splits `items` into lists of `chunksize`, along with the index of their first item"""
+    iterator = iter(items)
+    start = 0
+    while True:
+        chunk = list(islice(iterator, chunksize))
+        if not chunk:
+            return
+        yield start, chunk
+        start += len(chunk)
@@ -0,0 +1,105 @@
+from collections import OrderedDict, namedtuple
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Hashable
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "evictions", "size", "maxsize"])
+
+_missing = object()
+
+
+class LRUCache:
+    """
+    Size-bounded, thread-safe least-recently-used mapping.
+    `None` is a valid value, so failed lookups/parses can be cached too.
+    A maxsize of 0 disables caching.
+    With a `ttl` (in seconds of `clock`) entries also expire that long after they were put.
+    """
+
+    def __init__(
+        self, maxsize: int = 4096, ttl: float = None, clock: Callable = monotonic
+    ):
+        if maxsize < 0:
+            raise ValueError("maxsize must be >= 0")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._expires = {}
+        self._lock = Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self._data.get(key, _missing)
+            if value is not _missing and self._expired(key):
+                del self._data[key]
+                del self._expires[key]
+                self.evictions += 1
+                value = _missing
+            if value is _missing:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize == 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if self.ttl is not None:
+                self._expires[key] = self.clock() + self.ttl
+            self._evict()
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[Hashable], Any]) -> Any:
+        """Returns the cached value for `key`, computing (and caching) it on a miss"""
+        value = self.get(key, _missing)
+        if value is _missing:
+            value = compute(key)
+            self.put(key, value)
+        return value
+
+    def resize(self, maxsize: int) -> None:
+        if maxsize < 0:
+            raise ValueError("maxsize must be >= 0")
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def clear(self) -> None:
+        """Drops all entries and resets the counters"""
+        with self._lock:
+            self._data.clear()
+            self._expires.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(
+                self.hits, self.misses, self.evictions, len(self._data), self.maxsize
+            )
+
+    def values(self) -> list:
+        """Snapshot of the cached values, least recently used first"""
+        with self._lock:
+            return list(self._data.values())
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _expired(self, key: Hashable) -> bool:
+        # caller holds the lock
+        expires = self._expires.get(key)
+        return expires is not None and self.clock() >= expires
+
+    def _evict(self) -> None:
+        # caller holds the lock
+        while len(self._data) > self.maxsize:
+            key, _ = self._data.popitem(last=False)
+            self._expires.pop(key, None)
+            self.evictions += 1
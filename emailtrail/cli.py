@@ -0,0 +1,237 @@
+"""
+emailtrail command line tool.
+
+Analyses email files (.eml, maildir messages ...) and writes their trails as NDJSON, or as CSV
+with one row per hop.
+
+$ emailtrail message.eml
+$ emailtrail ~/Maildir 'archive/**/*.eml' --workers 8 --format csv --output hops.csv --progress
+$ cat message.eml | emailtrail
+"""
+
+import argparse
+import csv
+import dataclasses
+import glob
+import json
+import os
+import sys
+from contextlib import nullcontext
+from time import perf_counter
+from typing import Iterator, List, Tuple
+
+from .batch import analyse_many
+from .instrument import profile
+from .models import Limits, Trail
+from .module import DEFAULT_LIMITS
+from .sources import read_header_block
+
+STDIN = "-"
+CSV_COLUMNS = (
+    "file",
+    "hop",
+    "from_host",
+    "protocol",
+    "received_by_host",
+    "timestamp",
+    "delay",
+    "error",
+)
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="emailtrail",
+        description="Analyse the hops taken by emails to reach you.",
+    )
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        help="files, directories (read recursively) or globs, '-' for stdin. Stdin if none",
+    )
+    parser.add_argument("--format", choices=("ndjson", "csv"), default="ndjson")
+    parser.add_argument("--output", "-o", default=STDIN, help="stdout by default")
+    parser.add_argument(
+        "--workers", "-j", type=int, default=None, help="CPU count by default"
+    )
+    parser.add_argument("--chunksize", type=int, default=64)
+    parser.add_argument(
+        "--max-received",
+        type=int,
+        default=DEFAULT_LIMITS.max_received,
+        help="Received headers analysed per message",
+    )
+    parser.add_argument(
+        "--progress", action="store_true", help="report progress on stderr"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="print per-stage timing on stderr, runs everything in this process",
+    )
+    return parser.parse_args(argv)
+
+
+def expand_paths(paths: List[str]) -> Iterator[str]:
+    """Files named by `paths`, directories are walked and globs expanded, lazily"""
+    for path in paths:
+        if path == STDIN:
+            yield path
+        elif os.path.isdir(path):
+            yield from walk(path)
+        elif not glob.has_magic(path):
+            # missing files too, reading them reports the error
+            yield path
+        else:
+            for match in glob.iglob(path, recursive=True):
+                if os.path.isdir(match):
+                    yield from walk(match)
+                else:
+                    yield match
+
+
+def walk(directory: str) -> Iterator[str]:
+    for root, directories, files in os.walk(directory):
+        directories.sort()
+        for name in sorted(files):
+            yield os.path.join(root, name)
+
+
+def read_message(path: str):
+    """Header block of a message file, or the OSError reading it"""
+    try:
+        if path == STDIN:
+            return sys.stdin.buffer.read()
+        return read_header_block(path)
+    except OSError as error:
+        return error
+
+
+def analyse_files(
+    paths: Iterator[str], workers: int, chunksize: int, limits: Limits
+) -> Iterator[Tuple[str, object]]:
+    """(path, trail or exception) of every file, in no particular order"""
+    # index -> (path, error reading it), for the messages in flight
+    names = {}
+
+    def messages():
+        for index, path in enumerate(paths):
+            raw = read_message(path)
+            if isinstance(raw, Exception):
+                # nothing to analyse, still takes an index so the results line up
+                names[index] = (path, raw)
+                yield b""
+            else:
+                names[index] = (path, None)
+                yield raw
+
+    for index, result in analyse_many(
+        messages(), workers=workers, chunksize=chunksize, ordered=False, limits=limits
+    ):
+        path, error = names.pop(index)
+        yield path, error or result
+
+
+class NDJSONWriter:
+    def __init__(self, out):
+        self.out = out
+
+    def write(self, path: str, result) -> None:
+        if isinstance(result, Trail):
+            record = {"file": path, "trail": dataclasses.asdict(result)}
+        else:
+            record = {"file": path, "error": repr(result)}
+        self.out.write(json.dumps(record) + "\n")
+
+
+class CSVWriter:
+    def __init__(self, out):
+        self.writer = csv.writer(out)
+        self.writer.writerow(CSV_COLUMNS)
+
+    def write(self, path: str, result) -> None:
+        if not isinstance(result, Trail):
+            self.writer.writerow((path, "", "", "", "", "", "", repr(result)))
+            return
+        for number, hop in enumerate(result.hops, 1):
+            self.writer.writerow(
+                (
+                    path,
+                    number,
+                    hop.from_host,
+                    hop.protocol,
+                    hop.received_by_host,
+                    "" if hop.timestamp is None else hop.timestamp,
+                    hop.delay,
+                    "",
+                )
+            )
+
+
+class Progress:
+    """Messages done, rate and errors, on one stderr line at most every `interval` seconds"""
+
+    def __init__(self, stream, interval: float = 1.0):
+        self.stream = stream
+        self.interval = interval
+        self.start = self.last = perf_counter()
+        self.done = 0
+        self.errors = 0
+
+    def update(self, result) -> None:
+        self.done += 1
+        if not isinstance(result, Trail):
+            self.errors += 1
+        now = perf_counter()
+        if now - self.last >= self.interval:
+            self.last = now
+            self.report(end="\r")
+
+    def report(self, end: str = "\n") -> None:
+        elapsed = perf_counter() - self.start
+        rate = self.done / elapsed if elapsed else 0.0
+        self.stream.write(
+            "%d messages, %.0f/s, %d errors%s" % (self.done, rate, self.errors, end)
+        )
+        self.stream.flush()
+
+
+def run(args: argparse.Namespace, out, err) -> int:
+    paths = expand_paths(args.paths or [STDIN])
+    workers = 1 if args.profile else args.workers
+    limits = Limits(max_received=args.max_received)
+    writer = CSVWriter(out) if args.format == "csv" else NDJSONWriter(out)
+    progress = Progress(err) if args.progress else None
+
+    errors = 0
+    with profile() if args.profile else nullcontext() as recorded:
+        for path, result in analyse_files(paths, workers, args.chunksize, limits):
+            writer.write(path, result)
+            errors += not isinstance(result, Trail)
+            if progress is not None:
+                progress.update(result)
+
+    if progress is not None:
+        progress.report()
+    if args.profile:
+        for stage, stats in sorted(recorded.summary().items()):
+            err.write(
+                "%-24s %8d calls %10.1f ms  mean %8.1f us  p99 %8.1f us  max %8.1f us\n"
+                % (
+                    stage,
+                    stats["calls"],
+                    stats["total_ms"],
+                    stats["mean_us"],
+                    stats["p99_us"],
+                    stats["max_us"],
+                )
+            )
+    return 1 if errors else 0
+
+
+def main(argv: List[str] = None) -> int:
+    args = parse_args(argv)
+    if args.output == STDIN:
+        return run(args, sys.stdout, sys.stderr)
+    with open(args.output, "w", newline="") as out:
+        return run(args, out, sys.stderr)
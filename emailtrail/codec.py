@@ -0,0 +1,412 @@
+"""
+Compact binary format for streams of trails.
+
+    with open("trails.etrl", "wb") as fd, TrailWriter(fd) as writer:
+        for trail in trails:
+            writer.write(trail)
+
+    with open("trails.etrl", "rb") as fd:
+        for trail in TrailReader(fd):          # streams, works on pipes too
+            ...
+        TrailReader(fd).read_block(42)         # random access, needs a seekable file
+
+Layout, version 2. Integers are little-endian, u32/u64 are unsigned.
+
+    file    := "ETRL" version:u8 reserved:3 block* index trailer
+    block   := "B" length:u32 body           (length of body)
+    body    := trails:u32 hops:u32 strings:u32 base:i64 column*
+    index   := "I" length:u32 blocks:u32 column(block offsets) column(trails per block)
+    trailer := index_offset:u64 "ETRL"
+
+A column is a typecode byte ("B", "H", "I" or "Q": 1, 2, 4 or 8 bytes per value, the narrowest
+fitting its largest value) followed by the values. The body's columns, in order:
+
+    string lengths (chars), the strings (UTF-8, separated by NUL, byte length:u32 first)
+    per trail: to, from, cc, bcc (string indexes), truncated, hop count
+    per hop: from_host, protocol, received_by_host (string indexes), timestamp, delay
+
+Every string (host, protocol, address) is stored once per block. The lengths are only needed
+when a string contains NUL. A timestamp is stored as timestamp - base, base being one less
+than the earliest timestamp of the block, and 0 stands for None: a block spanning less than
+18 hours gets a 2 byte column. A delay is stored as zigzag(delay - the delay its timestamps
+give), 0 when it's the usual one, so that column is usually 1 byte wide.
+
+Reading is bound by building the `Hop` and `Trail` objects. They're built column by column
+with the garbage collector paused, see `paused_gc`.
+"""
+
+import gc
+import struct
+import sys
+from array import array
+from contextlib import contextmanager
+from itertools import accumulate, chain, islice
+from typing import BinaryIO, Iterable, Iterator, List, Tuple
+
+from .models import Hop, Trail
+from .module import calculate_delay
+
+MAGIC = b"ETRL"
+VERSION = 2
+BLOCK = b"B"
+INDEX = b"I"
+TYPECODES = (("B", 0xFF), ("H", 0xFFFF), ("I", 0xFFFFFFFF), ("Q", 0xFFFFFFFFFFFFFFFF))
+ITEMSIZES = {typecode: array(typecode).itemsize for typecode, _ in TYPECODES}
+BIG_ENDIAN = sys.byteorder == "big"
+
+_u32 = struct.Struct("<I")
+_u64 = struct.Struct("<Q")
+# trails, hops, strings, base timestamp
+_block_header = struct.Struct("<IIIq")
+
+
+class CodecError(ValueError):
+    """Input isn't a trail stream, or a version this module can't read"""
+
+
+def zigzag(value: int) -> int:
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def unzigzag(value: int) -> int:
+    # decode_block inlines it
+    return (value >> 1) ^ -(value & 1)
+
+
+def encode_column(values: List[int]) -> bytes:
+    largest = max(values, default=0)
+    for typecode, limit in TYPECODES:
+        if largest <= limit:
+            break
+    else:
+        raise OverflowError("column value doesn't fit in 64 bits")
+    column = array(typecode, values)
+    if BIG_ENDIAN:
+        column.byteswap()
+    return typecode.encode() + column.tobytes()
+
+
+def decode_column(data: bytes, position: int, count: int) -> Tuple[array, int]:
+    typecode = chr(data[position])
+    if typecode not in ITEMSIZES:
+        raise CodecError("unknown column type %r" % typecode)
+    start = position + 1
+    end = start + count * ITEMSIZES[typecode]
+    if end > len(data):
+        raise CodecError("truncated block")
+    column = array(typecode)
+    column.frombytes(data[start:end])
+    if BIG_ENDIAN:
+        column.byteswap()
+    return column, end
+
+
+def encode_block(trails: List[Trail]) -> bytes:
+    """Body of a block holding `trails`"""
+    strings = {}
+    index = strings.setdefault
+    addresses = [[], [], [], []]
+    truncated = []
+    hop_counts = []
+    from_hosts, protocols, by_hosts, hop_timestamps, skews = [], [], [], [], []
+
+    for trail in trails:
+        for column, value in zip(
+            addresses, (trail.to_address, trail.from_address, trail.cc, trail.bcc)
+        ):
+            column.append(index(value, len(strings)))
+        truncated.append(1 if trail.truncated else 0)
+        hop_counts.append(len(trail.hops))
+
+        previous_hop = None
+        for hop in trail.hops:
+            from_hosts.append(index(hop.from_host, len(strings)))
+            protocols.append(index(hop.protocol, len(strings)))
+            by_hosts.append(index(hop.received_by_host, len(strings)))
+            hop_timestamps.append(hop.timestamp)
+            skews.append(
+                zigzag(hop.delay - calculate_delay(hop.timestamp, previous_hop))
+            )
+            previous_hop = hop.timestamp
+
+    known = [timestamp for timestamp in hop_timestamps if timestamp is not None]
+    base = min(known, default=0) - 1
+    timestamps = [
+        0 if timestamp is None else timestamp - base for timestamp in hop_timestamps
+    ]
+
+    text = "\0".join(strings).encode("utf-8", "surrogatepass")
+    parts = [
+        _block_header.pack(len(trails), len(hop_timestamps), len(strings), base),
+        encode_column([len(string) for string in strings]),
+        _u32.pack(len(text)),
+        text,
+    ]
+    parts.extend(encode_column(column) for column in addresses)
+    parts.append(encode_column(truncated))
+    parts.append(encode_column(hop_counts))
+    for column in (from_hosts, protocols, by_hosts, timestamps, skews):
+        parts.append(encode_column(column))
+    return b"".join(parts)
+
+
+def decode_block(body: bytes) -> List[Trail]:
+    """Trails of a block body"""
+    base, strings, trail_columns, hop_columns = read_block_columns(body)
+    to, sender, cc, bcc, truncated, hop_counts = trail_columns
+    from_hosts, protocols, by_hosts, timestamps, skews = hop_columns
+    hop_count = len(timestamps)
+
+    # offsets of the first hop of every trail, and of the end of the last one
+    starts = list(accumulate(chain((0,), hop_counts)))
+    delays = usual_delays(timestamps, starts)
+    if 0 in timestamps:
+        hop_timestamps = [stored + base if stored else None for stored in timestamps]
+    else:
+        hop_timestamps = [stored + base for stored in timestamps]
+    if skews.count(0) != hop_count:
+        delays = [
+            delay + ((stored >> 1) ^ -(stored & 1))
+            for delay, stored in zip(delays, skews)
+        ]
+
+    string = strings.__getitem__
+    with paused_gc():
+        hops = list(
+            map(
+                Hop,
+                map(string, from_hosts),
+                map(string, protocols),
+                map(string, by_hosts),
+                hop_timestamps,
+                delays,
+            )
+        )
+        return list(
+            map(
+                Trail,
+                map(string, to),
+                map(string, sender),
+                map(string, cc),
+                map(string, bcc),
+                map(hops.__getitem__, map(slice, starts, islice(starts, 1, None))),
+                map(bool, truncated),
+            )
+        )
+
+
+def read_block_columns(body: bytes) -> Tuple[int, List[str], List[array], List[array]]:
+    """Base timestamp, strings, trail columns and hop columns of a block body"""
+    trail_count, hop_count, string_count, base = _block_header.unpack_from(body, 0)
+    position = _block_header.size
+
+    lengths, position = decode_column(body, position, string_count)
+    (text_length,) = _u32.unpack_from(body, position)
+    position += _u32.size
+    text_end = position + text_length
+    text = body[position:text_end].decode("utf-8", "surrogatepass")
+    position = text_end
+    strings = text.split("\0")
+    if len(strings) != string_count:
+        # some contain NUL
+        starts = list(
+            accumulate(chain((0,), lengths), lambda end, length: end + length + 1)
+        )
+        ends = [start + length for start, length in zip(starts, lengths)]
+        strings = list(map(text.__getitem__, map(slice, starts, ends)))
+
+    trail_columns = []
+    for _ in range(6):
+        column, position = decode_column(body, position, trail_count)
+        trail_columns.append(column)
+    hop_columns = []
+    for _ in range(5):
+        column, position = decode_column(body, position, hop_count)
+        hop_columns.append(column)
+    return base, strings, trail_columns, hop_columns
+
+
+@contextmanager
+def paused_gc():
+    """
+    Keeps the cyclic garbage collector from running while a block's trails are built. They
+    can't form cycles, but the collector would otherwise run every few hundred of them and
+    walk through every object that's alive, the trails of earlier blocks too.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def usual_delays(timestamps: array, starts: List[int]) -> List[int]:
+    """
+    `calculate_delay` of every hop and the one before it in its trail, from the stored
+    timestamps (0 for None)
+    """
+    if not timestamps:
+        return []
+    delays = [
+        current - previous if previous and current > previous else 0
+        for current, previous in zip(islice(timestamps, 1, None), timestamps)
+    ]
+    delays.insert(0, 0)
+    # the first hop of a trail has no delay. `starts` ends with the hop count, a spare 0
+    # goes there
+    delays.append(0)
+    for start in starts:
+        delays[start] = 0
+    delays.pop()
+    return delays
+
+
+class TrailWriter:
+    """
+    Writes trails to a binary file object, `block_size` trails per block.
+    The index and trailer are written by `close` (or leaving the `with` block), the file
+    object itself is left open.
+    """
+
+    def __init__(self, fileobj: BinaryIO, block_size: int = 1024):
+        if block_size < 1:
+            raise ValueError("block_size must be >= 1")
+        self.fileobj = fileobj
+        self.block_size = block_size
+        self.pending = []
+        self.block_offsets = []
+        self.block_trails = []
+        self.offset = 0
+        self.closed = False
+        self._write(MAGIC + bytes([VERSION, 0, 0, 0]))
+
+    def write(self, trail: Trail) -> None:
+        self.pending.append(trail)
+        if len(self.pending) >= self.block_size:
+            self.flush()
+
+    def write_many(self, trails: Iterable[Trail]) -> None:
+        for trail in trails:
+            self.write(trail)
+
+    def flush(self) -> None:
+        """Writes the pending trails as a block"""
+        if not self.pending:
+            return
+        body = encode_block(self.pending)
+        self.block_offsets.append(self.offset)
+        self.block_trails.append(len(self.pending))
+        self._write(BLOCK + _u32.pack(len(body)) + body)
+        self.pending = []
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.flush()
+        body = b"".join(
+            [
+                _u32.pack(len(self.block_offsets)),
+                encode_column(self.block_offsets),
+                encode_column(self.block_trails),
+            ]
+        )
+        index_offset = self.offset
+        self._write(INDEX + _u32.pack(len(body)) + body)
+        self._write(_u64.pack(index_offset) + MAGIC)
+        self.closed = True
+
+    def _write(self, data: bytes) -> None:
+        self.fileobj.write(data)
+        self.offset += len(data)
+
+    def __enter__(self) -> "TrailWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class TrailReader:
+    """
+    Reads trails written by `TrailWriter` from a binary file object.
+    Iterating streams the blocks in order. `read_block`, `block_count` and `trail_count` use
+    the index at the end of the file and need a seekable file object.
+    """
+
+    def __init__(self, fileobj: BinaryIO):
+        self.fileobj = fileobj
+        self._index = None
+        header = fileobj.read(8)
+        if header[:4] != MAGIC:
+            raise CodecError("not a trail stream")
+        if header[4] != VERSION:
+            raise CodecError("unsupported version %d" % header[4])
+
+    def __iter__(self) -> Iterator[Trail]:
+        for body in self.blocks():
+            yield from decode_block(body)
+
+    def blocks(self) -> Iterator[bytes]:
+        """Bodies of the blocks, in order"""
+        while True:
+            kind, body = self._read_record()
+            if kind != BLOCK:
+                return
+            yield body
+
+    def _read_record(self) -> Tuple[bytes, bytes]:
+        head = self.fileobj.read(5)
+        if len(head) < 5:
+            raise CodecError("truncated trail stream")
+        (length,) = _u32.unpack_from(head, 1)
+        body = self.fileobj.read(length)
+        if len(body) < length:
+            raise CodecError("truncated trail stream")
+        return head[:1], body
+
+    @property
+    def index(self) -> Tuple[array, array]:
+        """(offset, trail count) columns of the blocks"""
+        if self._index is None:
+            self.fileobj.seek(-12, 2)
+            trailer = self.fileobj.read(12)
+            if trailer[8:] != MAGIC:
+                raise CodecError("no index, the stream wasn't closed")
+            self.fileobj.seek(_u64.unpack_from(trailer)[0])
+            kind, body = self._read_record()
+            if kind != INDEX:
+                raise CodecError("bad index offset")
+            (count,) = _u32.unpack_from(body, 0)
+            offsets, position = decode_column(body, _u32.size, count)
+            trails, _ = decode_column(body, position, count)
+            self._index = (offsets, trails)
+        return self._index
+
+    @property
+    def block_count(self) -> int:
+        return len(self.index[0])
+
+    def read_block(self, number: int) -> List[Trail]:
+        """Trails of block `number`"""
+        offsets, _ = self.index
+        self.fileobj.seek(offsets[number])
+        kind, body = self._read_record()
+        if kind != BLOCK:
+            raise CodecError("bad block offset")
+        return decode_block(body)
+
+    @property
+    def trail_count(self) -> int:
+        # not __len__, list() would seek to the index for a length hint
+        return sum(self.index[1])
+
+
+def dump_trails(trails: Iterable[Trail], fileobj: BinaryIO, block_size: int = 1024):
+    with TrailWriter(fileobj, block_size) as writer:
+        writer.write_many(trails)
+
+
+def load_trails(fileobj: BinaryIO) -> Iterator[Trail]:
+    return iter(TrailReader(fileobj))
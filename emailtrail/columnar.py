@@ -0,0 +1,125 @@
+from array import array
+from typing import Iterable, Iterator, List
+
+from .models import Hop, Trail
+
+# stands for a timestamp of None in the int64 columns
+MISSING_TIMESTAMP = -(2**63)
+
+
+class StringTable:
+    """Stores each distinct string once, columns refer to them by index"""
+
+    def __init__(self, values: Iterable[str] = ()):
+        self.values = []
+        self._indexes = {}
+        for value in values:
+            self.index(value)
+
+    def index(self, value: str) -> int:
+        index = self._indexes.get(value)
+        if index is None:
+            index = self._indexes[value] = len(self.values)
+            self.values.append(value)
+        return index
+
+    def __getitem__(self, index: int) -> str:
+        return self.values[index]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class TrailBatch:
+    """
+    Columnar container for many trails.
+    Hops are stored as parallel arrays: int64 timestamps and delays, and indexes into string
+    tables for hosts and protocols. Trail `i` owns hops `hop_offsets[i]` to `hop_offsets[i + 1]`.
+    """
+
+    def __init__(self):
+        self.hosts = StringTable()
+        self.protocols = StringTable()
+        self.addresses = StringTable()
+
+        self.timestamps = array("q")
+        self.delays = array("q")
+        self.from_hosts = array("i")
+        self.received_by_hosts = array("i")
+        self.hop_protocols = array("i")
+
+        self.hop_offsets = array("q", [0])
+        self.to_addresses = array("i")
+        self.from_addresses = array("i")
+        self.ccs = array("i")
+        self.bccs = array("i")
+        self.truncated = array("b")
+
+    @classmethod
+    def from_trails(cls, trails: Iterable[Trail]) -> "TrailBatch":
+        batch = cls()
+        batch.extend(trails)
+        return batch
+
+    def append(self, trail: Trail) -> None:
+        for hop in trail.hops:
+            self.timestamps.append(
+                MISSING_TIMESTAMP if hop.timestamp is None else hop.timestamp
+            )
+            self.delays.append(hop.delay)
+            self.from_hosts.append(self.hosts.index(hop.from_host))
+            self.received_by_hosts.append(self.hosts.index(hop.received_by_host))
+            self.hop_protocols.append(self.protocols.index(hop.protocol))
+        self.hop_offsets.append(len(self.timestamps))
+
+        self.to_addresses.append(self.addresses.index(trail.to_address))
+        self.from_addresses.append(self.addresses.index(trail.from_address))
+        self.ccs.append(self.addresses.index(trail.cc))
+        self.bccs.append(self.addresses.index(trail.bcc))
+        self.truncated.append(trail.truncated)
+
+    def extend(self, trails: Iterable[Trail]) -> None:
+        for trail in trails:
+            self.append(trail)
+
+    def hop(self, index: int) -> Hop:
+        timestamp = self.timestamps[index]
+        return Hop(
+            from_host=self.hosts[self.from_hosts[index]],
+            protocol=self.protocols[self.hop_protocols[index]],
+            received_by_host=self.hosts[self.received_by_hosts[index]],
+            timestamp=None if timestamp == MISSING_TIMESTAMP else timestamp,
+            delay=self.delays[index],
+        )
+
+    def hops(self, index: int) -> List[Hop]:
+        """Hops of trail `index`"""
+        start, end = self.hop_offsets[index], self.hop_offsets[index + 1]
+        return [self.hop(hop_index) for hop_index in range(start, end)]
+
+    def __getitem__(self, index: int) -> Trail:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("trail index out of range")
+        return Trail(
+            to_address=self.addresses[self.to_addresses[index]],
+            from_address=self.addresses[self.from_addresses[index]],
+            cc=self.addresses[self.ccs[index]],
+            bcc=self.addresses[self.bccs[index]],
+            hops=self.hops(index),
+            truncated=bool(self.truncated[index]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.to_addresses)
+
+    def __iter__(self) -> Iterator[Trail]:
+        return (self[index] for index in range(len(self)))
+
+    def to_trails(self) -> List[Trail]:
+        return list(self)
+
+    @property
+    def hop_count(self) -> int:
+        return len(self.timestamps)
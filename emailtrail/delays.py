@@ -0,0 +1,102 @@
+"""
+Delays of a whole `TrailBatch` at once.
+
+Same delays as `hops_with_delay_information` gives hop by hop, plus what it throws away:
+the raw signed difference between consecutive timestamps, and which hops have a negative one
+(the receiving server's clock is behind the previous one's).
+Uses NumPy when it's installed, plain arrays otherwise.
+"""
+
+from array import array
+from dataclasses import dataclass
+from typing import Optional
+
+from .columnar import MISSING_TIMESTAMP
+from .models import slotted
+
+
+@slotted
+@dataclass
+class BatchDelays:
+    """
+    Per hop and per trail columns of a batch, NumPy arrays or `array.array`s.
+    delays: delay of each hop, negative ones clamped to 0 (the `Hop.delay` values)
+    raw_delays: signed difference from the previous hop's timestamp, 0 where `known` is false
+    known: whether the hop and the one before it both have a timestamp
+    skewed: whether the raw delay is negative, i.e. clock skew
+    total_delays: sum of the delays of each trail (`Trail.total_delay`)
+    """
+
+    delays: object
+    raw_delays: object
+    known: object
+    skewed: object
+    total_delays: object
+
+
+def compute_delays(batch, use_numpy: Optional[bool] = None) -> BatchDelays:
+    """
+    Delays of every hop and trail of `batch` (a `TrailBatch`), in one pass over its columns.
+    use_numpy: None to use it if it's installed, True to require it, False not to.
+    """
+    numpy = None
+    if use_numpy or use_numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            if use_numpy:
+                raise
+    if numpy is None:
+        return python_delays(batch.timestamps, batch.hop_offsets)
+    return numpy_delays(numpy, batch.timestamps, batch.hop_offsets)
+
+
+def numpy_delays(numpy, timestamps, hop_offsets) -> BatchDelays:
+    timestamps = numpy.asarray(timestamps, dtype=numpy.int64)
+    offsets = numpy.asarray(hop_offsets, dtype=numpy.int64)
+    count = len(timestamps)
+
+    has_timestamp = timestamps != MISSING_TIMESTAMP
+    known = numpy.zeros(count, dtype=bool)
+    known[1:] = has_timestamp[1:] & has_timestamp[:-1]
+    # the first hop of a trail has nothing before it. Empty trails start where the next one does
+    starts = offsets[:-1]
+    known[starts[starts < count]] = False
+
+    raw_delays = numpy.zeros(count, dtype=numpy.int64)
+    numpy.subtract(timestamps[1:], timestamps[:-1], out=raw_delays[1:], where=known[1:])
+    skewed = raw_delays < 0
+    delays = numpy.maximum(raw_delays, 0)
+
+    running = numpy.zeros(count + 1, dtype=numpy.int64)
+    numpy.cumsum(delays, out=running[1:])
+    total_delays = running[offsets[1:]] - running[starts]
+    return BatchDelays(delays, raw_delays, known, skewed, total_delays)
+
+
+def python_delays(timestamps, hop_offsets) -> BatchDelays:
+    count = len(timestamps)
+    delays = array("q", bytes(8 * count))
+    raw_delays = array("q", bytes(8 * count))
+    known = array("b", bytes(count))
+    skewed = array("b", bytes(count))
+    total_delays = array("q")
+
+    for trail in range(len(hop_offsets) - 1):
+        start, end = hop_offsets[trail], hop_offsets[trail + 1]
+        total = 0
+        previous = MISSING_TIMESTAMP
+        for index in range(start, end):
+            timestamp = timestamps[index]
+            if timestamp != MISSING_TIMESTAMP and previous != MISSING_TIMESTAMP:
+                raw = timestamp - previous
+                known[index] = 1
+                raw_delays[index] = raw
+                if raw < 0:
+                    skewed[index] = 1
+                else:
+                    delays[index] = raw
+                    total += raw
+            previous = timestamp
+        total_delays.append(total)
+    return BatchDelays(delays, raw_delays, known, skewed, total_delays)
@@ -0,0 +1,223 @@
+"""
+Follows a maildir (or a spool directory of message files) and analyses new messages as they arrive.
+
+    follower = Follower("/var/mail/inbound", "/var/lib/emailtrail/checkpoint.json")
+    for batch in follower.follow(interval=1.0):
+        for path, trail in batch:
+            ...
+    follower.metrics()  # throughput, lag ...
+
+Directories are polled: a message is new if its mtime is past the watermark, the newest mtime
+analysed so far. Deliveries can land with an mtime a little older than messages already seen,
+so files within `grace` seconds of the watermark are compared by inode and mtime too. Moving a
+message from new/ to cur/ keeps both, it isn't analysed again. A message delivered after one was
+deleted can get its inode, but not its mtime as well.
+The watermark and the (inode, mtime) pairs in the grace window are the checkpoint, saved atomically after
+each batch has been handled: after a restart the follower carries on from there.
+Messages landing with an mtime older than the grace window are missed.
+"""
+
+import json
+import os
+from time import monotonic, sleep, time
+from typing import Iterator, List, Optional, Tuple
+
+from .batch import Result, analyse_chunks, iter_chunks, worker_pool
+from .sources import read_header_block
+
+MAILDIR_FOLDERS = ("new", "cur")
+
+
+class Follower:
+    """
+    path: a maildir (with new/ and cur/ folders) or a directory of message files
+    checkpoint: file the progress is saved to, None to keep it in memory only
+    batch_size: messages analysed, and handed out, at a time
+    grace: seconds before the watermark that new messages can still turn up in
+    workers: processes the messages are analysed on, this process with 1
+    """
+
+    def __init__(
+        self,
+        path: str,
+        checkpoint: Optional[str] = None,
+        batch_size: int = 256,
+        grace: float = 5.0,
+        workers: int = 1,
+        chunksize: int = 64,
+    ):
+        self.path = path
+        self.checkpoint_path = checkpoint
+        self.batch_size = batch_size
+        self.grace = grace
+        self.workers = workers
+        self.chunksize = chunksize
+
+        self.watermark = 0.0
+        # (inode, mtime) of the messages analysed within `grace` of the watermark
+        self.recent = set()
+        # directory -> mtime_ns when it was last scanned
+        self._scanned = {}
+
+        self.messages = 0
+        self.errors = 0
+        self.batches = 0
+        self.backlog = 0
+        self.lag = 0.0
+        self.started = monotonic()
+        self.busy = 0.0
+        self.load_checkpoint()
+
+    def follow(
+        self, interval: float = 1.0, stop=lambda: False
+    ) -> Iterator[List[Tuple[str, Result]]]:
+        """
+        Yields batches of `(path, trail or exception)` as messages arrive, polling every
+        `interval` seconds while there's nothing new, until `stop()` is true.
+        A batch is checkpointed once the next one is asked for: if handling it fails,
+        it's handed out again after a restart.
+        """
+        with worker_pool(self.workers) as pool:
+            while not stop():
+                batch = self.poll(pool)
+                if not batch:
+                    sleep(interval)
+                    continue
+                yield batch
+                self.save_checkpoint()
+
+    def poll(self, pool=None) -> List[Tuple[str, Result]]:
+        """Analyses up to `batch_size` new messages, without saving the checkpoint"""
+        new = self.new_messages()
+        self.backlog = max(len(new) - self.batch_size, 0)
+        new = new[: self.batch_size]
+        if not new:
+            return []
+
+        started = monotonic()
+        results = self.analyse([path for _, _, path in new], pool)
+
+        for mtime, inode, path in new:
+            self.recent.add((inode, mtime))
+            self.watermark = max(self.watermark, mtime)
+        self.recent = {
+            (inode, mtime)
+            for inode, mtime in self.recent
+            if mtime >= self.watermark - self.grace
+        }
+
+        self.messages += len(new)
+        self.errors += sum(isinstance(result, Exception) for result in results)
+        self.batches += 1
+        self.busy += monotonic() - started
+        self.lag = max(time() - self.watermark, 0.0)
+        return [(path, result) for (_, _, path), result in zip(new, results)]
+
+    def analyse(self, paths: List[str], pool) -> List[Result]:
+        """Trails of the message files, or the exception reading or analysing them"""
+        results = [None] * len(paths)
+        readable = []
+        raw_messages = []
+        for index, path in enumerate(paths):
+            try:
+                raw_messages.append(read_header_block(path))
+                readable.append(index)
+            except OSError as error:
+                results[index] = error
+
+        chunks = iter_chunks(raw_messages, self.chunksize)
+        for position, result in analyse_chunks(pool, self.workers, chunks, False):
+            results[readable[position]] = result
+        return results
+
+    def new_messages(self) -> List[Tuple[float, int, str]]:
+        """(mtime, inode, path) of the messages not analysed yet, oldest first"""
+        since = self.watermark - self.grace
+        new = []
+        listed = set()
+        for directory in self.directories():
+            if self.unchanged(directory, since):
+                continue
+            for mtime, inode, path in scan_directory(directory, since):
+                key = (inode, mtime)
+                if key in self.recent or key in listed:
+                    # analysed, or moved from new/ to cur/ while listing
+                    continue
+                listed.add(key)
+                new.append((mtime, inode, path))
+        new.sort()
+        return new
+
+    def unchanged(self, directory: str, since: float) -> bool:
+        """Whether nothing was added to `directory` since it was last scanned"""
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return True
+        previous, self._scanned[directory] = self._scanned.get(directory), mtime
+        # a backlog is left in directories that haven't changed
+        return previous == mtime and mtime / 1e9 < since and not self.backlog
+
+    def directories(self) -> List[str]:
+        folders = [os.path.join(self.path, folder) for folder in MAILDIR_FOLDERS]
+        if any(os.path.isdir(folder) for folder in folders):
+            return folders
+        return [self.path]
+
+    def metrics(self) -> dict:
+        """
+        messages, errors, batches: totals since the follower started
+        backlog: new messages left over by the last poll
+        lag_seconds: age of the newest message analysed, when it was analysed
+        messages_per_second: over the time spent analysing, and over the whole run
+        """
+        elapsed = monotonic() - self.started
+        return {
+            "messages": self.messages,
+            "errors": self.errors,
+            "batches": self.batches,
+            "backlog": self.backlog,
+            "lag_seconds": self.lag,
+            "messages_per_second": self.messages / self.busy if self.busy else 0.0,
+            "messages_per_second_overall": self.messages / elapsed if elapsed else 0.0,
+            "watermark": self.watermark,
+        }
+
+    def load_checkpoint(self) -> None:
+        if self.checkpoint_path is None or not os.path.exists(self.checkpoint_path):
+            return
+        with open(self.checkpoint_path) as fd:
+            state = json.load(fd)
+        self.watermark = state["watermark"]
+        self.recent = {(inode, mtime) for inode, mtime in state["recent"]}
+
+    def save_checkpoint(self) -> None:
+        """Replaces the checkpoint file in one go, it's never left half written"""
+        if self.checkpoint_path is None:
+            return
+        state = {
+            "path": self.path,
+            "watermark": self.watermark,
+            "recent": [[inode, mtime] for inode, mtime in self.recent],
+        }
+        temporary = self.checkpoint_path + ".tmp"
+        with open(temporary, "w") as fd:
+            json.dump(state, fd)
+            fd.flush()
+            os.fsync(fd.fileno())
+        os.replace(temporary, self.checkpoint_path)
+
+
+def scan_directory(directory: str, since: float) -> Iterator[Tuple[float, int, str]]:
+    """(mtime, inode, path) of the files in `directory` modified since `since`"""
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            try:
+                if not entry.is_file() or entry.name.startswith("."):
+                    continue
+                mtime = entry.stat().st_mtime
+            except OSError:
+                # moved or deleted since it was listed
+                continue
+            if mtime >= since:
+                yield mtime, entry.inode(), entry.path
@@ -0,0 +1,169 @@
+import re
+from collections import namedtuple
+from typing import Dict, List, Tuple, Union
+
+# headers needed to build a trail
+TRAIL_HEADERS = frozenset(["received", "from", "to", "cc", "bcc"])
+
+_Syntax = namedtuple(
+    "_Syntax", ["line", "header", "leading", "trailing", "colon", "folding", "unixfrom"]
+)
+
+# Same line splitting and header line recognition as `email.feedparser`,
+# for text and for raw bytes.
+TEXT_SYNTAX = _Syntax(
+    line=re.compile(r"[^\r\n]*(?:\r\n|\r|\n)?"),
+    header=re.compile(r"From |[\041-\071\073-\176]*:|[\t ]"),
+    leading=re.compile(r"\s*"),
+    trailing=re.compile(r"\s*\Z"),
+    colon=":",
+    folding=(" ", "\t"),
+    unixfrom="From ",
+)
+BYTES_SYNTAX = _Syntax(
+    line=re.compile(rb"[^\r\n]*(?:\r\n|\r|\n)?"),
+    header=re.compile(rb"From |[\041-\071\073-\176]*:|[\t ]"),
+    leading=re.compile(rb"\s*"),
+    trailing=re.compile(rb"\s*\Z"),
+    colon=b":",
+    folding=(b" ", b"\t"),
+    unixfrom=b"From ",
+)
+
+
+class HeaderBlock:
+    """
+    Header values picked out of a message by `scan_headers`.
+    Has the `get`/`get_all` interface of `email.message.Message`, names are case insensitive.
+    """
+
+    def __init__(self, headers: Dict[str, List[str]] = None):
+        self._headers = headers or {}
+
+    def get(self, name: str, failobj=None):
+        values = self._headers.get(name.lower())
+        return values[0] if values else failobj
+
+    def get_all(self, name: str, failobj=None):
+        values = self._headers.get(name.lower())
+        return list(values) if values else failobj
+
+    def __repr__(self):
+        return "HeaderBlock(%r)" % self._headers
+
+
+def scan_headers(raw: Union[str, bytes], names=TRAIL_HEADERS) -> HeaderBlock:
+    """
+    Reads the header block of an email source (str or bytes) without parsing the rest of it.
+    Values are the same as `email.parser.HeaderParser` gives for the stripped source.
+    """
+    return scan_header_block(raw, names=names)[0]
+
+
+def scan_header_block(
+    raw, start: int = 0, end: int = None, names=TRAIL_HEADERS
+) -> Tuple[HeaderBlock, int]:
+    """
+    Scans the header block starting at offset `start` of `raw`, which can be text or any
+    bytes-like object (bytes, mmap ...). Stops at the first line that isn't part of a header,
+    usually the blank line before the body, or at offset `end`. Nothing is copied but the
+    header lines themselves.
+    Only the headers in `names` are collected (and for bytes, decoded).
+    Returns the headers and the offset where the header block ended.
+    """
+    syntax = TEXT_SYNTAX if isinstance(raw, str) else BYTES_SYNTAX
+    collected = {}
+    current = None  # lines of the header being read, None if it isn't wanted
+    if end is None:
+        end = len(raw)
+    position = syntax.leading.match(raw, start, end).end()
+
+    while position < end:
+        line = syntax.line.match(raw, position, end).group()
+        line_start, position = position, position + len(line)
+        if syntax.trailing.match(raw, position, end):
+            # nothing but whitespace follows, like `raw.strip()` drops
+            line = line.rstrip()
+            position = end
+
+        if not syntax.header.match(line):
+            if line.strip():
+                # no blank line before the body, it starts right here
+                position = line_start
+            break
+
+        if line.startswith(syntax.folding):
+            if current is not None:
+                current.append(line)
+        else:
+            current = None
+            name = header_name(line, syntax)
+            if name in names:
+                current = [line]
+                collected.setdefault(name, []).append(current)
+
+    return (
+        HeaderBlock(
+            {
+                name: [header_value(lines) for lines in values]
+                for name, values in collected.items()
+            }
+        ),
+        position,
+    )
+
+
+def message_headers(message, names=TRAIL_HEADERS) -> HeaderBlock:
+    """
+    Header values of an already parsed `email.message.Message` (or `EmailMessage`), as
+    `scan_headers` gives them for its source. Values are read as stored, the policy doesn't
+    parse them again.
+    """
+    collected = {}
+    for name, value in message.raw_items():
+        name = name.lower()
+        if name in names:
+            collected.setdefault(name, []).append(stored_value(value))
+    return HeaderBlock(collected)
+
+
+def stored_value(value) -> str:
+    """A value kept by `email.message.Message`, as it was in the source"""
+    if not isinstance(value, str):
+        # set by a program, e.g. an `email.header.Header`
+        return str(value)
+    try:
+        value.encode("ascii")
+    except UnicodeEncodeError:
+        # parsed from bytes, 8-bit chars are kept as surrogates
+        return decode_header_bytes(value.encode("utf-8", "surrogateescape"))
+    return value
+
+
+def header_name(line, syntax: _Syntax) -> str:
+    """Lowercased name of the header starting on `line`, None if there isn't one"""
+    if line.startswith(syntax.unixfrom):
+        # the mbox "From " line (or a misplaced one) isn't a header
+        return None
+    name_end = line.find(syntax.colon)
+    if name_end <= 0:
+        return None
+    name = line[:name_end].lower()
+    return name if isinstance(name, str) else name.decode("ascii")
+
+
+def header_value(lines: list) -> str:
+    """Joins the source lines of a header into its value, like the compat32 policy does"""
+    source = lines[0][:0].join(lines)
+    if not isinstance(source, str):
+        source = decode_header_bytes(source)
+    value = source.split(":", 1)[1]
+    return value.lstrip(" \t").rstrip("\r\n")
+
+
+def decode_header_bytes(source: bytes) -> str:
+    """Raw 8-bit headers are mostly UTF-8, anything else is kept byte for byte as latin-1"""
+    try:
+        return source.decode("utf-8")
+    except UnicodeDecodeError:
+        return source.decode("latin-1")
@@ -0,0 +1,150 @@
+"""
+Opt-in timing of the analysis stages.
+
+    with profile(slowest=5) as recorded:
+        analyse_headers(source)
+    recorded.summary()        # per stage: calls, total, mean, max, histogram
+    recorded.slowest["analyse_single_header"]  # the 5 slowest Received headers
+
+Stages nest: "analyse_headers" covers "scan_headers", "analyse_hops" and "decode_addresses";
+"analyse_single_header" covers "tokenize" and "timestamp"; "dateparser" is the part of "timestamp"
+spent in the fallback parser. When no profile is active a stage costs one context variable lookup.
+A profile only sees the work done in the thread (or asyncio task) that opened it. Other threads
+record into it once they opt in with `recording(recorded)`. Profiles never see other processes.
+"""
+
+import heapq
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import count
+from threading import Lock
+from time import perf_counter_ns
+from typing import Any, Callable, Dict, List, Tuple
+
+# the profile stages are recorded into, None when instrumentation is off.
+# A context variable: every thread, and every asyncio task, has its own
+active: ContextVar = ContextVar("emailtrail_profile", default=None)
+
+
+class StageStats:
+    """Call count, durations and a histogram of a stage, in nanoseconds"""
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0
+        self.max = 0
+        # bucket `b` counts durations in [2 ** (b - 1), 2 ** b)
+        self.buckets = [0] * 64
+
+    def add(self, elapsed: int) -> None:
+        self.calls += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        self.buckets[min(elapsed.bit_length(), 63)] += 1
+
+    def histogram(self) -> List[Tuple[int, int]]:
+        """(upper bound in ns, count) of the non-empty buckets"""
+        return [(1 << bucket, n) for bucket, n in enumerate(self.buckets) if n]
+
+    def quantile(self, q: float) -> int:
+        """Upper bound (ns) of the bucket holding quantile `q`, within a factor of 2"""
+        rank = q * self.calls
+        seen = 0
+        for bucket, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return 1 << bucket
+        return 0
+
+
+class Profile:
+    """
+    Durations of the stages run while it's active.
+    Keeps the `slowest` inputs of the stages that have one (whole messages, Received headers).
+    `callback(stage, elapsed_ns)` is called for every recorded stage, e.g. to feed a metrics client.
+    """
+
+    def __init__(self, slowest: int = 10, callback: Callable[[str, int], Any] = None):
+        self.stages: Dict[str, StageStats] = {}
+        self.slowest_count = slowest
+        self.callback = callback
+        self._slowest: Dict[str, list] = {}
+        # ties in the heaps are broken by arrival, inputs aren't compared
+        self._order = count()
+        self._lock = Lock()
+
+    def record(self, stage: str, elapsed: int, item: Any = None) -> None:
+        with self._lock:
+            stats = self.stages.get(stage)
+            if stats is None:
+                stats = self.stages[stage] = StageStats()
+            stats.add(elapsed)
+
+            if item is not None and self.slowest_count > 0:
+                heap = self._slowest.setdefault(stage, [])
+                entry = (elapsed, next(self._order), item)
+                if len(heap) < self.slowest_count:
+                    heapq.heappush(heap, entry)
+                elif elapsed > heap[0][0]:
+                    heapq.heapreplace(heap, entry)
+
+        if self.callback is not None:
+            self.callback(stage, elapsed)
+
+    @property
+    def slowest(self) -> Dict[str, List[Tuple[int, Any]]]:
+        """Per stage, (elapsed ns, input) of the slowest inputs, slowest first"""
+        with self._lock:
+            return {
+                stage: [
+                    (elapsed, item) for elapsed, _, item in sorted(heap, reverse=True)
+                ]
+                for stage, heap in self._slowest.items()
+            }
+
+    def summary(self) -> Dict[str, dict]:
+        with self._lock:
+            return {
+                stage: {
+                    "calls": stats.calls,
+                    "total_ms": stats.total / 1e6,
+                    "mean_us": stats.total / stats.calls / 1e3,
+                    "p50_us": stats.quantile(0.5) / 1e3,
+                    "p99_us": stats.quantile(0.99) / 1e3,
+                    "max_us": stats.max / 1e3,
+                    "histogram": stats.histogram(),
+                }
+                for stage, stats in self.stages.items()
+            }
+
+
+@contextmanager
+def profile(slowest: int = 10, callback: Callable[[str, int], Any] = None):
+    """Records the analysis stages run inside the block, in this thread, into a new `Profile`"""
+    with recording(Profile(slowest, callback)) as recorded:
+        yield recorded
+
+
+@contextmanager
+def recording(recorded: Profile):
+    """
+    Records the analysis stages run inside the block, in this thread, into `recorded`.
+    For worker threads to add to the profile another thread opened.
+    """
+    token = active.set(recorded)
+    try:
+        yield recorded
+    finally:
+        active.reset(token)
+
+
+def timed(stage: str, function: Callable, *args, keep_input: bool = False):
+    """`function(*args)`, recorded as `stage` when a profile is active. `keep_input` keeps `args[0]`"""
+    recorder = active.get()
+    if recorder is None:
+        return function(*args)
+    start = perf_counter_ns()
+    result = function(*args)
+    recorder.record(stage, perf_counter_ns() - start, args[0] if keep_input else None)
+    return result
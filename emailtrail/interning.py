@@ -0,0 +1,126 @@
+"""
+Interning of the hostnames, protocols and addresses in trails.
+
+A corpus has a few thousand distinct hosts, protocols and addresses, but every hop and trail
+analysed holds strings of its own. With `set_interning` on, analysis hands out one shared
+object per distinct value instead: trails kept in memory take less of it, and values can be
+compared by identity when grouping. `analyse_many` and `Follower` re-intern the trails their
+worker processes send back, a process can't share objects with another, and `TrailStore`
+interns the trails it loads.
+
+The table is bounded. Once it holds `maxsize` values the overflow policy decides:
+"keep" stops adding values, the ones in the table stay shared and new ones are left as they are,
+"clear" empties the table and starts over, for corpora whose values drift over time.
+"""
+
+from collections import namedtuple
+from threading import Lock
+from typing import Iterable, Optional
+
+from .models import Hop, Trail
+
+OVERFLOW_POLICIES = ("keep", "clear")
+
+InternInfo = namedtuple(
+    "InternInfo", ["hits", "misses", "overflows", "size", "maxsize", "overflow"]
+)
+
+
+class Interner:
+    """
+    Bounded, thread-safe string interning table. A maxsize of 0 disables it, values are
+    then returned as they are.
+    """
+
+    def __init__(self, maxsize: int = 65536, overflow: str = "keep"):
+        self._table = {}
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.overflows = 0
+        self.configure(maxsize, overflow)
+
+    def configure(self, maxsize: int, overflow: str = "keep") -> None:
+        if maxsize < 0:
+            raise ValueError("maxsize must be >= 0")
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(
+                "overflow must be one of %s" % ", ".join(OVERFLOW_POLICIES)
+            )
+        with self._lock:
+            self.maxsize = maxsize
+            self.overflow = overflow
+            if len(self._table) > maxsize:
+                self._table.clear()
+
+    def intern(self, value: Optional[str]) -> Optional[str]:
+        """The shared object equal to `value`, anything but a str is returned as it is"""
+        if not self.maxsize or type(value) is not str:
+            return value
+        with self._lock:
+            shared = self._table.get(value)
+            if shared is not None:
+                self.hits += 1
+                return shared
+            self.misses += 1
+            if len(self._table) >= self.maxsize:
+                self.overflows += 1
+                if self.overflow == "keep":
+                    return value
+                self._table.clear()
+            self._table[value] = value
+            return value
+
+    def intern_hops(self, hops: Iterable[Hop]) -> None:
+        """Interns the strings of `hops` in place"""
+        intern = self.intern
+        for hop in hops:
+            hop.from_host = intern(hop.from_host)
+            hop.protocol = intern(hop.protocol)
+            hop.received_by_host = intern(hop.received_by_host)
+
+    def intern_trail(self, trail: Trail) -> Trail:
+        """Interns the strings of `trail` and its hops in place, and returns it"""
+        intern = self.intern
+        trail.to_address = intern(trail.to_address)
+        trail.from_address = intern(trail.from_address)
+        trail.cc = intern(trail.cc)
+        trail.bcc = intern(trail.bcc)
+        self.intern_hops(trail.hops)
+        return trail
+
+    def clear(self) -> None:
+        """Drops all values and resets the counters"""
+        with self._lock:
+            self._table.clear()
+            self.hits = self.misses = self.overflows = 0
+
+    def info(self) -> InternInfo:
+        with self._lock:
+            return InternInfo(
+                self.hits,
+                self.misses,
+                self.overflows,
+                len(self._table),
+                self.maxsize,
+                self.overflow,
+            )
+
+    def __contains__(self, value: str) -> bool:
+        return value in self._table
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+
+# shared by analysis in all threads, off until `set_interning` is called
+interner = Interner(maxsize=0)
+
+
+def set_interning(maxsize: int = 65536, overflow: str = "keep") -> None:
+    """
+    Turns interning on, or off with a maxsize of 0.
+    overflow: "keep" or "clear", what happens once `maxsize` values are interned
+    """
+    interner.clear()
+    interner.configure(maxsize, overflow)
@@ -0,0 +1,419 @@
+"""
+Sharded analysis jobs, run by any number of workers sharing a directory (NFS, ...).
+
+$ python -m emailtrail.jobs create /shared/job archive.mbox --shard-size 5000
+$ python -m emailtrail.jobs work /shared/job --workers 8       # on as many machines as wanted
+$ python -m emailtrail.jobs status /shared/job
+$ python -m emailtrail.jobs merge /shared/job
+
+`create` reads the corpus once and spools the header blocks of its messages into shards of
+`shard_size` messages, in corpus order, and writes the manifest. Workers claim shards by creating
+lock files (O_EXCL, no outside service), and write the trails of each shard as NDJSON along
+with its aggregates (counts, `RelayAggregator` state). A worker refreshes the lock of the shard it's
+on, a lock left alone for `lease` seconds belongs to a crashed worker and the shard is run again.
+A worker that finds another one's tag in the lock it's refreshing stops running the shard.
+Running a shard twice gives the same files, outputs are replaced atomically. A shard whose
+spool doesn't match the digest in the manifest fails instead.
+`merge` concatenates the outputs in shard order and merges the aggregates.
+"""
+
+import argparse
+import dataclasses
+import json
+import os
+import socket
+import sys
+from hashlib import blake2b
+from time import time
+from typing import List, Optional
+
+from . import __version__
+from .aggregate import RelayAggregator
+from .batch import Result, analyse_chunks, iter_chunks, worker_pool
+from .models import Trail
+from .sources import FORMATS, read_source
+
+MANIFEST = "manifest.json"
+SUMMARY = "summary.json"
+SHARDS = "shards"
+LOCKS = "locks"
+OUTPUT = "output"
+DONE = "done"
+
+
+class LockLost(RuntimeError):
+    """Another worker took over the lock of the shard being run"""
+
+
+def create_job(
+    job_dir: str, source: str, format: str = None, shard_size: int = 1000
+) -> dict:
+    """Spools the messages of `source` (see `read_source`) into shards and writes the manifest"""
+    if shard_size < 1:
+        raise ValueError("shard_size must be >= 1")
+    if os.path.exists(os.path.join(job_dir, MANIFEST)):
+        raise FileExistsError("a job already exists in %s" % job_dir)
+    for folder in (SHARDS, LOCKS, OUTPUT, DONE):
+        os.makedirs(os.path.join(job_dir, folder), exist_ok=True)
+
+    shards = []
+    for number, (start, records) in enumerate(
+        iter_chunks(read_source(source, format), shard_size)
+    ):
+        shard = "%05d" % number
+        digest = blake2b(digest_size=16)
+        with open(shard_path(job_dir, shard), "w", encoding="utf-8") as fd:
+            for key, raw in records:
+                line = json.dumps(spooled(key, raw)) + "\n"
+                digest.update(line.encode("utf-8"))
+                fd.write(line)
+        shards.append(
+            {
+                "id": shard,
+                "start": start,
+                "messages": len(records),
+                "digest": digest.hexdigest(),
+            }
+        )
+
+    manifest = {
+        "version": __version__,
+        "source": os.path.abspath(source),
+        "format": format,
+        "shard_size": shard_size,
+        "messages": sum(shard["messages"] for shard in shards),
+        "shards": shards,
+    }
+    write_atomically(os.path.join(job_dir, MANIFEST), json.dumps(manifest, indent=1))
+    return manifest
+
+
+def spooled(key, raw) -> dict:
+    if isinstance(raw, str):
+        return {"key": key, "source": raw}
+    # raw 8-bit bytes are kept byte for byte
+    return {"key": key, "bytes": bytes(raw).decode("utf-8", "surrogateescape")}
+
+
+def unspooled(record: dict):
+    if "source" in record:
+        return record["source"]
+    return record["bytes"].encode("utf-8", "surrogateescape")
+
+
+def load_manifest(job_dir: str) -> dict:
+    with open(os.path.join(job_dir, MANIFEST)) as fd:
+        return json.load(fd)
+
+
+def run_worker(
+    job_dir: str,
+    workers: int = None,
+    chunksize: int = 64,
+    lease: float = 600,
+    max_shards: Optional[int] = None,
+) -> List[str]:
+    """
+    Claims and runs shards until none is left (or `max_shards` are done).
+    workers: processes analysing a shard, the CPU count by default
+    lease: seconds after which the lock of a shard nobody refreshed can be taken over
+    Returns the shards this worker ran.
+    """
+    manifest = load_manifest(job_dir)
+    workers = workers or os.cpu_count() or 1
+    ran = []
+    with worker_pool(workers) as pool:
+        for shard in manifest["shards"]:
+            if max_shards is not None and len(ran) >= max_shards:
+                break
+            if is_done(job_dir, shard["id"]) or not claim(job_dir, shard["id"], lease):
+                continue
+            try:
+                if not is_done(job_dir, shard["id"]):
+                    run_shard(job_dir, shard, pool, workers, chunksize)
+                    ran.append(shard["id"])
+            except LockLost:
+                # the worker that took it over runs it
+                pass
+            finally:
+                release(job_dir, shard["id"])
+    return ran
+
+
+def run_shard(job_dir: str, shard: dict, pool, workers: int, chunksize: int) -> None:
+    """
+    Analyses a shard, and writes its output and aggregates.
+    Raises LockLost if another worker takes the shard over meanwhile, and RuntimeError if its
+    spool doesn't match the manifest.
+    """
+    shard_id = shard["id"]
+    keys = []
+    digest = blake2b(digest_size=16)
+
+    def raw_messages():
+        with open(shard_path(job_dir, shard_id), encoding="utf-8") as fd:
+            for line in fd:
+                digest.update(line.encode("utf-8"))
+                record = json.loads(line)
+                keys.append(record["key"])
+                yield unspooled(record)
+
+    def refreshed(chunks):
+        for chunk in chunks:
+            if not refresh_lock(job_dir, shard_id):
+                raise LockLost(shard_id)
+            yield chunk
+
+    aggregator = RelayAggregator()
+    counts = {"messages": 0, "errors": 0, "hops": 0, "unparsed_timestamps": 0}
+    output = os.path.join(job_dir, OUTPUT, shard_id + ".ndjson")
+    temporary = "%s.%s.tmp" % (output, owner_tag())
+    chunks = refreshed(iter_chunks(raw_messages(), chunksize))
+    try:
+        with open(temporary, "w", encoding="utf-8") as out:
+            for index, result in analyse_chunks(pool, workers, chunks, True):
+                out.write(json.dumps(result_record(keys[index], result)) + "\n")
+                count_result(counts, aggregator, result)
+            out.flush()
+            os.fsync(out.fileno())
+        if digest.hexdigest() != shard["digest"]:
+            raise RuntimeError("shard %s doesn't match the manifest" % shard_id)
+    except RuntimeError:
+        # lost the lock, or the spool changed
+        os.remove(temporary)
+        raise
+    os.replace(temporary, output)
+
+    done = dict(counts, shard=shard_id, aggregate=aggregator.to_dict())
+    write_atomically(done_path(job_dir, shard_id), json.dumps(done))
+
+
+def result_record(key, result: Result) -> dict:
+    if isinstance(result, Trail):
+        return {"key": key, "trail": dataclasses.asdict(result)}
+    return {"key": key, "error": repr(result)}
+
+
+def count_result(counts: dict, aggregator: RelayAggregator, result: Result) -> None:
+    counts["messages"] += 1
+    if not isinstance(result, Trail):
+        counts["errors"] += 1
+        return
+    counts["hops"] += len(result.hops)
+    counts["unparsed_timestamps"] += sum(hop.timestamp is None for hop in result.hops)
+    aggregator.add(result)
+
+
+def claim(job_dir: str, shard_id: str, lease: float) -> bool:
+    """Takes the lock of a shard, or over a stale one. False if another worker holds it"""
+    path = lock_path(job_dir, shard_id)
+    try:
+        lock = os.stat(path)
+        if time() - lock.st_mtime > lease:
+            # its worker crashed
+            remove_stale_lock(path, lock)
+    except FileNotFoundError:
+        pass
+    try:
+        descriptor = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(descriptor, "w") as fd:
+        json.dump({"owner": owner_tag(), "claimed": time()}, fd)
+    # a worker removing a stale lock can have removed this one instead, and a third one
+    # taken the shard
+    return owns_lock(job_dir, shard_id)
+
+
+def remove_stale_lock(path: str, lock: os.stat_result) -> None:
+    """
+    Removes the lock at `path`, if it's still the stale one `lock` is the stat of.
+    Another worker can have found it stale too, and replaced it with its own lock since:
+    what's moved away is checked, and put back if it isn't the stale lock.
+    """
+    moved = "%s.stale.%s" % (path, owner_tag())
+    os.rename(path, moved)
+    try:
+        found = os.stat(moved)
+        if (found.st_ino, found.st_mtime_ns) != (lock.st_ino, lock.st_mtime_ns):
+            # doesn't replace a lock taken meanwhile
+            os.link(moved, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(moved)
+
+
+def owns_lock(job_dir: str, shard_id: str) -> bool:
+    """Whether the lock of a shard has this worker's tag in it"""
+    try:
+        with open(lock_path(job_dir, shard_id)) as fd:
+            return json.load(fd).get("owner") == owner_tag()
+    except (FileNotFoundError, ValueError):
+        return False
+
+
+def refresh_lock(job_dir: str, shard_id: str) -> bool:
+    """Keeps the lock of a shard from going stale, False if it isn't this worker's anymore"""
+    if not owns_lock(job_dir, shard_id):
+        return False
+    try:
+        os.utime(lock_path(job_dir, shard_id))
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def release(job_dir: str, shard_id: str) -> None:
+    """Removes the lock of a shard, unless another worker took it over meanwhile"""
+    if owns_lock(job_dir, shard_id):
+        try:
+            os.remove(lock_path(job_dir, shard_id))
+        except FileNotFoundError:
+            pass
+
+
+def is_done(job_dir: str, shard_id: str) -> bool:
+    return os.path.exists(done_path(job_dir, shard_id))
+
+
+def job_status(job_dir: str, lease: float = 600) -> dict:
+    """Shards done, running (locked and refreshed within `lease`), stale and waiting"""
+    status = {"done": [], "running": [], "stale": [], "waiting": []}
+    for shard in load_manifest(job_dir)["shards"]:
+        shard_id = shard["id"]
+        if is_done(job_dir, shard_id):
+            status["done"].append(shard_id)
+            continue
+        try:
+            locked = os.stat(lock_path(job_dir, shard_id)).st_mtime
+        except FileNotFoundError:
+            status["waiting"].append(shard_id)
+            continue
+        status["running" if time() - locked <= lease else "stale"].append(shard_id)
+    return status
+
+
+def merge_job(job_dir: str, output: str = None) -> dict:
+    """
+    Concatenates the shard outputs in shard order into `output` (OUTPUT.ndjson in the job
+    directory by default) and merges their aggregates into the returned summary, also
+    written to summary.json. Fails if any shard isn't done.
+    """
+    manifest = load_manifest(job_dir)
+    missing = [s["id"] for s in manifest["shards"] if not is_done(job_dir, s["id"])]
+    if missing:
+        raise RuntimeError("shards not done yet: %s" % ", ".join(missing))
+
+    output = output or os.path.join(job_dir, OUTPUT + ".ndjson")
+    aggregator = RelayAggregator()
+    counts = {"messages": 0, "errors": 0, "hops": 0, "unparsed_timestamps": 0}
+    temporary = output + ".tmp"
+    with open(temporary, "wb") as out:
+        for shard in manifest["shards"]:
+            with open(done_path(job_dir, shard["id"])) as fd:
+                done = json.load(fd)
+            for name in counts:
+                counts[name] += done[name]
+            aggregator.merge(RelayAggregator.from_dict(done["aggregate"]))
+            with open(
+                os.path.join(job_dir, OUTPUT, shard["id"] + ".ndjson"), "rb"
+            ) as fd:
+                while True:
+                    block = fd.read(1 << 20)
+                    if not block:
+                        break
+                    out.write(block)
+    os.replace(temporary, output)
+
+    summary = dict(
+        counts,
+        parse_error_rate=(
+            counts["errors"] / counts["messages"] if counts["messages"] else 0.0
+        ),
+        timestamp_failure_rate=(
+            counts["unparsed_timestamps"] / counts["hops"] if counts["hops"] else 0.0
+        ),
+        relays={host: stats.summary() for host, stats in aggregator.relays.items()},
+        edges=[
+            [from_host, by_host, stats.summary()]
+            for (from_host, by_host), stats in aggregator.edges.items()
+        ],
+    )
+    write_atomically(os.path.join(job_dir, SUMMARY), json.dumps(summary, indent=1))
+    return summary
+
+
+def shard_path(job_dir: str, shard_id: str) -> str:
+    return os.path.join(job_dir, SHARDS, shard_id + ".ndjson")
+
+
+def lock_path(job_dir: str, shard_id: str) -> str:
+    return os.path.join(job_dir, LOCKS, shard_id + ".lock")
+
+
+def done_path(job_dir: str, shard_id: str) -> str:
+    return os.path.join(job_dir, DONE, shard_id + ".json")
+
+
+def owner_tag() -> str:
+    return "%s.%d" % (socket.gethostname(), os.getpid())
+
+
+def write_atomically(path: str, text: str) -> None:
+    temporary = "%s.%s.tmp" % (path, owner_tag())
+    with open(temporary, "w", encoding="utf-8") as fd:
+        fd.write(text)
+        fd.flush()
+        os.fsync(fd.fileno())
+    os.replace(temporary, path)
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m emailtrail.jobs")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    create = commands.add_parser("create", help="split a corpus into shards")
+    create.add_argument("job_dir")
+    create.add_argument("source", help="xml export, ndjson file, mbox file or maildir")
+    create.add_argument("--format", choices=FORMATS)
+    create.add_argument("--shard-size", type=int, default=1000)
+
+    work = commands.add_parser("work", help="run shards until none is left")
+    work.add_argument("job_dir")
+    work.add_argument("--workers", "-j", type=int, default=None)
+    work.add_argument("--chunksize", type=int, default=64)
+    work.add_argument("--lease", type=float, default=600)
+
+    status = commands.add_parser("status", help="count shards by state")
+    status.add_argument("job_dir")
+    status.add_argument("--lease", type=float, default=600)
+
+    merge = commands.add_parser("merge", help="combine the outputs of all shards")
+    merge.add_argument("job_dir")
+    merge.add_argument("--output", default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] = None) -> int:
+    args = parse_args(argv)
+    if args.command == "create":
+        manifest = create_job(args.job_dir, args.source, args.format, args.shard_size)
+        print(
+            "%d messages in %d shards" % (manifest["messages"], len(manifest["shards"]))
+        )
+    elif args.command == "work":
+        ran = run_worker(args.job_dir, args.workers, args.chunksize, args.lease)
+        print("ran %d shards" % len(ran))
+    elif args.command == "status":
+        status = job_status(args.job_dir, args.lease)
+        print(json.dumps({state: len(shards) for state, shards in status.items()}))
+        return 0 if len(status["done"]) == sum(map(len, status.values())) else 1
+    elif args.command == "merge":
+        summary = merge_job(args.job_dir, args.output)
+        print("%d messages, %d errors" % (summary["messages"], summary["errors"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+import mmap
+import os
+from typing import Iterator, Tuple
+
+from .headers import scan_header_block
+from .models import Limits, Trail
+from .module import trail_from_headers
+
+SEPARATOR = b"\nFrom "
+
+
+def analyse_mbox(path: str, limits: Limits = None) -> Iterator[Tuple[int, Trail]]:
+    """
+    Analyses every message of an mbox file, yielding `(offset, trail)` pairs where offset
+    is the position of the message's "From " line in the file.
+    The file is memory-mapped: only header lines are copied and decoded, so memory use
+    doesn't grow with the size of the archive or of message bodies.
+    limits: caps on the work done per message, see `analyse_headers`.
+    """
+    with open(path, "rb") as fd:
+        if os.fstat(fd.fileno()).st_size == 0:
+            return
+        with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield from analyse_mapped_mbox(mapped, limits)
+
+
+def analyse_mapped_mbox(mapped, limits: Limits = None) -> Iterator[Tuple[int, Trail]]:
+    """`analyse_mbox` for an mbox already in memory (mmap, bytes ...)"""
+    for start, end in message_spans(mapped):
+        headers, _ = scan_header_block(mapped, start, end)
+        yield start, trail_from_headers(headers, limits)
+
+
+def message_spans(mapped) -> Iterator[Tuple[int, int]]:
+    """(start, end) offsets of the messages of an mbox, found from the "From " lines"""
+    if mapped[:5] == SEPARATOR[1:]:
+        start = 0
+    else:
+        start = mapped.find(SEPARATOR)
+        if start == -1:
+            return
+        start += 1
+
+    size = len(mapped)
+    while start < size:
+        separator = mapped.find(SEPARATOR, start)
+        end = size if separator == -1 else separator + 1
+        yield start, end
+        start = end
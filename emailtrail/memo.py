@@ -0,0 +1,89 @@
+"""
+Memoization of whole hop lists.
+
+Bulk and mailing list messages travel the same relay chain, their Received headers only differ
+in the values of volatile clauses like `id` and `for`. With `set_hops_cache` on, `analyse_hops`
+keys the hop list on a digest of the headers with those values blanked out, and analyses
+a chain like that only once.
+A value is only blanked out if it can't change how the rest of the header is read (a single
+word without keywords, delimiters or comments), and a hop list is only cached if none of the
+blanked values ended up in it.
+"""
+
+import re
+from hashlib import blake2b
+from typing import List, Sequence, Tuple
+
+from .cache import LRUCache
+from .models import Hop
+
+VOLATILE_KEYWORDS = ("id", "for")
+
+# off until `set_hops_cache` is called
+hops_cache = LRUCache(maxsize=0)
+
+# values containing these could be read as part of another clause
+UNSAFE_VALUE = re.compile(r"id|by|from|with|via|[;()\\]")
+PLACEHOLDER = "\x00"
+
+
+def volatile_pattern(keywords: Sequence[str]):
+    alternatives = "|".join(re.escape(keyword) for keyword in keywords)
+    return re.compile(r"(?<!\S)(?:%s)\s+([^\s;]+)" % alternatives)
+
+
+volatile_value = volatile_pattern(VOLATILE_KEYWORDS)
+
+
+def set_hops_cache(
+    maxsize: int = 1024, ttl: float = None, volatile: Sequence[str] = VOLATILE_KEYWORDS
+) -> None:
+    """
+    Turns the hop list cache on, or off with a maxsize of 0.
+    ttl: seconds an entry is kept for, no limit if None
+    volatile: keywords whose values are ignored when comparing headers
+    """
+    global volatile_value
+    volatile_value = volatile_pattern(volatile)
+    hops_cache.clear()
+    hops_cache.resize(maxsize)
+    hops_cache.ttl = ttl
+
+
+def received_key(received: List[str]) -> Tuple[bytes, List[List[str]]]:
+    """
+    Digest of (cleaned up) Received headers with their volatile values blanked out,
+    and the values that were blanked out of each header
+    """
+    digest = blake2b(digest_size=16)
+    blanked = []
+    for header in received:
+        values = []
+
+        def blank(match):
+            value = match.group(1)
+            if UNSAFE_VALUE.search(value):
+                return match.group()
+            values.append(value)
+            return match.group()[: match.start(1) - match.start()] + PLACEHOLDER
+
+        digest.update(
+            volatile_value.sub(blank, header).encode("utf-8", "surrogatepass")
+        )
+        digest.update(b"\xff")  # never in UTF-8, separates the headers
+        blanked.append(values)
+    return digest.digest(), blanked
+
+
+def depends_on_values(hop: Hop, timestring: str, values: List[str]) -> bool:
+    """Whether any of the blanked out `values` was copied into the hop"""
+    fields = (hop.from_host, hop.received_by_host, hop.protocol, timestring or "")
+    return any(value in field for value in values for field in fields)
+
+
+def copy_hops(hops: Sequence[Hop]) -> List[Hop]:
+    """Hops are mutable, every caller gets its own"""
+    return [
+        Hop(hop.from_host, hop.protocol, hop.received_by_host, hop.timestamp, hop.delay)
+        for hop in hops
+    ]
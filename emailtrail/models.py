@@ -1,7 +1,23 @@
-from dataclasses import dataclass
-from typing import List
+from dataclasses import dataclass, fields
+from typing import List, Optional
 
 
+def slotted(cls):
+    """
+    Rebuilds a dataclass with `__slots__` so its instances carry no `__dict__`
+    (`dataclass(slots=True)`, which needs python 3.10).
+    """
+    names = tuple(field.name for field in fields(cls))
+    namespace = dict(cls.__dict__)
+    for name in names + ("__dict__", "__weakref__"):
+        namespace.pop(name, None)
+    namespace["__slots__"] = names
+    slotted_cls = type(cls)(cls.__name__, cls.__bases__, namespace)
+    slotted_cls.__qualname__ = cls.__qualname__
+    return slotted_cls
+
+
+@slotted
 @dataclass
 class Hop:
     from_host: str
@@ -11,6 +27,7 @@ class Hop:
     delay: int = 0  # in seconds
 
 
+@slotted
 @dataclass
 class Trail:
     to_address: str
@@ -18,8 +35,38 @@ class Trail:
     cc: str
     bcc: str
     hops: List[Hop]
+    truncated: bool = False  # hops are missing because of `Limits`
 
     @property
     def total_delay(self) -> int:
         """in seconds"""
         return sum([hop.delay for hop in self.hops]) if self.hops else 0
+
+
+@slotted
+@dataclass
+class ReceivedClauses:
+    """The parts of a single `Received` header"""
+
+    from_host: str
+    received_by_host: str
+    protocol: str
+    id: str
+    recipient: str
+    timestring: Optional[str]
+
+
+@slotted
+@dataclass
+class Limits:
+    """
+    Caps on the work done analysing one message, `None` turns a cap off.
+    max_header_length: longer Received headers are cut to this many chars
+    max_received: Received headers analysed, the oldest ones past this are dropped
+    time_budget: seconds, once spent the remaining (older) Received headers are skipped
+    A trail missing anything because of a limit is marked `truncated`.
+    """
+
+    max_header_length: Optional[int] = 8192
+    max_received: Optional[int] = 100
+    time_budget: Optional[float] = None
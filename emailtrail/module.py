@@ -1,18 +1,36 @@
-from email.parser import HeaderParser
 import re
-import calendar
-import dateparser
-import pytz
-from typing import List
-
+from bisect import bisect_left
+from time import perf_counter
+from typing import List, Optional, Tuple, Union
+
+from . import memo, templates
+from .headers import message_headers, scan_headers
+from .instrument import timed
+from .interning import interner
 from .utils import cleanup_text, decode_and_convert_to_unicode
-from .models import Trail, Hop
+from .models import Trail, Hop, Limits, ReceivedClauses
+from .timestamps import resolve_timestamp, timestamp_cache
+
+FROM_LABEL = re.compile(r"from\s+(\S*)")
+# comments in parentheses, on a single line. See `remove_details`
+DETAILS = re.compile(r"([(].*?[)])")
+# only tried where a whitespace run starts, which doesn't change the matches but
+# saves retrying from every char of a long run
+ID_SEPARATOR = re.compile(r"(?<!\s)\s+id\s+[^\s]*\s+")
+TIMEZONE_NAME = re.compile(
+    r"([+]|[-])([0-9]{4})[ ]([(]([a-zA-Z]{3,4})[)]|([a-zA-Z]{3,4}))"
+)
+PROTOCOL_KEYWORDS = ("with", "via", "id")
 
+# used when no `Limits` are given
+DEFAULT_LIMITS = Limits()
 
-def analyse_headers(raw_headers: str) -> Trail:
+
+def analyse_headers(raw_headers: Union[str, bytes], limits: Limits = None) -> Trail:
     """
     raw_headers: plain email source, or just headers text. e.g text value of "show original" in
-    gmail.
+    gmail. Can be str or bytes, only the header block is read.
+    limits: caps on the work done for the message, `DEFAULT_LIMITS` if not given.
     sample output:
     Trail(
     to_address='money@capitalism.com;',
@@ -38,52 +56,335 @@ def analyse_headers(raw_headers: str) -> Trail:
         timestamp=1507623422,
         delay=0
         )
-    ])
+    ],
+    truncated=False)
     """
     if raw_headers is None:
         raise TypeError("empty headers")
-    raw_headers = raw_headers.strip()
-    parser = HeaderParser()
-    headers = parser.parsestr(raw_headers)
-    received_headers = headers.get_all("Received")
+    if not isinstance(raw_headers, (str, bytes, bytearray)):
+        raise TypeError("headers must be str or bytes")
+
+    return timed(
+        "analyse_headers", analyse_raw_headers, raw_headers, limits, keep_input=True
+    )
+
+
+def analyse_message(message, limits: Limits = None) -> Trail:
+    """
+    `analyse_headers` for a message already parsed with `email` or `mailbox`
+    (`email.message.Message`, `EmailMessage`, `mailbox.mboxMessage` ...).
+    Reads its headers as they are, without turning it back into text.
+    """
+    return timed(
+        "analyse_headers", analyse_parsed_message, message, limits, keep_input=True
+    )
+
+
+def analyse_parsed_message(message, limits: Limits = None) -> Trail:
+    headers = timed("scan_headers", message_headers, message)
+    return trail_from_headers(headers, limits)
 
-    trail = analyse_hops(received_headers)
+
+def analyse_raw_headers(raw_headers: Union[str, bytes], limits: Limits = None) -> Trail:
+    return trail_from_headers(timed("scan_headers", scan_headers, raw_headers), limits)
+
+
+def trail_from_headers(headers, limits: Limits = None) -> Trail:
+    """
+    Builds the trail from parsed headers, anything with the `get`/`get_all` interface of
+    `email.message.Message`
+    """
+    trail, truncated = limited_hops(headers.get_all("Received"), limits)
+    from_address, to_address, cc, bcc = timed(
+        "decode_addresses", decode_addresses, headers
+    )
 
     return Trail(
-        from_address=decode_and_convert_to_unicode(headers.get("From")),
-        to_address=decode_and_convert_to_unicode(headers.get("To")),
-        cc=decode_and_convert_to_unicode(headers.get("Cc")),
-        bcc=decode_and_convert_to_unicode(headers.get("Bcc")),
+        from_address=from_address,
+        to_address=to_address,
+        cc=cc,
+        bcc=bcc,
         hops=trail,
+        truncated=truncated,
+    )
+
+
+def decode_addresses(headers) -> tuple:
+    """Decoded From, To, Cc and Bcc values"""
+    return tuple(
+        interner.intern(decode_and_convert_to_unicode(headers.get(name)))
+        for name in ("From", "To", "Cc", "Bcc")
     )
 
 
-def analyse_hops(received: str) -> List[Hop]:
+def analyse_hops(received: str, limits: Limits = None) -> List[Hop]:
     """
     Takes a list of `received` headers and
     creates the email trail (structured information of hops in transit)
     """
-    if received is None:
-        return []
+    return limited_hops(received, limits)[0]
 
-    received = [cleanup_text(header) for header in received]
-    hops = [analyse_single_header(header) for header in received]
+
+def limited_hops(received: List[str], limits: Limits = None) -> Tuple[List[Hop], bool]:
+    """`analyse_hops`, and whether `limits` left any hops out"""
+    if received is None:
+        return [], False
+
+    return timed("analyse_hops", build_hops, received, limits or DEFAULT_LIMITS)
+
+
+def build_hops(received: List[str], limits: Limits) -> Tuple[List[Hop], bool]:
+    received, truncated = limited_received(received, limits)
+
+    caching = memo.hops_cache.maxsize > 0
+    if caching:
+        key, blanked = memo.received_key(received)
+        cached = memo.hops_cache.get(key)
+        if cached is not None:
+            return memo.copy_hops(cached), truncated
+
+    hops, out_of_time = hops_within_budget(received, limits.time_budget)
+    if caching and not out_of_time and cacheable(hops, received, blanked):
+        memo.hops_cache.put(key, tuple(memo.copy_hops(hops)))
+    return hops, truncated or out_of_time
+
+
+def limited_received(received: List[str], limits: Limits) -> Tuple[List[str], bool]:
+    """Cleaned up headers, cut down to `limits`, and whether anything was cut"""
+    truncated = False
+    if limits.max_received is not None and len(received) > limits.max_received:
+        received = received[: limits.max_received]
+        truncated = True
+
+    max_length = limits.max_header_length
+    if max_length is not None and any(len(header) > max_length for header in received):
+        received = [header[:max_length] for header in received]
+        truncated = True
+
+    return [
+        timed("cleanup_text", cleanup_text, header) for header in received
+    ], truncated
+
+
+def hops_within_budget(
+    received: List[str], time_budget: float
+) -> Tuple[List[Hop], bool]:
+    """Hops in chronological order, and whether the time budget ran out before the last one"""
+    if time_budget is not None:
+        deadline = perf_counter() + time_budget
+
+    hops = []
+    for header in received:
+        if time_budget is not None and perf_counter() > deadline:
+            break
+        hops.append(
+            timed(
+                "analyse_single_header", analyse_single_header, header, keep_input=True
+            )
+        )
+    out_of_time = len(hops) < len(received)
 
     # sort in chronological order
     hops.reverse()
-    return hops_with_delay_information(hops)
+    return hops_with_delay_information(hops), out_of_time
+
+
+def cacheable(hops: List[Hop], received: List[str], blanked: List[List[str]]) -> bool:
+    """Whether `hops` would be the same for any value of the parts `memo.received_key` blanked out"""
+    for hop, header, values in zip(reversed(hops), received, blanked):
+        if values:
+            timestring = find_timestring(cleanup_text(header))
+            if memo.depends_on_values(hop, timestring, values):
+                return False
+    return True
 
 
 def analyse_single_header(header: str) -> Hop:
     """Parses the details associated with the hop into a structured format"""
+    clauses = timed("tokenize", tokenize_with_templates, header)
+    intern = interner.intern
     return Hop(
-        from_host=extract_from_label(header),
-        received_by_host=extract_received_by_label(header),
-        protocol=extract_protocol(header),
-        timestamp=extract_timestamp(header),
+        from_host=intern(clauses.from_host),
+        received_by_host=intern(clauses.received_by_host),
+        protocol=intern(clauses.protocol),
+        timestamp=timed("timestamp", get_timestamp, clauses.timestring),
+    )
+
+
+def tokenize_with_templates(header: str) -> ReceivedClauses:
+    """`tokenize_received_header`, through the learned templates when they're on"""
+    if templates.template_cache.maxsize:
+        fields = templates.extract(header, tokenize_received_header)
+        if fields is not None:
+            return ReceivedClauses(
+                *fields, timestring=find_timestring(cleanup_text(header))
+            )
+    return tokenize_received_header(header)
+
+
+def tokenize_received_header(header: str) -> ReceivedClauses:
+    """
+    Splits a `Received` header into its clauses in a single walk over its words.
+    Gives the same hosts, protocol and timestring as the `extract_*` functions.
+    """
+    text = cleanup_text(remove_details(header.replace("\n", " ")))
+    words = text.split()
+
+    received_by_host = protocol = ""
+    keyword = "from" if text.startswith("from") else "by"
+    start = clause_start(text, keyword) if text.startswith(keyword) else None
+    if start == 0:
+        received_by_host, protocol = walk_received_words(text, words)
+    elif start is not None:
+        # irregular header, e.g. "fromage from ...", the clause starts further on
+        clause = text[start:]
+        received_by_host, protocol = walk_received_words(clause, clause.split())
+    if keyword == "from" and start is not None and "\n" in text:
+        # literal newlines left by cleanup, a `by` host can't span lines
+        received_by_host = received_by_across_lines(text, words, start)
+
+    match = FROM_LABEL.search(header)
+    return ReceivedClauses(
+        from_host=match.group(1) if match else "",
+        received_by_host=received_by_host,
+        protocol=protocol,
+        id=word_after(words, "id"),
+        recipient=word_after(words, "for").rstrip(";"),
+        timestring=timed("timestring", find_timestring, cleanup_text(header)),
     )
 
 
+def clause_start(text: str, keyword: str) -> Optional[int]:
+    """Offset of the first `keyword` followed by whitespace, where the legacy regexes start matching"""
+    position = text.find(keyword)
+    while position != -1:
+        following = position + len(keyword)
+        if following < len(text) and text[following].isspace():
+            return position
+        position = text.find(keyword, following)
+    return None
+
+
+def walk_received_words(text: str, words: List[str]) -> tuple:
+    """
+    Finds the `by` host and the `with`/`via` protocol of a header starting with `from` or `by`.
+    `text` is the header without details, `words` is `text.split()`.
+    The order in which candidate words are tried mirrors the backtracking of the
+    regular expressions in `extract_received_by_label` and `extract_protocol`,
+    without their quadratic worst case.
+    """
+    offsets = WordOffsets(text, words)
+
+    def wide_gap(index):
+        # two or more whitespace chars between words[index - 1] and words[index]
+        previous_end = offsets[index - 1] + len(words[index - 1])
+        return not text.startswith(words[index], previous_end + 1)
+
+    if words[0] == "from":
+        by_candidates = [i for i in range(2, len(words)) if words[i] == "by"]
+        if len(words) > 1 and words[1] == "by" and wide_gap(1):
+            by_candidates.append(1)
+    else:
+        by_candidates = [0]
+
+    received_by_host = ""
+    for i in by_candidates:
+        if i + 1 < len(words):
+            received_by_host = words[i + 1]
+            break
+
+    protocol = ""
+    clauses = [j for j, word in enumerate(words) if word.startswith(PROTOCOL_KEYWORDS)]
+    for i in by_candidates:
+        clause = first_protocol_word(words, i, wide_gap, clauses)
+        if clause is not None:
+            word = words[clause]
+            if not word.startswith("id"):
+                start = offsets[clause] + (3 if word.startswith("via") else 4)
+                ends = [text.find("id", start), text.find(";", start)]
+                end = min([end for end in ends if end != -1], default=len(text))
+                protocol = cleanup_text(text[start:end])
+            break
+
+    return received_by_host, protocol
+
+
+def first_protocol_word(
+    words: List[str], by_index: int, wide_gap, clauses: List[int]
+) -> int:
+    """
+    Index of the first word after the `by` host that starts a with/via/id clause.
+    `clauses` are the indexes of all the words that could start one, in order.
+    """
+    position = bisect_left(clauses, by_index + 2)
+    if position < len(clauses):
+        return clauses[position]
+    j = by_index + 1
+    if j < len(words) and wide_gap(j) and words[j].startswith(PROTOCOL_KEYWORDS):
+        return j
+    return None
+
+
+def received_by_across_lines(text: str, words: List[str], start: int) -> str:
+    """
+    The `by` host of a header starting with `from` that has newlines in it, as
+    `extract_received_by_label` finds it: the words between `from` and `by` must be on one
+    line, and each `from` in `text` is tried in turn from offset `start`. Linear in `text`.
+    """
+    offsets = WordOffsets(text, words)
+    starts = [offsets[i] for i in range(len(words))]
+    # following[i]: the first `by` after word i on its line, or first on the next one
+    following = [None] * len(words)
+    for i in reversed(range(len(words) - 1)):
+        j = i + 1
+        if words[j] == "by":
+            following[i] = j if j + 1 < len(words) else None
+        else:
+            end = starts[i] + len(words[i])
+            if "\n" not in text[end:starts[j]]:
+                following[i] = following[j]
+
+    position = start
+    while position != -1:
+        after = position + len("from")
+        if after < len(text) and text[after].isspace():
+            i = bisect_left(starts, after)
+            if i < len(words):
+                j = following[i]
+                if j is None and words[i] == "by" and starts[i] - after >= 2:
+                    # `from` and `by` with only whitespace between them
+                    j = i if i + 1 < len(words) else None
+                if j is not None:
+                    return words[j + 1]
+        position = text.find("from", position + 1)
+    return ""
+
+
+class WordOffsets:
+    """Offsets of `words` in the text they were split from, found left to right as needed"""
+
+    def __init__(self, text: str, words: List[str]):
+        self.text = text
+        self.words = words
+        self.offsets = []
+
+    def __getitem__(self, index: int) -> int:
+        offsets, words = self.offsets, self.words
+        while len(offsets) <= index:
+            k = len(offsets)
+            position = offsets[-1] + len(words[k - 1]) if offsets else 0
+            offsets.append(self.text.find(words[k], position))
+        return offsets[index]
+
+
+def word_after(words: List[str], keyword: str) -> str:
+    try:
+        index = words.index(keyword)
+    except ValueError:
+        return ""
+    return words[index + 1] if index + 1 < len(words) else ""
+
+
 def extract_timestamp(header: str) -> int:
     return get_timestamp(extract_timestring(header))
 
@@ -180,20 +481,21 @@ def extract_timestring(header: str) -> str:
     if type(header) != str:
         raise TypeError
 
-    header = cleanup_text(header)
+    return find_timestring(cleanup_text(header))
+
+
+def find_timestring(header: str) -> str:
+    """`extract_timestring` for a header that has already been cleaned up"""
     timestring = None
 
-    split_by_semicolon = header.split(";")
-    split_by_newline = header.split("\n")
-    split_by_id = re.split(r"\s+id\s+[^\s]*\s+", header)
-
-    if len(split_by_semicolon) > 1:
-        timestring = split_by_semicolon[-1]
-    elif len(split_by_semicolon) == 1:
-        if len(split_by_newline) > 1:
-            # find it on the last line
-            timestring = split_by_newline[-1]
-        elif len(split_by_id) > 1:
+    if ";" in header:
+        timestring = header.rpartition(";")[2]
+    elif "\n" in header:
+        # find it on the last line
+        timestring = header.rpartition("\n")[2]
+    else:
+        split_by_id = ID_SEPARATOR.split(header)
+        if len(split_by_id) > 1:
             # find it after` id abc.xyz `
             timestring = split_by_id[-1]
 
@@ -203,19 +505,42 @@ def extract_timestring(header: str) -> str:
     timestring = cleanup_text(timestring)
     timestring = cleanup_text(remove_details(timestring))
     timestring = strip_timezone_name(timestring)
-    timestring = re.sub(r"-0000", "+0000", timestring)
+    timestring = timestring.replace("-0000", "+0000")
 
     return timestring
 
 
 def remove_details(text: str) -> str:
-    return re.sub(r"([(].*?[)])", " ", text)
+    """
+    Replaces every match of `DETAILS` with a space, in linear time.
+    (A plain `DETAILS.sub` rescans to the end of the line from every unclosed "(")
+    """
+    opening = text.find("(")
+    if opening == -1:
+        return text
+
+    parts = []
+    position = 0
+    while opening != -1:
+        closing = text.find(")", opening + 1)
+        if closing == -1:
+            break
+        line_end = text.find("\n", opening + 1, closing)
+        if line_end != -1:
+            # no match starts on this line any more
+            opening = text.find("(", line_end + 1)
+            continue
+        parts.append(text[position:opening])
+        parts.append(" ")
+        position = closing + 1
+        opening = text.find("(", position)
+    parts.append(text[position:])
+    return "".join(parts)
 
 
 def strip_timezone_name(timestring: str) -> str:
     """Removes extra timezone name at the end. eg: "-0800 (PST)" -> "-0800" """
-    pattern = r"([+]|[-])([0-9]{4})[ ]([(]([a-zA-Z]{3,4})[)]|([a-zA-Z]{3,4}))"
-    if re.search(pattern, timestring) is None:
+    if TIMEZONE_NAME.search(timestring) is None:
         return timestring
 
     split = timestring.split(" ")
@@ -224,17 +549,12 @@ def strip_timezone_name(timestring: str) -> str:
 
 
 def get_timestamp(timestring: str) -> int:
-    """Convert a timestring to unix timestamp"""
+    """Convert a timestring to unix timestamp. Results (including failures) are kept in `timestamp_cache`"""
 
     if timestring is None:
         return None
 
-    date = dateparser.parse(timestring)
-    if date is None:
-        return None
-
-    date = date.astimezone(pytz.utc)
-    return calendar.timegm(date.utctimetuple())
+    return timestamp_cache.get_or_compute(timestring, resolve_timestamp)
 
 
 def calculate_delay(current_timestamp: int, previous_timestamp: int) -> int:
@@ -0,0 +1,125 @@
+"""
+Readers of email corpora, in constant memory.
+
+Each yields `(key, raw)` pairs: raw is the header block of a message (str or bytes, anything
+`analyse_headers` takes) and key says where it came from (row number, line number,
+file offset or file name).
+"""
+
+import json
+import mmap
+import os
+from typing import Iterator, Tuple, Union
+
+from .mbox import message_spans
+
+Record = Tuple[Union[int, str], Union[str, bytes]]
+
+FORMATS = ("xml", "ndjson", "mbox", "maildir")
+
+
+def read_xml(path: str, row: str = "row", field: str = "source") -> Iterator[Record]:
+    """
+    Text of the `field` element of every `row` element, e.g. an SQL client's XML export.
+    Parsed incrementally, rows are dropped once read.
+    """
+    # imports xml.etree, keep it out of `import emailtrail`
+    from xml.etree.ElementTree import iterparse
+
+    index = 0
+    parents = []  # elements being parsed, innermost last
+    for event, element in iterparse(path, events=("start", "end")):
+        if event == "start":
+            parents.append(element)
+            continue
+        parents.pop()
+        if element.tag == row:
+            value = element.findtext(field)
+            if value is not None:
+                yield index, value
+            index += 1
+            if parents:
+                # the row and anything before it are done, detached they can be freed
+                del parents[-1][:]
+
+
+def read_ndjson(path: str, field: str = "source") -> Iterator[Record]:
+    """`field` of every JSON object, one per line. Keyed by line number (from 1)"""
+    with open(path, encoding="utf-8") as fd:
+        for number, line in enumerate(fd, 1):
+            if line.strip():
+                yield number, json.loads(line)[field]
+
+
+def read_mbox(path: str) -> Iterator[Record]:
+    """Header block of every message of an mbox file, keyed by the offset of its "From " line"""
+    with open(path, "rb") as fd:
+        if os.fstat(fd.fileno()).st_size == 0:
+            return
+        with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for start, end in message_spans(mapped):
+                stop = header_block_end(mapped, start, end)
+                yield start, mapped[start:stop]
+
+
+def read_maildir(path: str) -> Iterator[Record]:
+    """Header block of every message in the `cur` and `new` folders of a maildir, keyed by file name"""
+    for folder in ("cur", "new"):
+        directory = os.path.join(path, folder)
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            filename = os.path.join(directory, name)
+            if os.path.isfile(filename):
+                yield os.path.join(folder, name), read_header_block(filename)
+
+
+def read_header_block(filename: str) -> bytes:
+    """
+    Lines of a message file up to the first empty one, the body isn't read.
+    Like `scan_headers`, leading blank lines are skipped and a line of whitespace is a
+    continuation line.
+    """
+    lines = []
+    with open(filename, "rb") as fd:
+        for line in fd:
+            if not lines and not line.strip():
+                continue
+            if not line.rstrip(b"\r\n"):
+                break
+            lines.append(line)
+    return b"".join(lines)
+
+
+def header_block_end(data, start: int, end: int) -> int:
+    """Offset of the blank line ending the header block of `data[start:end]`, or `end`"""
+    ends = [data.find(b"\n\n", start, end), data.find(b"\n\r\n", start, end)]
+    ends = [offset + 1 for offset in ends if offset != -1]
+    return min(ends, default=end)
+
+
+def guess_format(path: str) -> str:
+    if os.path.isdir(path):
+        return "maildir"
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".xml":
+        return "xml"
+    if extension in (".ndjson", ".jsonl", ".json"):
+        return "ndjson"
+    return "mbox"
+
+
+def read_source(path: str, format: str = None) -> Iterator[Record]:
+    """Messages of a corpus in any of `FORMATS`, guessed from the path if not given"""
+    format = format or guess_format(path)
+    if format == "xml":
+        return read_xml(path)
+    if format == "ndjson":
+        return read_ndjson(path)
+    if format == "mbox":
+        return read_mbox(path)
+    if format == "maildir":
+        return read_maildir(path)
+    raise ValueError(
+        "unknown format %r, expected one of %s" % (format, ", ".join(FORMATS))
+    )
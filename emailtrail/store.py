@@ -0,0 +1,208 @@
+"""
+Persistent cache of analysed trails, in an sqlite file.
+
+    with TrailStore("trails.sqlite") as store:
+        trail = store.analyse(raw)
+        for index, result in store.analyse_many(archive, workers=8):
+            ...
+
+A trail is keyed on a digest of the headers it's built from (Received, From, To, Cc, Bcc),
+the Message-ID, the `Limits` and the library version, so a message is only analysed again when
+one of those changes. Re-running over an unchanged corpus then costs a header scan and a lookup
+per message. Settings changing how timestamps are read (`set_dateparser_languages`) aren't part
+of the key, `clear` the store after changing them.
+"""
+
+import json
+import os
+import sqlite3
+from hashlib import blake2b
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+
+from . import __version__
+from .batch import Result, analyse_chunks, iter_chunks, worker_pool
+from .headers import TRAIL_HEADERS, HeaderBlock, scan_headers
+from .interning import interner
+from .models import Hop, Limits, Trail
+from .module import DEFAULT_LIMITS, trail_from_headers
+
+KEY_HEADERS = tuple(sorted(TRAIL_HEADERS | {"message-id"}))
+# sqlite's default limit on the parameters of a statement is 999
+MAX_PARAMETERS = 900
+
+
+class TrailStore:
+    """Trails stored in the sqlite file at `path`, created if needed"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS trails (key BLOB PRIMARY KEY, trail BLOB NOT NULL)"
+            " WITHOUT ROWID"
+        )
+        self.connection.commit()
+
+    def analyse(self, raw_headers: Union[str, bytes], limits: Limits = None) -> Trail:
+        """`analyse_headers`, looked up in the store first"""
+        headers = scan_headers(raw_headers, KEY_HEADERS)
+        key = trail_key(headers, limits)
+        trail = self.get_many([key]).get(key)
+        if trail is None:
+            trail = trail_from_headers(headers, limits)
+            if storable(trail, limits):
+                self.put_many([(key, trail)])
+        return trail
+
+    def analyse_many(
+        self,
+        raw_messages: Iterable[Union[str, bytes]],
+        workers: int = None,
+        chunksize: int = 64,
+        limits: Limits = None,
+        batch_size: int = 4096,
+    ) -> Iterator[Tuple[int, Result]]:
+        """
+        `analyse_many`, looking messages up in the store `batch_size` at a time.
+        Only the ones not found are sent to the worker processes, and stored afterwards.
+        Results are yielded in input order.
+        """
+        if chunksize < 1:
+            raise ValueError("chunksize must be >= 1")
+        workers = workers or os.cpu_count() or 1
+        with worker_pool(workers) as pool:
+            for start, batch in iter_chunks(raw_messages, batch_size):
+                results = self._analyse_batch(pool, workers, batch, chunksize, limits)
+                yield from enumerate(results, start)
+
+    def _analyse_batch(
+        self, pool, workers: int, batch: List, chunksize: int, limits: Limits
+    ) -> List[Result]:
+        results = [None] * len(batch)
+        keys = [None] * len(batch)
+        for position, raw in enumerate(batch):
+            try:
+                keys[position] = trail_key(scan_headers(raw, KEY_HEADERS), limits)
+            except Exception as error:
+                results[position] = error
+
+        found = self.get_many([key for key in keys if key is not None])
+        misses = []
+        for position, key in enumerate(keys):
+            if key is None:
+                continue
+            trail = found.get(key)
+            if trail is None:
+                misses.append(position)
+            else:
+                results[position] = trail
+
+        chunks = iter_chunks((batch[position] for position in misses), chunksize)
+        computed = []
+        for index, result in analyse_chunks(pool, workers, chunks, False, limits):
+            position = misses[index]
+            results[position] = result
+            if isinstance(result, Trail) and storable(result, limits):
+                computed.append((keys[position], result))
+        self.put_many(computed)
+        return results
+
+    def get_many(self, keys: Iterable[bytes]) -> Dict[bytes, Trail]:
+        """Stored trails of `keys`, the ones not found are left out. Interned, see `set_interning`"""
+        found = {}
+        keys = iter(keys)
+        while True:
+            batch = list(islice(keys, MAX_PARAMETERS))
+            if not batch:
+                return found
+            rows = self.connection.execute(
+                "SELECT key, trail FROM trails WHERE key IN (%s)"
+                % ",".join("?" * len(batch)),
+                batch,
+            )
+            for key, value in rows:
+                found[key] = trail = load_trail(value)
+                if interner.maxsize:
+                    interner.intern_trail(trail)
+
+    def put_many(self, items: Iterable[Tuple[bytes, Trail]]) -> None:
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO trails (key, trail) VALUES (?, ?)",
+                ((key, dump_trail(trail)) for key, trail in items),
+            )
+
+    def clear(self) -> None:
+        with self.connection:
+            self.connection.execute("DELETE FROM trails")
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM trails").fetchone()[0]
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> "TrailStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def trail_key(headers: HeaderBlock, limits: Limits = None) -> bytes:
+    """Digest of what the trail of a message depends on, see the module docstring"""
+    digest = blake2b(digest_size=20)
+    digest.update(("%s\n%r\n" % (__version__, limits or DEFAULT_LIMITS)).encode())
+    for name in KEY_HEADERS:
+        for value in headers.get_all(name) or ():
+            value = value.encode("utf-8", "surrogatepass")
+            # length prefixed, values can contain anything
+            digest.update(b"%s %d:" % (name.encode(), len(value)))
+            digest.update(value)
+    return digest.digest()
+
+
+def storable(trail: Trail, limits: Limits = None) -> bool:
+    """Whether the trail is the same every time, a time budget can cut it short at any hop"""
+    return not (trail.truncated and (limits or DEFAULT_LIMITS).time_budget is not None)
+
+
+def dump_trail(trail: Trail) -> bytes:
+    return json.dumps(
+        [
+            trail.to_address,
+            trail.from_address,
+            trail.cc,
+            trail.bcc,
+            trail.truncated,
+            [
+                [
+                    hop.from_host,
+                    hop.protocol,
+                    hop.received_by_host,
+                    hop.timestamp,
+                    hop.delay,
+                ]
+                for hop in trail.hops
+            ],
+        ],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode("utf-8", "surrogatepass")
+
+
+def load_trail(value: bytes) -> Trail:
+    to_address, from_address, cc, bcc, truncated, hops = json.loads(
+        value.decode("utf-8", "surrogatepass")
+    )
+    return Trail(
+        to_address=to_address,
+        from_address=from_address,
+        cc=cc,
+        bcc=bcc,
+        hops=[Hop(*hop) for hop in hops],
+        truncated=truncated,
+    )
@@ -0,0 +1,192 @@
+"""
+Learned layouts of Received headers.
+
+Most Received headers come from a few dozen MTAs, each writing them the same way, e.g.
+"from X (Y [IP]) by Z with ESMTPS id I for <R>; DATE". A template is learned the first time a
+layout is seen: the words of the header are replaced by markers, the generic tokenizer is run
+on that, and where the markers end up in its output tells which words make up each clause.
+Headers with a known layout are then split with a single regex match.
+
+Words that could change how the generic tokenizer reads a header (anything containing a keyword)
+are kept as they are in a template, and can't stand for a marker. Headers that don't match any
+template go through the generic path.
+"""
+
+import re
+from itertools import cycle
+from threading import Lock
+from typing import Callable, List, Optional, Tuple
+
+from .cache import LRUCache
+
+# what the generic tokenizer looks for, a variable word can't contain them
+BANNED = ("id", "by", "from", "with", "via", "for")
+# runs a keyword is looked for in, see `split_banned_runs`
+ALNUM_RUN = re.compile(r"[A-Za-z0-9]+")
+WORD = re.compile(r"[^\s();\\]+")
+VARIABLE = r"([^\s();\\]+)"
+# templates tried for headers with the same `layout_key`
+MAX_VARIANTS = 8
+# first of the private use chars standing for the variable words when learning
+MARKER = 0xE000
+
+# layout -> templates, off until `set_template_cache` is called
+template_cache = LRUCache(maxsize=0)
+# templates are shared by all threads, `hits += 1` isn't atomic
+_hits_lock = Lock()
+
+
+def set_template_cache(maxsize: int = 512) -> None:
+    """Turns learning and using templates on, or off with a maxsize of 0"""
+    template_cache.clear()
+    template_cache.resize(maxsize)
+
+
+class ReceivedTemplate:
+    """
+    A learned layout. `clauses` build the from, by, protocol, id and recipient clauses from the
+    variable words: each is the index of the word it's made of, or a `str.format` string.
+    Only headers with the same `layout_key` are matched against it, so its variable words
+    can't contain a keyword.
+    """
+
+    __slots__ = ("example", "pattern", "clauses", "hits")
+
+    def __init__(self, example: str, pattern, clauses: tuple):
+        self.example = example
+        self.pattern = pattern
+        self.clauses = clauses
+        self.hits = 0
+
+    def extract(self, header: str) -> Optional[List[str]]:
+        match = self.pattern.fullmatch(header)
+        if match is None:
+            return None
+        with _hits_lock:
+            self.hits += 1
+        words = match.groups()
+        return [
+            words[clause] if clause.__class__ is int else clause.format(*words)
+            for clause in self.clauses
+        ]
+
+
+def extract(header: str, tokenize: Callable) -> Optional[List[str]]:
+    """
+    from, by, protocol, id and recipient clauses of `header`, from a template
+    (learned with `tokenize` if needed). None if the header doesn't fit one.
+    """
+    if "\\" in header:
+        # escapes are expanded by the tokenizer, they'd shift what the markers stand for
+        return None
+
+    key = layout_key(header)
+    templates = template_cache.get(key)
+    if templates is not None:
+        for template in templates:
+            fields = template.extract(header)
+            if fields is not None:
+                return fields
+        if len(templates) >= MAX_VARIANTS:
+            return None
+
+    template = learn(header, tokenize)
+    if template is None:
+        return None
+    template_cache.put(key, (templates or ()) + (template,))
+    return template.extract(header)
+
+
+def layout_key(header: str) -> tuple:
+    """
+    Cheap summary of a layout, different layouts can share one.
+    Counts the keywords too: a header matching a template has the same fixed words as its
+    example, with the same count its variable words can't contain any either.
+    """
+    count = header.count
+    return (header[:4], count("\n"), count("("), count(";"), sum(map(count, BANNED)))
+
+
+def learn(header: str, tokenize: Callable) -> Optional[ReceivedTemplate]:
+    """Template of the layout of `header`, None if it has too many words"""
+    pattern = []
+    probe = []
+    variables = 0
+    position = 0
+    for word in WORD.finditer(header):
+        start = word.start()
+        separator = header[position:start]
+        pattern.append(re.escape(separator))
+        probe.append(separator)
+        position = word.end()
+
+        # keywords, and runs containing one, stay as they are. In "filter1.sendgrid.net"
+        # "filter1." and ".net" vary, "sendgrid" doesn't
+        parts = split_banned_runs(word.group())
+        for fixed, part in zip(cycle((False, True)), parts):
+            if fixed:
+                pattern.append(re.escape(part))
+                probe.append(part)
+            elif part:
+                pattern.append(VARIABLE)
+                probe.append(chr(MARKER + variables))
+                variables += 1
+        if variables > 0x1000:
+            return None
+    pattern.append(re.escape(header[position:]))
+    probe.append(header[position:])
+
+    clauses = tokenize("".join(probe))
+    fields = (
+        clauses.from_host,
+        clauses.received_by_host,
+        clauses.protocol,
+        clauses.id,
+        clauses.recipient,
+    )
+    return ReceivedTemplate(
+        example=header,
+        pattern=re.compile("".join(pattern)),
+        clauses=tuple(as_clause(field) for field in fields),
+    )
+
+
+def split_banned_runs(word: str) -> List[str]:
+    """
+    `word` split around its alphanumeric runs containing one of `BANNED`, like `re.split` with
+    a group: the runs are at the odd indexes. Linear, where a regex looking for the keyword
+    inside a run would retry it from every position.
+    """
+    parts = []
+    position = 0
+    for run in ALNUM_RUN.finditer(word):
+        text = run.group()
+        if any(keyword in text for keyword in BANNED):
+            start, end = run.span()
+            parts.append(word[position:start])
+            parts.append(text)
+            position = end
+    parts.append(word[position:])
+    return parts
+
+
+def as_clause(field: str):
+    """How to rebuild a clause of the probe from the variable words, see `ReceivedTemplate`"""
+    if len(field) == 1 and 0 <= ord(field) - MARKER < 0x1000:
+        return ord(field) - MARKER
+    parts = []
+    for char in field.replace("{", "{{").replace("}", "}}"):
+        index = ord(char) - MARKER
+        parts.append("{%d}" % index if 0 <= index < 0x1000 else char)
+    return "".join(parts)
+
+
+def template_stats() -> List[Tuple[str, int]]:
+    """(example header, hits) of the learned templates, most used first"""
+    templates = [
+        template for variants in template_cache.values() for template in variants
+    ]
+    return sorted(
+        ((template.example, template.hits) for template in templates),
+        key=lambda item: -item[1],
+    )
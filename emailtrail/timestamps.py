@@ -0,0 +1,211 @@
+import calendar
+import re
+from collections import Counter
+from datetime import timezone
+from threading import Lock, local
+
+from .cache import LRUCache
+from .instrument import timed
+
+
+class LockedCounter(Counter):
+    """`Counter` that many threads can `increment` at once, `+=` on an item isn't atomic"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = Lock()
+
+    def increment(self, key) -> None:
+        with self._lock:
+            self[key] += 1
+
+
+# How timestrings were resolved: "native" by the RFC 5322 parser below,
+# "fallback" by dateparser, "unparsed" when neither could make sense of it.
+timestamp_stats = LockedCounter()
+
+# Received timestrings repeat a lot across a mailbox (bulk mail, relay chains stamping the same second).
+# `get_timestamp` resolves through this cache, `timestamp_cache.resize(0)` turns it off.
+timestamp_cache = LRUCache(maxsize=4096)
+
+# longer timestrings aren't dates, they're left unparsed
+MAX_TIMESTRING_LENGTH = 128
+
+MONTHS = {
+    "jan": 1,
+    "feb": 2,
+    "mar": 3,
+    "apr": 4,
+    "may": 5,
+    "jun": 6,
+    "jul": 7,
+    "aug": 8,
+    "sep": 9,
+    "oct": 10,
+    "nov": 11,
+    "dec": 12,
+}
+
+# RFC 5322 section 4.3 obsolete zones, as offsets in minutes.
+# Military zones other than "Z" were specified with the wrong sign in RFC 822,
+# the RFC says to treat them as "-0000".
+OBSOLETE_ZONES = {
+    "ut": 0,
+    "gmt": 0,
+    "z": 0,
+    "edt": -4 * 60,
+    "est": -5 * 60,
+    "cdt": -5 * 60,
+    "cst": -6 * 60,
+    "mdt": -6 * 60,
+    "mst": -7 * 60,
+    "pdt": -7 * 60,
+    "pst": -8 * 60,
+}
+OBSOLETE_ZONES.update(
+    {letter: 0 for letter in "abcdefghiklmnopqrstuvwxy"}  # military, "j" is unused
+)
+
+RFC5322_DATE = re.compile(
+    r"""
+    \s*
+    (?:(?:mon|tue|wed|thu|fri|sat|sun)\s*,?\s*)?
+    (?P<day>\d{1,2})\s+
+    (?P<month>jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)\s+
+    (?P<year>\d{2,4})\s+
+    (?P<hour>\d{1,2}):(?P<minute>\d{2})
+    (?::(?P<second>\d{2})(?:\.\d+)?)?
+    \s*
+    (?:
+        (?P<offset>[+-]\d{4})
+        |(?P<zone>[a-z]{1,3})
+    )
+    \s*
+    """,
+    re.X | re.I,
+)
+
+
+def parse_rfc5322_timestamp(timestring: str) -> int:
+    """
+    Strict parser for the RFC 5322/2822 date-time forms found in Received headers.
+    Returns the unix timestamp, or None if the timestring is not in one of those forms.
+    """
+    match = RFC5322_DATE.fullmatch(timestring)
+    if match is None:
+        return None
+
+    day = int(match.group("day"))
+    month = MONTHS[match.group("month").lower()]
+    year = int(match.group("year"))
+    hour = int(match.group("hour"))
+    minute = int(match.group("minute"))
+    second = int(match.group("second") or 0)
+
+    year_digits = len(match.group("year"))
+    if year_digits == 2:
+        year += 2000 if year < 50 else 1900
+    elif year_digits == 3:
+        year += 1900
+
+    if day > calendar.monthrange(year, month)[1] or day < 1:
+        return None
+    if hour > 23 or minute > 59 or second > 59:
+        return None
+
+    offset = match.group("offset")
+    if offset is not None:
+        hours, minutes = int(offset[1:3]), int(offset[3:5])
+        if minutes > 59:
+            return None
+        offset_minutes = hours * 60 + minutes
+        if offset[0] == "-":
+            offset_minutes = -offset_minutes
+    else:
+        offset_minutes = OBSOLETE_ZONES.get(match.group("zone").lower())
+        if offset_minutes is None:
+            return None
+
+    timestamp = calendar.timegm((year, month, day, hour, minute, second))
+    return timestamp - offset_minutes * 60
+
+
+# Languages dateparser tries, None for all of them. See `set_dateparser_languages`.
+dateparser_languages = None
+
+
+def set_dateparser_languages(languages) -> None:
+    """
+    Limits the languages dateparser tries (e.g. ["en"]), which makes fallback parsing faster.
+    Cached timestamps are dropped since they may have been resolved differently.
+    """
+    global dateparser_languages
+    dateparser_languages = list(languages) if languages is not None else None
+    timestamp_cache.clear()
+
+
+# each thread parses with its own `DateDataParser`: dateparser's module level parser keeps
+# caches that aren't safe to share between threads
+_dateparsers = local()
+# dateparser loads its language data on first use, once
+_dateparser_setup = Lock()
+
+
+def thread_dateparser():
+    """This thread's `DateDataParser`, made again when the languages change"""
+    parser = getattr(_dateparsers, "parser", None)
+    if parser is not None and _dateparsers.languages is dateparser_languages:
+        return parser
+
+    with _dateparser_setup:
+        # dateparser takes hundreds of milliseconds to import, only pay for it when it's needed
+        from dateparser.date import DateDataParser
+
+        parser = DateDataParser(languages=dateparser_languages)
+        # fills dateparser's shared language data while no other thread is
+        parser.get_date_data("Tue, 10 Oct 2017 01:17:02 -0700")
+    _dateparsers.parser, _dateparsers.languages = parser, dateparser_languages
+    return parser
+
+
+def parse_with_dateparser(timestring: str) -> int:
+    """Lenient (and slow) parsing for timestrings the RFC 5322 parser rejects"""
+    date = thread_dateparser().get_date_data(timestring).date_obj
+    if date is None:
+        return None
+
+    date = date.astimezone(timezone.utc)
+    return calendar.timegm(date.utctimetuple())
+
+
+def resolve_timestamp(timestring: str) -> int:
+    """
+    Convert a timestring to unix timestamp.
+    Tries the RFC 5322 parser first and falls back to dateparser, counting both in `timestamp_stats`.
+    """
+    if len(timestring) > MAX_TIMESTRING_LENGTH:
+        # not a date, and dateparser takes seconds on long garbage
+        timestamp_stats.increment("unparsed")
+        return None
+
+    timestamp = parse_rfc5322_timestamp(timestring)
+    if timestamp is not None:
+        timestamp_stats.increment("native")
+        return timestamp
+
+    timestamp_stats.increment("fallback")
+    timestamp = timed("dateparser", parse_with_dateparser, timestring)
+    if timestamp is None:
+        timestamp_stats.increment("unparsed")
+    return timestamp
+
+
+def fallback_rate() -> float:
+    """Fraction of resolved timestrings that needed dateparser"""
+    total = timestamp_stats["native"] + timestamp_stats["fallback"]
+    return timestamp_stats["fallback"] / total if total else 0.0
+
+
+def warm_up() -> None:
+    """Pays dateparser's first-use cost (language data, regex tables) up front, e.g. when a worker process starts"""
+    parse_with_dateparser("Tue, 10 Oct 2017 01:17:02 -0700")
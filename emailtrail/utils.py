@@ -7,8 +7,9 @@ def cleanup_text(text: str) -> str:
     NOTE: Only to be used for a header value.
     background context for this part is lost, need an email dataset to reiterate.
     """
-    text = normalize_newlinechar(text)
-    text = normalize_tabchar(text)
+    if "\\" in text:
+        text = normalize_newlinechar(text)
+        text = normalize_tabchar(text)
     return text.strip()
 
 
@@ -0,0 +1,126 @@
+import json
+import random
+
+import pytest
+
+from emailtrail import Hop, Trail
+from emailtrail.aggregate import DelaySketch, RelayAggregator
+
+
+def trail(*hops):
+    return Trail("", "", "", "", [Hop(*hop) for hop in hops])
+
+
+def exact_quantile(values, q):
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))]
+
+
+@pytest.mark.parametrize("q", [0.0, 0.5, 0.95, 0.99, 1.0])
+def test_sketch_relative_accuracy(q):
+    rng = random.Random(1)
+    values = [int(rng.lognormvariate(3, 2)) for _ in range(20000)]
+    sketch = DelaySketch(relative_accuracy=0.01)
+    for value in values:
+        sketch.add(value)
+    expected = exact_quantile(values, q)
+    assert sketch.quantile(q) == pytest.approx(expected, rel=0.01, abs=1e-9)
+
+
+def test_sketch_merge_and_round_trip():
+    rng = random.Random(2)
+    values = [rng.randrange(0, 5000) for _ in range(5000)]
+    whole, first, second = DelaySketch(), DelaySketch(), DelaySketch()
+    for index, value in enumerate(values):
+        whole.add(value)
+        (first if index % 2 else second).add(value)
+    first.merge(DelaySketch.from_dict(json.loads(json.dumps(second.to_dict()))))
+    assert first.count == whole.count
+    for q in (0.5, 0.95, 0.99):
+        assert first.quantile(q) == whole.quantile(q)
+
+    with pytest.raises(ValueError):
+        first.merge(DelaySketch(relative_accuracy=0.05))
+
+
+def test_sketch_memory_is_bounded():
+    sketch = DelaySketch(max_buckets=64)
+    for value in range(1, 100000, 7):
+        sketch.add(value)
+    assert len(sketch.buckets) <= 64
+    assert sketch.quantile(0.99) == pytest.approx(99000, rel=0.01)
+    assert DelaySketch().quantile(0.5) is None
+
+
+def test_relays_and_edges():
+    aggregator = RelayAggregator()
+    aggregator.add(trail(("", "HTTP", "a", 100), ("a", "SMTP", "b", 110)))
+    aggregator.add(trail(("", "HTTP", "a", 200), ("a", "SMTP", "b", 190)))
+    aggregator.add(trail(("", "HTTP", "a", None), ("x", "SMTP", "b", 300)))
+
+    summary = aggregator.summary()
+    assert summary["trails"] == 3
+    b = summary["relays"]["b"]
+    assert (b["count"], b["unknown"], b["skewed"], b["max"]) == (3, 1, 1, 10)
+    assert b["mean"] == 5
+    assert summary["relays"]["a"]["unknown"] == 3
+    assert summary["relays"]["a"]["p50"] is None
+    assert summary["edges"][("a", "b")]["count"] == 2
+    assert summary["edges"][("x", "b")]["unknown"] == 1
+
+
+def test_rare_hosts_are_dropped():
+    aggregator = RelayAggregator(max_keys=100)
+    for number in range(1000):
+        aggregator.add(
+            trail(("", "SMTP", "common", 0), ("", "SMTP", "host%d" % number, 1))
+        )
+    assert len(aggregator.relays) <= 100
+    assert len(aggregator.edges) <= 100
+    assert aggregator.relays["common"].count == 1000
+    kept = sum(stats.count for stats in aggregator.relays.values())
+    assert kept + aggregator.dropped_hops == 2000
+    kept = sum(stats.count for stats in aggregator.edges.values())
+    assert kept + aggregator.dropped_edge_hops == 2000
+
+
+def test_hosts_added_after_a_drop_keep_a_floor():
+    aggregator = RelayAggregator(max_keys=4)
+    for host, hops in (("a", 5), ("b", 5), ("c", 2), ("d", 2), ("e", 1), ("f", 1)):
+        for _ in range(hops):
+            aggregator.add(trail(("x", "SMTP", host, None)))
+    # "d" made room for "e", which ranks above "c" once "f" needs room too
+    assert sorted(aggregator.relays) == ["a", "b", "e", "f"]
+    assert aggregator.relay_floor == 2
+    assert aggregator.relays["e"].count == 1
+    assert aggregator.dropped_hops == 4
+
+    state = json.loads(json.dumps(aggregator.to_dict()))
+    restored = RelayAggregator.from_dict(state)
+    assert restored.relays["f"].floor == 2
+    assert restored.to_dict() == state
+
+
+def test_merged_workers_match_a_single_pass():
+    rng = random.Random(3)
+    trails = [
+        trail(
+            *[
+                (rng.choice("ab"), "SMTP", rng.choice("cde"), rng.randrange(1000))
+                for _ in range(rng.randrange(1, 5))
+            ]
+        )
+        for _ in range(2000)
+    ]
+    single = RelayAggregator()
+    single.update(trails)
+
+    merged = RelayAggregator()
+    for worker in range(4):
+        partial = RelayAggregator()
+        partial.update(trails[worker::4])
+        merged.merge(
+            RelayAggregator.from_dict(json.loads(json.dumps(partial.to_dict())))
+        )
+
+    assert merged.summary() == single.summary()
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from emailtrail import Limits, analyse_headers
+from emailtrail import aio
+from emailtrail.aio import analyse_headers_async, analyse_many_async
+
+MESSAGE = "Received: by a.com with SMTP; Tue, 10 Oct 2017 01:17:02 -0700\nTo: a@b.com\n"
+
+
+def test_analyse_headers_async():
+    async def main():
+        limit = asyncio.Semaphore(2)
+        return await asyncio.gather(
+            analyse_headers_async(MESSAGE),
+            analyse_headers_async(MESSAGE, limit=limit),
+        )
+
+    assert asyncio.run(main()) == [analyse_headers(MESSAGE)] * 2
+
+
+def test_batch_results_and_failures():
+    async def source():
+        for raw in [MESSAGE, None, MESSAGE]:
+            yield raw
+
+    async def main():
+        return [item async for item in analyse_many_async(source(), max_in_flight=2)]
+
+    results = asyncio.run(main())
+    assert [index for index, _ in results] == [0, 1, 2]
+    assert results[0][1] == analyse_headers(MESSAGE)
+    assert isinstance(results[1][1], TypeError)
+
+
+def test_limits():
+    received = "Received: by a.com with SMTP; Tue, 10 Oct 2017 01:17:02 -0700\n" * 3
+    limits = Limits(max_received=2)
+
+    async def main():
+        single = await analyse_headers_async(received, limits=limits)
+        many = [
+            result
+            async for _, result in analyse_many_async([received] * 2, limits=limits)
+        ]
+        return [single] + many
+
+    trails = asyncio.run(main())
+    assert trails == [analyse_headers(received, limits)] * 3
+    assert all(trail.truncated and len(trail.hops) == 2 for trail in trails)
+
+
+def test_bounded_in_flight_and_backpressure(monkeypatch):
+    lock = threading.Lock()
+    running = []
+    peak = []
+    pulled = []
+
+    def slow_analysis(raw, limits=None):
+        with lock:
+            running.append(raw)
+            peak.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.remove(raw)
+        return raw
+
+    monkeypatch.setattr(aio, "analyse_headers", slow_analysis)
+
+    def source():
+        for index in range(20):
+            pulled.append(index)
+            yield index
+
+    async def main():
+        results = []
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            async for index, result in analyse_many_async(
+                source(), executor=executor, max_in_flight=3
+            ):
+                assert len(pulled) - len(results) <= 4
+                results.append(result)
+        return results
+
+    assert asyncio.run(main()) == list(range(20))
+    assert max(peak) <= 3
+
+
+def test_invalid_max_in_flight():
+    async def main():
+        return [item async for item in analyse_many_async([MESSAGE], max_in_flight=0)]
+
+    with pytest.raises(ValueError):
+        asyncio.run(main())
@@ -0,0 +1,46 @@
+from itertools import count, islice
+
+import pytest
+
+from emailtrail import analyse_headers, analyse_many
+
+MESSAGES = [
+    "Received: by a.com with SMTP; Tue, 10 Oct 2017 01:17:02 -0700\nTo: a@b.com\n\nbody",
+    "Received: from a.com by b.com with ESMTP; Tue, 10 Oct 2017 01:17:05 -0700\n"
+    "Received: by a.com with HTTP; Tue, 10 Oct 2017 01:17:02 -0700\n",
+    None,
+    b"Received: by c.com; 2015-12-16 19:35:09.561998041 +0000 UTC\n",
+    "",
+] * 5
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_results_in_input_order(workers):
+    results = list(analyse_many(MESSAGES, workers=workers, chunksize=3))
+
+    assert [index for index, _ in results] == list(range(len(MESSAGES)))
+    for (_, result), raw in zip(results, MESSAGES):
+        if raw is None:
+            assert isinstance(result, TypeError)
+        else:
+            assert result == analyse_headers(raw)
+
+
+def test_unordered_results():
+    results = dict(analyse_many(MESSAGES, workers=2, chunksize=2, ordered=False))
+    ordered = dict(analyse_many(MESSAGES, workers=1))
+    assert results.keys() == ordered.keys()
+    for index, result in results.items():
+        if MESSAGES[index] is not None:
+            assert result == ordered[index]
+
+
+def test_inputs_are_read_lazily():
+    endless = (MESSAGES[0] for _ in count())
+    results = list(islice(analyse_many(endless, workers=2, chunksize=4), 10))
+    assert [index for index, _ in results] == list(range(10))
+
+
+def test_invalid_chunksize():
+    with pytest.raises(ValueError):
+        list(analyse_many(MESSAGES, chunksize=0))
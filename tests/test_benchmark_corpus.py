@@ -0,0 +1,14 @@
+from benchmarks.corpus import generate_messages
+from emailtrail import analyse_headers
+
+
+def test_corpus_is_deterministic():
+    assert list(generate_messages(50, seed=3)) == list(generate_messages(50, seed=3))
+    assert list(generate_messages(50, seed=3)) != list(generate_messages(50, seed=4))
+
+
+def test_corpus_messages_can_be_analysed():
+    for message in generate_messages(50, seed=1):
+        trail = analyse_headers(message)
+        assert trail.to_address
+        assert trail.hops
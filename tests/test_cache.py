@@ -0,0 +1,92 @@
+from threading import Thread
+
+from emailtrail import get_timestamp
+from emailtrail.cache import LRUCache
+from emailtrail.timestamps import timestamp_cache
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.info() == (3, 1, 1, 2, 2)
+
+
+def test_none_values_are_cached():
+    calls = []
+
+    def compute(key):
+        calls.append(key)
+        return None
+
+    cache = LRUCache(maxsize=2)
+    assert cache.get_or_compute("garbage", compute) is None
+    assert cache.get_or_compute("garbage", compute) is None
+    assert calls == ["garbage"]
+    assert cache.hits == 1
+
+
+def test_zero_size_disables_caching():
+    cache = LRUCache(maxsize=0)
+    cache.put("a", 1)
+    assert len(cache) == 0
+    assert cache.get_or_compute("a", lambda key: 2) == 2
+
+
+def test_resize_and_clear():
+    cache = LRUCache(maxsize=3)
+    for key in "abc":
+        cache.put(key, key)
+    cache.resize(1)
+    assert len(cache) == 1
+    assert cache.evictions == 2
+
+    cache.clear()
+    assert cache.info() == (0, 0, 0, 0, 1)
+
+
+def test_cache_is_safe_to_share_across_threads():
+    cache = LRUCache(maxsize=50)
+
+    def work(offset):
+        for i in range(2000):
+            key = (i + offset) % 100
+            assert cache.get_or_compute(key, lambda k: k * 2) == key * 2
+
+    threads = [Thread(target=work, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    info = cache.info()
+    assert info.hits + info.misses == 8 * 2000
+    assert info.size <= 50
+
+
+def test_get_timestamp_uses_the_cache():
+    timestamp_cache.clear()
+    assert 1450453047 == get_timestamp("Fri, 18 Dec 2015 15:37:27 GMT")
+    assert 1450453047 == get_timestamp("Fri, 18 Dec 2015 15:37:27 GMT")
+    assert None is get_timestamp("time is 12:30 pm, blah")
+    assert None is get_timestamp("time is 12:30 pm, blah")
+    assert timestamp_cache.hits == 2
+    assert timestamp_cache.misses == 2
+
+
+def test_entries_expire_after_ttl():
+    now = [0.0]
+    cache = LRUCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.put("a", 1)
+    now[0] = 9.9
+    assert cache.get("a") == 1
+    now[0] = 10
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    assert cache.info() == (1, 1, 1, 0, 2)
@@ -0,0 +1,84 @@
+import csv
+import io
+import json
+import mailbox
+
+import pytest
+
+from emailtrail import analyse_headers
+from emailtrail.cli import main
+
+MESSAGES = [
+    "Received: from a.com (a.com [10.0.0.1])\n\tby b.com with ESMTP id 42;\n\tTue, 10 Oct 2017 01:17:02 -0700\nReceived: by c.com with HTTP; Tue, 10 Oct 2017 01:17:01 -0700\nFrom: Mr. Bags <bags@money.com>\nTo: you@example.com\n\nbody\n",
+    "Received: by d.com with SMTP; Wed, 11 Oct 2017 01:17:02 +0000\nTo: nobody@example.com\n\n",
+]
+
+
+@pytest.fixture
+def emails(tmp_path):
+    for number, message in enumerate(MESSAGES):
+        (tmp_path / ("%d.eml" % number)).write_text(message)
+    return tmp_path
+
+
+def ndjson(text):
+    return sorted(
+        (json.loads(line) for line in text.splitlines()), key=lambda r: r["file"]
+    )
+
+
+def test_ndjson(emails, capsys):
+    assert main([str(emails / "*.eml"), "--workers", "1"]) == 0
+    records = ndjson(capsys.readouterr().out)
+    assert [record["file"] for record in records] == [
+        str(emails / "0.eml"),
+        str(emails / "1.eml"),
+    ]
+    trail = analyse_headers(MESSAGES[0])
+    assert records[0]["trail"]["to_address"] == trail.to_address
+    assert [hop["received_by_host"] for hop in records[0]["trail"]["hops"]] == [
+        hop.received_by_host for hop in trail.hops
+    ]
+
+
+def test_csv_rows_per_hop(emails, tmp_path):
+    output = tmp_path / "hops.csv"
+    assert main([str(emails), "--format", "csv", "-o", str(output), "-j", "2"]) == 0
+    rows = list(csv.DictReader(output.open()))
+    assert len(rows) == 3
+    assert sorted(row["received_by_host"] for row in rows) == [
+        "b.com",
+        "c.com",
+        "d.com",
+    ]
+    assert all(row["error"] == "" for row in rows)
+
+
+def test_directories_are_walked(tmp_path, capsys):
+    box = mailbox.Maildir(str(tmp_path / "Maildir"))
+    for message in MESSAGES:
+        box.add(message)
+    main([str(tmp_path / "Maildir"), "-j", "1"])
+    assert len(ndjson(capsys.readouterr().out)) == 2
+
+
+def test_stdin(monkeypatch, capsys):
+    monkeypatch.setattr("sys.stdin", io.TextIOWrapper(io.BytesIO(MESSAGES[1].encode())))
+    assert main(["-j", "1"]) == 0
+    [record] = ndjson(capsys.readouterr().out)
+    assert record["file"] == "-"
+    assert record["trail"]["hops"][0]["received_by_host"] == "d.com"
+
+
+def test_missing_files_are_reported(emails, capsys):
+    assert main([str(emails / "0.eml"), str(emails / "missing.eml"), "-j", "1"]) == 1
+    records = ndjson(capsys.readouterr().out)
+    assert "trail" in records[0]
+    assert "FileNotFoundError" in records[1]["error"]
+
+
+def test_progress_and_profile(emails, capsys):
+    main([str(emails), "--progress", "--profile"])
+    err = capsys.readouterr().err
+    assert "2 messages" in err
+    assert "analyse_headers" in err and "tokenize" in err
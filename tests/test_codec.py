@@ -0,0 +1,154 @@
+import gc
+import io
+
+import pytest
+
+from emailtrail import Hop, Trail, analyse_headers
+from emailtrail.codec import (
+    CodecError,
+    TrailReader,
+    TrailWriter,
+    decode_block,
+    dump_trails,
+    encode_block,
+    load_trails,
+    read_block_columns,
+)
+
+MESSAGES = [
+    "Received: from a.com (a.com [10.0.0.1])\n\tby b.com with ESMTP id 42;\n\tTue, 10 Oct 2017 01:17:02 -0700\nReceived: by c.com with HTTP; Tue, 10 Oct 2017 01:17:01 -0700\nFrom: Mr. Bags <bags@money.com>\nTo: you@example.com\n\n",
+    "Received: by d.com with SMTP; Wed, 11 Oct 2017 01:17:02 +0000\nCc: =?utf-8?Q?Capitalism=E2=84=A2?= <money@rules.com>\n\n",
+    b"Received: by c.com; 2015-12-16 19:35:09 +0000\nTo: Zo\xc3\xab <zoe@example.com>\n",
+    "Received: by e.com; not a date\n",
+]
+
+TRAILS = [analyse_headers(raw) for raw in MESSAGES] + [
+    Trail(
+        to_address="\udcff@example.com",
+        from_address="nul\0in\0the\0middle",
+        cc="",
+        bcc="",
+        hops=[
+            Hop("a.com", "SMTP", "b.com", 1507623421, 0),
+            # clocks off, the delay isn't the difference of the timestamps
+            Hop("b.com", "SMTP", "c.com", 1507623400, 0),
+            Hop("c.com", "SMTP", "d.com", None, 0),
+            Hop("d.com", "ESMTP", "e.com", 2**40, 7),
+            Hop("e.com", "ESMTP", "f.com", -5, 3),
+        ],
+        truncated=True,
+    ),
+    Trail("", "", "", "", []),
+]
+
+
+def written(trails, block_size=2):
+    fd = io.BytesIO()
+    dump_trails(trails, fd, block_size)
+    fd.seek(0)
+    return fd
+
+
+def test_column_widths():
+    # a day's mail, relayed in seconds
+    trails = [
+        Trail(
+            "to%d@example.com" % n,
+            "",
+            "",
+            "",
+            [
+                Hop("a.com", "SMTP", "b.com", 1507600000 + n * 60, 0),
+                Hop("b.com", "SMTP", "c.com", 1507600000 + n * 60 + 2, 2),
+            ],
+        )
+        for n in range(1024)
+    ]
+    base, strings, _, hop_columns = read_block_columns(encode_block(trails))
+    assert base == 1507600000 - 1
+    assert len(strings) == 1024 + 5
+    timestamps, delays = hop_columns[3:]
+    assert timestamps.typecode == "H"
+    assert delays.typecode == "B"
+    assert not any(delays)
+
+
+def test_block_round_trip():
+    assert decode_block(encode_block(TRAILS)) == TRAILS
+    assert decode_block(encode_block([])) == []
+
+
+@pytest.mark.parametrize("block_size", [1, 2, 100])
+def test_stream_round_trip(block_size):
+    assert list(load_trails(written(TRAILS, block_size))) == TRAILS
+
+
+def test_random_access():
+    reader = TrailReader(written(TRAILS * 3, block_size=4))
+    assert reader.block_count == 5
+    assert reader.trail_count == len(TRAILS) * 3
+    assert reader.read_block(0) == TRAILS[:4]
+    assert reader.read_block(4) == (TRAILS * 3)[16:]
+    assert reader.read_block(1) == TRAILS[4:] + TRAILS[:2]
+
+
+class Pipe(io.RawIOBase):
+    """A stream that can't seek"""
+
+    def __init__(self, data):
+        self.data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        # a few bytes at a time, like a pipe can
+        chunk = self.data.read(min(len(buffer), 3))
+        buffer[: len(chunk)] = chunk
+        return len(chunk)
+
+
+def test_streams_from_a_pipe():
+    reader = TrailReader(io.BufferedReader(Pipe(written(TRAILS).getvalue())))
+    assert list(reader) == TRAILS
+
+
+def test_writer_leaves_the_file_open():
+    fd = io.BytesIO()
+    with TrailWriter(fd, block_size=10) as writer:
+        for trail in TRAILS:
+            writer.write(trail)
+    writer.close()
+    assert not fd.closed
+    fd.seek(0)
+    assert list(TrailReader(fd)) == TRAILS
+
+
+def test_not_a_trail_stream():
+    with pytest.raises(CodecError):
+        TrailReader(io.BytesIO(b"[1, 2, 3]\n"))
+    data = bytearray(written(TRAILS).getvalue())
+    data[4] = 99
+    with pytest.raises(CodecError, match="version"):
+        TrailReader(io.BytesIO(bytes(data)))
+
+
+def test_truncated_stream():
+    data = written(TRAILS).getvalue()
+    with pytest.raises(CodecError):
+        list(TrailReader(io.BytesIO(data[:40])))
+    with pytest.raises(CodecError):
+        TrailReader(io.BytesIO(data[:-12])).read_block(0)
+
+
+def test_garbage_collector_is_left_as_it_was():
+    body = encode_block(TRAILS)
+    assert gc.isenabled()
+    decode_block(body)
+    assert gc.isenabled()
+    gc.disable()
+    try:
+        decode_block(body)
+        assert not gc.isenabled()
+    finally:
+        gc.enable()
@@ -0,0 +1,77 @@
+import random
+
+import pytest
+
+from emailtrail import (
+    Hop,
+    Trail,
+    TrailBatch,
+    compute_delays,
+    hops_with_delay_information,
+)
+
+
+def random_trails(count, seed=1):
+    rng = random.Random(seed)
+    trails = []
+    for _ in range(count):
+        timestamp = 1507623421
+        hops = []
+        for _ in range(rng.randrange(0, 6)):
+            timestamp += rng.randrange(-30, 120)
+            hops.append(
+                Hop("a.com", "SMTP", "b.com", None if rng.random() < 0.2 else timestamp)
+            )
+        trails.append(Trail("", "", "", "", hops_with_delay_information(hops)))
+    return trails
+
+
+def expected_raw_delays(trails):
+    raw = []
+    for trail in trails:
+        previous = None
+        for hop in trail.hops:
+            if hop.timestamp is None or previous is None:
+                raw.append(None)
+            else:
+                raw.append(hop.timestamp - previous)
+            previous = hop.timestamp
+    return raw
+
+
+@pytest.fixture(params=[False, True], ids=["python", "numpy"])
+def use_numpy(request):
+    if request.param:
+        pytest.importorskip("numpy")
+    return request.param
+
+
+def test_same_delays_as_hop_by_hop(use_numpy):
+    trails = random_trails(500)
+    delays = compute_delays(TrailBatch.from_trails(trails), use_numpy)
+
+    assert list(delays.delays) == [hop.delay for trail in trails for hop in trail.hops]
+    assert list(delays.total_delays) == [trail.total_delay for trail in trails]
+
+
+def test_raw_delays_and_skew(use_numpy):
+    trails = random_trails(500)
+    delays = compute_delays(TrailBatch.from_trails(trails), use_numpy)
+    expected = expected_raw_delays(trails)
+
+    assert [bool(known) for known in delays.known] == [
+        raw is not None for raw in expected
+    ]
+    assert list(delays.raw_delays) == [raw or 0 for raw in expected]
+    assert [bool(skewed) for skewed in delays.skewed] == [
+        raw is not None and raw < 0 for raw in expected
+    ]
+    assert any(delays.skewed)
+
+
+def test_empty_batches(use_numpy):
+    delays = compute_delays(TrailBatch(), use_numpy)
+    assert len(delays.delays) == 0 and len(delays.total_delays) == 0
+
+    batch = TrailBatch.from_trails([Trail("", "", "", "", [])] * 3)
+    assert list(compute_delays(batch, use_numpy).total_delays) == [0, 0, 0]
@@ -0,0 +1,128 @@
+import os
+
+import pytest
+
+from emailtrail import analyse_headers
+from emailtrail import follow
+from emailtrail.follow import Follower
+
+MESSAGE = "Received: by a%d.com with SMTP; Tue, 10 Oct 2017 01:17:02 -0700\nTo: a@b.com\n\nbody"
+NOW = 1507623422.0
+
+
+@pytest.fixture
+def maildir(tmp_path):
+    for folder in ("new", "cur", "tmp"):
+        (tmp_path / "Maildir" / folder).mkdir(parents=True)
+    return tmp_path / "Maildir"
+
+
+def deliver(directory, number, mtime):
+    path = directory / ("%d.host" % number)
+    path.write_text(MESSAGE % number)
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def hosts(batch):
+    return [result.hops[0].received_by_host for _, result in batch]
+
+
+def test_only_new_messages_are_analysed(maildir):
+    follower = Follower(str(maildir))
+    deliver(maildir / "new", 1, NOW)
+    deliver(maildir / "new", 2, NOW + 1)
+
+    batch = follower.poll()
+    assert hosts(batch) == ["a1.com", "a2.com"]
+    assert batch[0][1] == analyse_headers(MESSAGE % 1)
+    assert follower.poll() == []
+
+    # read by a client, same inode and mtime
+    os.rename(maildir / "new" / "1.host", maildir / "cur" / "1.host:2,S")
+    deliver(maildir / "new", 3, NOW + 2)
+    assert hosts(follower.poll()) == ["a3.com"]
+
+
+def test_late_deliveries_within_grace(maildir):
+    follower = Follower(str(maildir), grace=5)
+    deliver(maildir / "new", 1, NOW)
+    follower.poll()
+    deliver(maildir / "new", 2, NOW - 3)
+    deliver(maildir / "new", 3, NOW - 30)
+    assert hosts(follower.poll()) == ["a2.com"]
+
+
+def test_reused_inodes(maildir, monkeypatch):
+    # every file gets the inode of the one deleted before it
+    scan_directory = follow.scan_directory
+    monkeypatch.setattr(
+        follow,
+        "scan_directory",
+        lambda *args: ((mtime, 1, path) for mtime, _, path in scan_directory(*args)),
+    )
+    follower = Follower(str(maildir), grace=5)
+    path = deliver(maildir / "new", 1, NOW)
+    assert hosts(follower.poll()) == ["a1.com"]
+    # consumed and deleted, the next delivery lands within the grace window
+    os.remove(path)
+    deliver(maildir / "new", 2, NOW + 1)
+    assert hosts(follower.poll()) == ["a2.com"]
+    assert follower.poll() == []
+
+
+def test_batches_and_backlog(maildir):
+    follower = Follower(str(maildir), batch_size=2)
+    for number in range(5):
+        deliver(maildir / "new", number, NOW + number)
+    assert hosts(follower.poll()) == ["a0.com", "a1.com"]
+    assert follower.metrics()["backlog"] == 3
+    assert hosts(follower.poll()) == ["a2.com", "a3.com"]
+    assert hosts(follower.poll()) == ["a4.com"]
+    assert follower.poll() == []
+    metrics = follower.metrics()
+    assert metrics["messages"] == 5 and metrics["batches"] == 3
+    assert metrics["backlog"] == 0 and metrics["lag_seconds"] > 0
+
+
+def test_resumes_from_checkpoint(maildir, tmp_path):
+    checkpoint = str(tmp_path / "checkpoint.json")
+    for number in range(3):
+        deliver(maildir / "new", number, NOW + number)
+
+    follower = Follower(str(maildir), checkpoint, batch_size=2)
+    batches = follower.follow(interval=0)
+    assert hosts(next(batches)) == ["a0.com", "a1.com"]
+    assert hosts(next(batches)) == ["a2.com"]
+    # stopped while handling the second batch, it's handed out again
+    batches.close()
+
+    restarted = Follower(str(maildir), checkpoint, batch_size=2)
+    assert hosts(restarted.poll()) == ["a2.com"]
+    restarted.save_checkpoint()
+    deliver(maildir / "new", 3, NOW + 3)
+    assert hosts(Follower(str(maildir), checkpoint).poll()) == ["a3.com"]
+
+
+def test_spool_directory(tmp_path):
+    follower = Follower(str(tmp_path))
+    deliver(tmp_path, 1, NOW)
+    (tmp_path / ".hidden").write_text("x")
+    assert hosts(follower.poll()) == ["a1.com"]
+
+
+def test_vanished_files_are_errors(maildir, monkeypatch):
+    follower = Follower(str(maildir))
+    path = deliver(maildir / "new", 1, NOW)
+    deliver(maildir / "new", 2, NOW + 1)
+    real_analyse = follower.analyse
+
+    def analyse(paths, pool):
+        os.remove(path)
+        return real_analyse(paths, pool)
+
+    monkeypatch.setattr(follower, "analyse", analyse)
+    batch = follower.poll()
+    assert isinstance(batch[0][1], FileNotFoundError)
+    assert hosts(batch[1:]) == ["a2.com"]
+    assert follower.metrics()["errors"] == 1
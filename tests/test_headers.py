@@ -0,0 +1,99 @@
+import email
+from email import policy
+from email.header import Header
+from email.parser import HeaderParser
+
+import pytest
+
+from emailtrail import analyse_headers, analyse_message
+from emailtrail.headers import message_headers, scan_headers, scan_header_block
+
+MESSAGES = [
+    "",
+    "\n\n   Received: by a.com; Tue, 10 Oct 2017 01:17:02 -0700\nTo: x@y.com\n\nbody",
+    "Received: from a.com\n        by b.com with SMTP;\n        Tue, 10 Oct 2017 01:17:02 -0700 (PDT)\nReceived: by c.com with HTTP; Tue, 10 Oct 2017 01:17:01 -0700\nFrom: Mr. Bags <bags@money.com>\n\nReceived: by body.com; not a header\n",
+    "Received: by a.com;\r\n\tTue, 10 Oct 2017 01:17:02 -0700\r\nCC: a@b.com,\r\n c@d.com\r\n\r\nbody\r\n",
+    "From someone@example.com Tue Oct 10 01:17:02 2017\nreceived: by a.com; Tue, 10 Oct 2017 01:17:02 -0700\nBcc: x@y.com\n",
+    "Received: by a.com; Tue, 10 Oct 2017 01:17:02 -0700  \n   \n  ",
+    "To: a@b.com\nthis line is no header\nReceived: by a.com; Tue, 10 Oct 2017 01:17:02 -0700\n",
+    "  continuation first\n:no name\n folded\nTo: a@b.com\n\tfolded:to\nFrom x@y.com misplaced\nSubject: hi\nFrom: me@x.com\nFrom: again@x.com\n",
+    "Received: \n by a.com; Tue, 10 Oct 2017 01:17:02 -0700\r\nTo:x@y.com",
+]
+NAMES = ["Received", "From", "To", "Cc", "Bcc"]
+
+
+@pytest.mark.parametrize("message", MESSAGES)
+def test_same_values_as_header_parser(message):
+    expected = HeaderParser().parsestr(message.strip())
+    headers = scan_headers(message)
+    for name in NAMES:
+        assert headers.get_all(name) == expected.get_all(name)
+        assert headers.get(name) == expected.get(name)
+
+
+@pytest.mark.parametrize("message", MESSAGES)
+def test_bytes_and_text_give_the_same_values(message):
+    headers = scan_headers(message)
+    raw_headers = scan_headers(message.encode())
+    for name in NAMES:
+        assert headers.get_all(name) == raw_headers.get_all(name)
+
+
+def test_header_block_end():
+    message = b"From: a@b.com\nTo: c@d.com\n\nbody\n"
+    headers, end = scan_header_block(message)
+    assert message[end:] == b"body\n"
+
+    message = b"To: c@d.com\nbody without blank line\n"
+    headers, end = scan_header_block(message)
+    assert message[end:] == b"body without blank line\n"
+
+
+def test_8bit_headers():
+    message = "To: Zoë <zoe@example.com>\n\n".encode("utf-8")
+    assert scan_headers(message).get("To") == "Zoë <zoe@example.com>"
+    message = "To: Zoë <zoe@example.com>\n\n".encode("latin-1")
+    assert scan_headers(message).get("To") == "Zoë <zoe@example.com>"
+
+
+def test_body_is_not_scanned():
+    body = "Received: by body.com; Tue, 10 Oct 2017 01:17:02 -0700\n" * 1000
+    message = "Received: by a.com; Tue, 10 Oct 2017 01:17:02 -0700\n\n" + body
+    trail = analyse_headers(message)
+    assert len(trail.hops) == 1
+    assert analyse_headers(message.encode()) == trail
+
+
+def test_unsupported_input():
+    with pytest.raises(TypeError):
+        analyse_headers(42)
+
+
+@pytest.mark.parametrize("message", MESSAGES)
+@pytest.mark.parametrize("message_policy", [policy.compat32, policy.default])
+def test_parsed_messages_give_the_same_values(message, message_policy):
+    headers = scan_headers(message)
+    for parsed in (
+        email.message_from_string(message.strip(), policy=message_policy),
+        email.message_from_bytes(message.strip().encode(), policy=message_policy),
+    ):
+        parsed_headers = message_headers(parsed)
+        for name in NAMES:
+            assert parsed_headers.get_all(name) == headers.get_all(name)
+        assert analyse_message(parsed) == analyse_headers(message)
+
+
+def test_8bit_parsed_messages():
+    for encoding in ("utf-8", "latin-1"):
+        message = "To: Zoë <zoe@example.com>\n\n".encode(encoding)
+        parsed = email.message_from_bytes(message)
+        assert message_headers(parsed).get("To") == "Zoë <zoe@example.com>"
+
+
+def test_headers_set_by_a_program():
+    message = email.message.Message()
+    message["To"] = Header("Zoë <zoe@example.com>", "utf-8")
+    message["Received"] = "by a.com; Tue, 10 Oct 2017 01:17:02 -0700"
+    trail = analyse_message(message)
+    assert trail.to_address == "Zoë <zoe@example.com>"
+    assert trail.hops == analyse_headers("Received: " + message["Received"]).hops
@@ -0,0 +1,80 @@
+from threading import Thread
+
+from emailtrail import analyse_headers, instrument
+from emailtrail.instrument import StageStats, profile, recording
+from emailtrail.timestamps import timestamp_cache
+
+SLOW = "by 10.0.0.1 with SMTP id abc; 2015-12-16 19:35:09.561998041 +0000"
+FAST = "by 10.0.0.2 with SMTP id def; Wed, 16 Dec 2015 16:34:34 -0600"
+SOURCE = "Received: %s\nReceived: %s\nTo: a@b.c\n\nbody" % (SLOW, FAST)
+
+
+def test_stages_are_recorded_only_inside_the_block():
+    timestamp_cache.clear()
+    with profile() as recorded:
+        analyse_headers(SOURCE)
+    analyse_headers(SOURCE)
+    assert instrument.active.get() is None
+
+    stages = recorded.summary()
+    assert stages["analyse_headers"]["calls"] == 1
+    assert stages["analyse_hops"]["calls"] == 1
+    assert stages["analyse_single_header"]["calls"] == 2
+    assert stages["tokenize"]["calls"] == 2
+    assert stages["dateparser"]["calls"] == 1
+    for stage in ("scan_headers", "cleanup_text", "timestring", "decode_addresses"):
+        assert stage in stages
+    assert sum(n for _, n in stages["tokenize"]["histogram"]) == 2
+
+
+def test_slowest_inputs_are_kept():
+    timestamp_cache.clear()
+    with profile(slowest=1) as recorded:
+        analyse_headers(SOURCE)
+    [(elapsed, header)] = recorded.slowest["analyse_single_header"]
+    assert header == SLOW  # the dateparser fallback
+    assert recorded.slowest["analyse_headers"][0][1] == SOURCE
+
+
+def test_callback_sees_every_stage():
+    calls = []
+    with profile(callback=lambda stage, elapsed: calls.append(stage)):
+        analyse_headers(SOURCE)
+    assert calls.count("analyse_single_header") == 2
+    assert calls[-1] == "analyse_headers"
+
+
+def test_quantiles_come_from_the_histogram():
+    stats = StageStats()
+    for elapsed in [1000] * 99 + [10**6]:
+        stats.add(elapsed)
+    assert stats.quantile(0.5) == 1024
+    assert stats.quantile(1.0) == 2**20
+    assert stats.max == 10**6
+
+
+def test_nested_profiles():
+    with profile() as outer:
+        with profile() as inner:
+            analyse_headers(SOURCE)
+        assert instrument.active.get() is outer
+        analyse_headers(SOURCE)
+    assert instrument.active.get() is None
+    assert inner.summary()["analyse_headers"]["calls"] == 1
+    assert outer.summary()["analyse_headers"]["calls"] == 1
+
+
+def test_other_threads_record_once_they_opt_in():
+    def work(recorded=None):
+        if recorded is None:
+            analyse_headers(SOURCE)
+            return
+        with recording(recorded):
+            analyse_headers(SOURCE)
+
+    with profile() as recorded:
+        for args in ((), (recorded,)):
+            thread = Thread(target=work, args=args)
+            thread.start()
+            thread.join()
+    assert recorded.summary()["analyse_headers"]["calls"] == 1
@@ -0,0 +1,138 @@
+from threading import Thread
+
+import pytest
+
+from emailtrail import Hop, Trail, analyse_headers, analyse_many
+from emailtrail.interning import Interner, interner, set_interning
+from emailtrail.store import TrailStore
+
+from .test_memo import campaign_message
+
+MESSAGES = ["From: news@example.com\n" + campaign_message(n) for n in range(10)] + [
+    "Received: from a.com by b.com with SMTP; Tue, 10 Oct 2017 01:17:02 -0700\nTo: you@example.com\n\n",
+    "Received: from a.com by b.com with SMTP; Tue, 10 Oct 2017 01:17:03 -0700\nTo: you@example.com\n\n",
+]
+
+
+@pytest.fixture
+def interning():
+    set_interning(1024)
+    yield interner
+    set_interning(0)
+
+
+def fresh(value):
+    # a str equal to `value` that isn't the same object
+    return "".join(list(value))
+
+
+def test_intern():
+    table = Interner(maxsize=10)
+    first = fresh("mx.example.com")
+    assert table.intern(first) is first
+    assert table.intern(fresh("mx.example.com")) is first
+    assert table.intern(None) is None
+    assert table.info()[:4] == (1, 1, 0, 1)
+
+
+def test_disabled():
+    table = Interner(maxsize=0)
+    value = fresh("mx.example.com")
+    assert table.intern(value) is value
+    assert len(table) == 0
+
+
+def test_keep_when_full():
+    table = Interner(maxsize=2, overflow="keep")
+    a, b = table.intern(fresh("a.com")), table.intern(fresh("b.com"))
+    c = fresh("c.com")
+    assert table.intern(c) is c
+    assert table.intern(fresh("c.com")) is not c
+    assert table.intern(fresh("a.com")) is a
+    assert table.intern(fresh("b.com")) is b
+    assert "c.com" not in table
+    assert table.info().overflows == 2
+
+
+def test_clear_when_full():
+    table = Interner(maxsize=2, overflow="clear")
+    a = table.intern(fresh("a.com"))
+    table.intern(fresh("b.com"))
+    c = table.intern(fresh("c.com"))
+    assert table.intern(fresh("c.com")) is c
+    assert table.intern(fresh("a.com")) is not a
+    assert len(table) == 2
+
+
+def test_bad_settings():
+    with pytest.raises(ValueError):
+        Interner(maxsize=-1)
+    with pytest.raises(ValueError):
+        Interner(overflow="evict")
+
+
+def test_intern_trail():
+    table = Interner()
+    trails = [
+        Trail(fresh("to"), "", "", "", [Hop(fresh("a.com"), fresh("SMTP"), "b", 1, 0)])
+        for _ in range(2)
+    ]
+    for trail in trails:
+        assert table.intern_trail(trail) is trail
+    assert trails[0].to_address is trails[1].to_address
+    assert trails[0].hops[0].from_host is trails[1].hops[0].from_host
+    assert trails[0].hops[0].protocol is trails[1].hops[0].protocol
+
+
+def assert_shared(trails):
+    assert trails == [analyse_headers(raw) for raw in MESSAGES]
+    first, last = trails[0], trails[9]
+    assert first.from_address is last.from_address
+    for hop, other in zip(first.hops, last.hops):
+        assert hop.from_host is other.from_host
+        assert hop.received_by_host is other.received_by_host
+        assert hop.protocol is other.protocol
+    assert trails[10].hops[0].from_host is trails[11].hops[0].from_host
+    assert trails[10].to_address is trails[11].to_address
+
+
+def test_analysis_shares_values(interning):
+    trails = [analyse_headers(raw) for raw in MESSAGES]
+    assert trails[0].from_address == "news@example.com"
+    assert_shared(trails)
+    assert interning.info().hits > 0
+
+
+@pytest.mark.parametrize("executor", ["process", "thread"])
+def test_analyse_many_shares_values(interning, executor):
+    results = analyse_many(MESSAGES, workers=2, chunksize=3, executor=executor)
+    assert_shared([trail for _, trail in results])
+
+
+def test_stored_trails_share_values(interning, tmp_path):
+    with TrailStore(str(tmp_path / "trails.sqlite")) as store:
+        list(store.analyse_many(MESSAGES, workers=1))
+        interning.clear()
+        warm = [trail for _, trail in store.analyse_many(MESSAGES, workers=1)]
+        assert interning.info().misses > 0
+        assert_shared(warm)
+        assert store.analyse(MESSAGES[0]).hops[0].received_by_host is (
+            warm[0].hops[0].received_by_host
+        )
+
+
+def test_threads(interning):
+    values = [fresh("host%d.example.com" % (n % 50)) for n in range(20000)]
+    results = [None] * 8
+
+    def run(thread):
+        results[thread] = [interning.intern(fresh(value)) for value in values]
+
+    threads = [Thread(target=run, args=(thread,)) for thread in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for interned in results[1:]:
+        assert all(a is b for a, b in zip(interned, results[0]))
+    assert len(interning) == 50
@@ -0,0 +1,178 @@
+import json
+import os
+
+import pytest
+
+from emailtrail import analyse_headers, jobs
+from emailtrail.jobs import (
+    claim,
+    create_job,
+    done_path,
+    job_status,
+    lock_path,
+    main,
+    merge_job,
+    run_worker,
+)
+
+MESSAGES = [
+    "Received: by a%d.com with SMTP; Tue, 10 Oct 2017 01:17:02 -0700\n"
+    "Received: from a%d.com by b.com with ESMTP; Tue, 10 Oct 2017 01:17:05 -0700\n"
+    "To: x@y.com\n" % (number, number)
+    for number in range(23)
+]
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    path = tmp_path / "messages.ndjson"
+    lines = [json.dumps({"source": message}) for message in MESSAGES]
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def read_output(path):
+    with open(path) as fd:
+        return [json.loads(line) for line in fd]
+
+
+def test_shards_are_deterministic(tmp_path, corpus):
+    first = create_job(str(tmp_path / "a"), corpus, shard_size=5)
+    second = create_job(str(tmp_path / "b"), corpus, shard_size=5)
+    assert [shard["messages"] for shard in first["shards"]] == [5, 5, 5, 5, 3]
+    assert first["shards"] == second["shards"]
+    with pytest.raises(FileExistsError):
+        create_job(str(tmp_path / "a"), corpus)
+
+
+def test_workers_share_a_job(tmp_path, corpus):
+    job = str(tmp_path / "job")
+    create_job(job, corpus, shard_size=5)
+
+    first = run_worker(job, workers=1, max_shards=2)
+    second = run_worker(job, workers=2, chunksize=2)
+    assert first == ["00000", "00001"]
+    assert second == ["00002", "00003", "00004"]
+    assert run_worker(job, workers=1) == []
+    assert len(job_status(job)["done"]) == 5
+
+    summary = merge_job(job)
+    records = read_output(os.path.join(job, "output.ndjson"))
+    assert [record["key"] for record in records] == list(range(1, 24))
+    for record, message in zip(records, MESSAGES):
+        expected = analyse_headers(message)
+        assert [hop["received_by_host"] for hop in record["trail"]["hops"]] == [
+            hop.received_by_host for hop in expected.hops
+        ]
+    assert summary["messages"] == 23 and summary["errors"] == 0
+    assert summary["hops"] == 46
+    assert summary["relays"]["b.com"]["count"] == 23
+
+
+def test_locked_shards_are_skipped_until_stale(tmp_path, corpus):
+    job = str(tmp_path / "job")
+    create_job(job, corpus, shard_size=10)
+    assert claim(job, "00000", lease=600)
+    assert not claim(job, "00000", lease=600)
+
+    assert run_worker(job, workers=1) == ["00001", "00002"]
+    assert job_status(job)["running"] == ["00000"]
+    with pytest.raises(RuntimeError):
+        merge_job(job)
+
+    # the worker holding it crashed
+    old = os.stat(lock_path(job, "00000")).st_mtime - 3600
+    os.utime(lock_path(job, "00000"), (old, old))
+    assert job_status(job)["stale"] == ["00000"]
+    assert run_worker(job, workers=1) == ["00000"]
+    assert not os.path.exists(lock_path(job, "00000"))
+    assert merge_job(job)["messages"] == 23
+
+
+def test_two_workers_taking_over_a_stale_lock(tmp_path, corpus, monkeypatch):
+    job = str(tmp_path / "job")
+    create_job(job, corpus, shard_size=10)
+    path = lock_path(job, "00000")
+    assert claim(job, "00000", lease=600)
+    old = os.stat(path).st_mtime - 3600
+    os.utime(path, (old, old))
+
+    rename = os.rename
+
+    def first_worker_goes_ahead(source, destination):
+        # the second worker found the lock stale, the first one takes it over before
+        # the second moves it away
+        monkeypatch.setattr(os, "rename", rename)
+        monkeypatch.setattr(jobs, "owner_tag", lambda: "first")
+        assert claim(job, "00000", lease=600)
+        monkeypatch.setattr(jobs, "owner_tag", lambda: "second")
+        rename(source, destination)
+
+    monkeypatch.setattr(jobs, "owner_tag", lambda: "second")
+    monkeypatch.setattr(os, "rename", first_worker_goes_ahead)
+    assert not claim(job, "00000", lease=600)
+    with open(path) as fd:
+        assert json.load(fd)["owner"] == "first"
+    assert os.listdir(os.path.dirname(path)) == ["00000.lock"]
+
+
+def test_a_worker_that_lost_its_lock_backs_off(tmp_path, corpus, monkeypatch):
+    job = str(tmp_path / "job")
+    create_job(job, corpus, shard_size=10)
+    path = lock_path(job, "00000")
+    result_record = jobs.result_record
+
+    def taken_over(key, result):
+        # another worker took the shard over while the first chunk was analysed
+        if key == 1:
+            with open(path, "w") as fd:
+                json.dump({"owner": "another", "claimed": 0}, fd)
+        return result_record(key, result)
+
+    monkeypatch.setattr(jobs, "result_record", taken_over)
+    assert run_worker(job, workers=1, chunksize=2) == ["00001", "00002"]
+    assert not os.path.exists(done_path(job, "00000"))
+    with open(path) as fd:
+        assert json.load(fd)["owner"] == "another"
+    assert sorted(os.listdir(os.path.join(job, "output"))) == [
+        "00001.ndjson",
+        "00002.ndjson",
+    ]
+
+
+def test_changed_shards_fail(tmp_path, corpus):
+    job = str(tmp_path / "job")
+    create_job(job, corpus, shard_size=10)
+    with open(os.path.join(job, "shards", "00000.ndjson"), "a") as fd:
+        fd.write(json.dumps({"key": 99, "source": MESSAGES[0]}) + "\n")
+    with pytest.raises(RuntimeError, match="00000"):
+        run_worker(job, workers=1)
+    assert not os.path.exists(done_path(job, "00000"))
+    assert os.listdir(os.path.join(job, "output")) == []
+    assert not os.path.exists(lock_path(job, "00000"))
+
+
+def test_raw_bytes_are_spooled_exactly(tmp_path):
+    source = tmp_path / "archive.mbox"
+    source.write_bytes(
+        b"From a@b Tue Oct 10 01:17:02 2017\n"
+        b"Received: by c.com; Tue, 10 Oct 2017 01:17:02 -0700\n"
+        b"To: Zo\xeb <zoe@example.com>\n\nbody\n"
+    )
+    job = str(tmp_path / "job")
+    create_job(job, str(source))
+    run_worker(job, workers=1)
+    merge_job(job)
+    [record] = read_output(os.path.join(job, "output.ndjson"))
+    assert record["trail"]["to_address"] == "Zoë <zoe@example.com>"
+
+
+def test_command_line(tmp_path, corpus, capsys):
+    job = str(tmp_path / "job")
+    assert main(["create", job, corpus, "--shard-size", "10"]) == 0
+    assert main(["status", job]) == 1
+    assert main(["work", job, "-j", "1"]) == 0
+    assert main(["status", job]) == 0
+    assert main(["merge", job, "--output", str(tmp_path / "all.ndjson")]) == 0
+    assert len(read_output(tmp_path / "all.ndjson")) == 23
+    assert "23 messages in 3 shards" in capsys.readouterr().out
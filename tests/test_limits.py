@@ -0,0 +1,91 @@
+import random
+import re
+import time
+
+import pytest
+
+from emailtrail import Limits, analyse_headers, analyse_single_header
+from emailtrail.module import DETAILS, ID_SEPARATOR, remove_details
+from emailtrail.templates import set_template_cache
+
+# inputs that took seconds with backtracking regexes
+ADVERSARIAL = [
+    "from a by b with SMTP " + "(" * 20000 + "; Wed, 16 Dec 2015 16:34:34 -0600",
+    "from a by b\n" + "(\n" * 10000,
+    "from a by b with SMTP" + " " * 20000 + "x",
+    "by b " + " id" * 20000,
+    "from a " + "by " * 10000,
+    "fromX " + "from by x " * 800,
+    "by\n" + "with " * 800,
+    # a literal newline left by cleanup, the `by` host is then looked for line by line
+    "from a\\n " + "from " * 8000,
+    # a long word without a keyword, where templates look for one
+    "from " + "a" * 16000 + " by b with SMTP; Wed, 16 Dec 2015 16:34:34 -0600",
+]
+
+
+@pytest.fixture(scope="module", autouse=True)
+def warm_dateparser():
+    # dateparser loads its locale data the first time it runs, that isn't matching time
+    analyse_single_header("by b; not a date")
+
+
+@pytest.mark.parametrize("templates", [0, 64])
+@pytest.mark.parametrize("header", ADVERSARIAL, ids=range(len(ADVERSARIAL)))
+def test_adversarial_headers_are_analysed_quickly(header, templates):
+    set_template_cache(templates)
+    try:
+        start = time.perf_counter()
+        analyse_single_header(header)
+        assert time.perf_counter() - start < 0.5
+    finally:
+        set_template_cache(0)
+
+
+def test_linear_rewrites_match_the_regexes():
+    legacy_id_separator = re.compile(r"\s+id\s+[^\s]*\s+")
+    rng = random.Random(1)
+    for _ in range(20000):
+        text = "".join(rng.choice("() \r\n\tid;x") for _ in range(rng.randrange(30)))
+        assert remove_details(text) == DETAILS.sub(" ", text), text
+        assert ID_SEPARATOR.split(text) == legacy_id_separator.split(text), text
+
+
+def received(count, padding=0):
+    headers = [
+        "Received: by relay%d.example.com with SMTP (%s); Wed, 16 Dec 2015 16:34:%02d -0600"
+        % (i, "x" * (padding if i == 0 else 0), 59 - i)
+        for i in range(count)
+    ]
+    return "\n".join(headers) + "\n\nbody"
+
+
+def test_no_truncation_within_limits():
+    trail = analyse_headers(received(5))
+    assert len(trail.hops) == 5
+    assert not trail.truncated
+
+
+def test_received_count_is_capped():
+    trail = analyse_headers(received(20), Limits(max_received=10))
+    assert trail.truncated
+    # the newest headers come first in the source, the oldest hops are dropped
+    assert [hop.received_by_host for hop in trail.hops][-1] == "relay0.example.com"
+    assert len(trail.hops) == 10
+
+
+def test_long_headers_are_cut():
+    trail = analyse_headers(received(2, padding=500), Limits(max_header_length=100))
+    assert trail.truncated
+    assert trail.hops[-1].timestamp is None
+    assert trail.hops[0].timestamp is not None
+
+
+def test_time_budget():
+    trail = analyse_headers(received(50), Limits(time_budget=0))
+    assert trail.truncated
+    assert trail.hops == []
+
+    trail = analyse_headers(received(50), Limits(time_budget=10))
+    assert not trail.truncated
+    assert len(trail.hops) == 50
@@ -0,0 +1,46 @@
+import mailbox
+
+from emailtrail import analyse_headers, analyse_mbox
+
+MESSAGES = [
+    "Received: from a.com (a.com [10.0.0.1])\n\tby b.com with ESMTP id 42;\n\tTue, 10 Oct 2017 01:17:02 -0700\nReceived: by c.com with HTTP; Tue, 10 Oct 2017 01:17:01 -0700\nFrom: Mr. Bags <bags@money.com>\nTo: you@example.com\n\nFrom the body, with a line\nthat starts like a separator.\n",
+    "Received: by d.com with SMTP; Wed, 11 Oct 2017 01:17:02 +0000\nCc: =?utf-8?Q?Capitalism=E2=84=A2?= <money@rules.com>\n\n",
+    "To: nobody@example.com\n\n" + "x" * 10000 + "\n",
+]
+
+
+def write_mbox(path):
+    box = mailbox.mbox(str(path))
+    for message in MESSAGES:
+        box.add(message)
+    box.flush()
+    box.close()
+
+
+def test_same_trails_as_analyse_headers(tmp_path):
+    path = tmp_path / "archive.mbox"
+    write_mbox(path)
+
+    box = mailbox.mbox(str(path))
+    expected = [analyse_headers(box.get_bytes(key)) for key in box.keys()]
+    box.close()
+
+    results = list(analyse_mbox(str(path)))
+    assert [trail for _, trail in results] == expected
+    assert len(results) == 3
+    assert expected[1].cc == "Capitalism™ <money@rules.com>"
+
+
+def test_offsets_point_at_from_lines(tmp_path):
+    path = tmp_path / "archive.mbox"
+    write_mbox(path)
+    data = path.read_bytes()
+
+    for offset, _ in analyse_mbox(str(path)):
+        assert data[offset:].startswith(b"From ")
+
+
+def test_empty_mbox(tmp_path):
+    path = tmp_path / "empty.mbox"
+    path.write_bytes(b"")
+    assert list(analyse_mbox(str(path))) == []
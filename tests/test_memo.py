@@ -0,0 +1,61 @@
+import pytest
+
+from emailtrail import analyse_headers, analyse_hops
+from emailtrail.memo import hops_cache, received_key, set_hops_cache
+
+from .test_tokenizer import generated_headers
+
+CHAIN = [
+    "by 10.0.0.1 with SMTP id %s; Wed, 16 Dec 2015 16:34:35 -0600",
+    "from relay.example.com (relay.example.com [10.0.0.2])\n\tby mx.example.com (Postfix) with ESMTPS id %s\n\tfor <%s>; Wed, 16 Dec 2015 16:34:34 -0600",
+]
+
+
+def campaign_message(n):
+    return "Received: %s\nReceived: %s\nTo: r%d@example.com\n\nbody" % (
+        CHAIN[0] % ("A%dX" % n),
+        CHAIN[1] % ("Q%d" % n, "r%d@example.com" % n),
+        n,
+    )
+
+
+@pytest.fixture
+def cache():
+    set_hops_cache(128)
+    yield hops_cache
+    set_hops_cache(0)
+
+
+def test_near_identical_chains_are_analysed_once(cache):
+    trails = [analyse_headers(campaign_message(n)) for n in range(20)]
+    assert cache.info().misses == 1
+    assert cache.info().hits == 19
+    assert all(trail.hops == trails[0].hops for trail in trails)
+
+    trails[0].hops[0].delay = 42
+    assert analyse_headers(campaign_message(0)).hops[0].delay == 0
+
+
+def test_ids_and_recipients_are_blanked():
+    key, blanked = received_key([CHAIN[1] % ("Q1", "a@b.com")])
+    assert key == received_key([CHAIN[1] % ("Q2", "c@d.com")])[0]
+    assert blanked == [["Q1", "<a@b.com>"]]
+    assert key != received_key([CHAIN[1].replace("ESMTPS", "SMTP") % ("Q1", "a")])[0]
+
+
+def test_values_that_could_change_the_result_are_kept(cache):
+    assert received_key(["by mx with SMTP id david;"])[1] == [[]]
+    assert received_key(["by mx with SMTP id (x);"])[1] == [[]]
+
+    # the value of `for` ends up in the protocol, such hops aren't cached
+    header = "by mx.example.com with LMTP for <%s>; Wed, 16 Dec 2015 16:34:34 -0600"
+    assert analyse_hops([header % "x@b.c"])[0].protocol == "LMTP for <x@b.c>"
+    assert analyse_hops([header % "y@b.c"])[0].protocol == "LMTP for <y@b.c>"
+    assert len(cache) == 0
+
+
+def test_same_hops_with_and_without_the_cache(cache):
+    headers = list(generated_headers(500))
+    expected = [analyse_hops([header]) for header in headers]
+    set_hops_cache(0)
+    assert [analyse_hops([header]) for header in headers] == expected
@@ -0,0 +1,56 @@
+import pickle
+
+import pytest
+
+from emailtrail import Hop, Trail, TrailBatch
+
+TRAILS = [
+    Trail(
+        to_address="money@capitalism.com;",
+        from_address="Mr. Money Bags <bags@moneyrules.com>",
+        cc="",
+        bcc="satan@wallstreet.com",
+        hops=[
+            Hop("", "HTTP", "10.103.79.86", 1507623421, 0),
+            Hop("mail-sor-f65.google.com", "SMTPS", "mx.google.com", 1507623422, 1),
+            Hop("", "SMTP", "10.129.52.209", None, 0),
+        ],
+    ),
+    Trail(to_address="", from_address="", cc="", bcc="", hops=[], truncated=True),
+    Trail(
+        to_address="money@capitalism.com;",
+        from_address="",
+        cc="",
+        bcc="",
+        hops=[Hop("mail-sor-f65.google.com", "SMTPS", "mx.google.com", 1507623422)],
+    ),
+]
+
+
+def test_models_have_no_instance_dict():
+    hop = Hop("a", "SMTP", "b", 1)
+    assert not hasattr(hop, "__dict__")
+    with pytest.raises(AttributeError):
+        hop.colour = "blue"
+    assert not hasattr(TRAILS[0], "__dict__")
+
+
+def test_models_pickle():
+    assert pickle.loads(pickle.dumps(TRAILS)) == TRAILS
+
+
+def test_batch_round_trip():
+    batch = TrailBatch.from_trails(TRAILS)
+    assert len(batch) == 3
+    assert batch.hop_count == 4
+    assert batch.to_trails() == TRAILS
+    assert batch[-1] == TRAILS[-1]
+    with pytest.raises(IndexError):
+        batch[3]
+
+
+def test_batch_stores_strings_once():
+    batch = TrailBatch.from_trails(TRAILS * 100)
+    assert len(batch.hosts) == 5
+    assert len(batch.protocols) == 3
+    assert list(batch.timestamps[:4]) == [1507623421, 1507623422, -(2**63), 1507623422]
@@ -0,0 +1,154 @@
+import io
+import json
+import mailbox
+import tracemalloc
+from xml.sax.saxutils import escape
+
+import pytest
+
+from analyse_dataset.run import run
+from emailtrail import analyse_headers, analyse_mbox
+from emailtrail.headers import scan_headers
+from emailtrail.sources import guess_format, read_header_block, read_source
+
+MESSAGES = [
+    "Received: from a.com (a.com [10.0.0.1])\n\tby b.com with ESMTP id 42;\n\tTue, 10 Oct 2017 01:17:02 -0700\nReceived: by c.com with HTTP; Tue, 10 Oct 2017 01:17:01 -0700\nFrom: Mr. Bags <bags@money.com>\nTo: you@example.com\n\nFrom the body, with a line\nthat starts like a separator.\n",
+    "Received: by d.com with SMTP; Wed, 11 Oct 2017 01:17:02 +0000\nCc: =?utf-8?Q?Capitalism=E2=84=A2?= <money@rules.com>\n\n",
+    "To: nobody@example.com\n\n" + "x" * 10000 + "\n",
+]
+EXPECTED = [analyse_headers(message) for message in MESSAGES]
+
+
+def write_xml(path):
+    rows = "".join(
+        "<row><id>%d</id><source>%s</source></row>" % (i, escape(message))
+        for i, message in enumerate(MESSAGES)
+    )
+    path.write_text("<support_novo><custom>%s</custom></support_novo>" % rows)
+
+
+def write_ndjson(path):
+    path.write_text(
+        "\n".join(json.dumps({"source": message}) for message in MESSAGES) + "\n\n"
+    )
+
+
+def write_mbox(path):
+    box = mailbox.mbox(str(path))
+    for message in MESSAGES:
+        box.add(message)
+    box.flush()
+    box.close()
+
+
+def write_maildir(path):
+    box = mailbox.Maildir(str(path))
+    for message in MESSAGES:
+        box.add(message)
+    box.close()
+
+
+@pytest.mark.parametrize(
+    "name, write",
+    [
+        ("export.xml", write_xml),
+        ("messages.ndjson", write_ndjson),
+        ("archive.mbox", write_mbox),
+    ],
+)
+def test_same_trails_as_analyse_headers(tmp_path, name, write):
+    path = tmp_path / name
+    write(path)
+    trails = [analyse_headers(raw) for _, raw in read_source(str(path))]
+    assert trails == EXPECTED
+
+
+def test_maildir(tmp_path):
+    write_maildir(tmp_path / "Maildir")
+    records = list(read_source(str(tmp_path / "Maildir")))
+    assert all(key.startswith("new/") for key, _ in records)
+    # file names are random, compare as a multiset
+    trails = [analyse_headers(raw) for _, raw in records]
+    assert sorted(map(repr, trails)) == sorted(map(repr, EXPECTED))
+
+
+def test_only_header_blocks_are_read(tmp_path):
+    write_mbox(tmp_path / "archive.mbox")
+    write_maildir(tmp_path / "Maildir")
+    for path in ("archive.mbox", "Maildir"):
+        for _, raw in read_source(str(tmp_path / path)):
+            assert b"xxxx" not in raw and b"the body" not in raw
+
+
+def test_mbox_keys_match_analyse_mbox(tmp_path):
+    path = str(tmp_path / "archive.mbox")
+    write_mbox(path)
+    assert [key for key, _ in read_source(path)] == [
+        offset for offset, _ in analyse_mbox(path)
+    ]
+
+
+def xml_peak_memory(path, rows):
+    row = "<row><id>1</id><source>%s</source></row>" % escape(MESSAGES[0])
+    path.write_text("<export><rows>%s</rows></export>" % (row * rows))
+    tracemalloc.start()
+    try:
+        count = sum(1 for _ in read_source(str(path)))
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        assert count == rows
+
+
+def test_xml_rows_are_freed(tmp_path):
+    small = xml_peak_memory(tmp_path / "small.xml", 2000)
+    large = xml_peak_memory(tmp_path / "large.xml", 20000)
+    assert large < small * 1.5
+
+
+@pytest.mark.parametrize(
+    "raw",
+    [
+        MESSAGES[0],
+        "To: a@example.com\n \nFrom: me@x.com\n\nbody\n",
+        "To: a@example.com\n\t\n\tb@example.com\nCc: c@example.com\n",
+        "\n\n  \nTo: a@example.com\nFrom: me@x.com\n\nFrom: body@x.com\n",
+        "To: a@example.com\r\nFrom: me@x.com\r\n\r\nCc: body@x.com\r\n",
+    ],
+)
+def test_header_block_parity(tmp_path, raw):
+    path = tmp_path / "message"
+    path.write_bytes(raw.encode())
+    expected = scan_headers(raw)
+    headers = scan_headers(read_header_block(str(path)))
+    for name in ("received", "from", "to", "cc"):
+        assert headers.get_all(name) == expected.get_all(name)
+
+
+def test_guess_format(tmp_path):
+    assert guess_format(str(tmp_path)) == "maildir"
+    assert guess_format("a/b.XML") == "xml"
+    assert guess_format("a/b.jsonl") == "ndjson"
+    assert guess_format("a/b.mbox") == "mbox"
+    with pytest.raises(ValueError):
+        read_source("a/b.mbox", "csv")
+
+
+def test_run(tmp_path):
+    path = tmp_path / "messages.ndjson"
+    write_ndjson(path)
+    with path.open("a") as fd:
+        fd.write(json.dumps({"source": 42}) + "\n")
+    out, err = io.StringIO(), io.StringIO()
+
+    summary = run(str(path), workers=1, out=out, err=err)
+
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [record["key"] for record in records] == [1, 2, 3, 5]
+    assert records[0]["trail"]["hops"][0]["received_by_host"] == "c.com"
+    assert "error" in records[3]
+    assert summary["messages"] == 4
+    assert summary["parse_errors"] == 1
+    assert summary["hops"] == 3
+    assert summary["timestamp_failure_rate"] == 0.0
+    assert json.loads(err.getvalue()) == summary
@@ -0,0 +1,97 @@
+import sqlite3
+
+import pytest
+
+from emailtrail import Limits, __version__, analyse_headers
+from emailtrail import store as store_module
+from emailtrail.store import TrailStore, dump_trail, load_trail
+
+MESSAGES = [
+    "Received: from a.com (a.com [10.0.0.1])\n\tby b.com with ESMTP id 42;\n\tTue, 10 Oct 2017 01:17:02 -0700\nReceived: by c.com with HTTP; Tue, 10 Oct 2017 01:17:01 -0700\nFrom: Mr. Bags <bags@money.com>\nTo: you@example.com\nMessage-ID: <1@a.com>\n\nbody\n",
+    "Received: by d.com with SMTP; Wed, 11 Oct 2017 01:17:02 +0000\nCc: =?utf-8?Q?Capitalism=E2=84=A2?= <money@rules.com>\n\n",
+    b"Received: by c.com; 2015-12-16 19:35:09.561998041 +0000 UTC\nTo: Zo\xc3\xab <zoe@example.com>\n",
+    "Received: by e.com; not a date\n",
+    None,
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    with TrailStore(str(tmp_path / "trails.sqlite")) as store:
+        yield store
+
+
+def test_round_trip():
+    for raw in MESSAGES[:4]:
+        trail = analyse_headers(raw)
+        assert load_trail(dump_trail(trail)) == trail
+
+
+def test_analyse(store):
+    for raw in MESSAGES[:4]:
+        assert store.analyse(raw) == analyse_headers(raw)
+    assert len(store) == 4
+    for raw in MESSAGES[:4]:
+        assert store.analyse(raw) == analyse_headers(raw)
+    assert len(store) == 4
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_analyse_many(store, workers):
+    inputs = MESSAGES * 3
+    for _ in range(2):
+        results = list(store.analyse_many(inputs, workers=workers, batch_size=4))
+        assert [index for index, _ in results] == list(range(len(inputs)))
+        for (_, result), raw in zip(results, inputs):
+            if raw is None:
+                assert isinstance(result, TypeError)
+            else:
+                assert result == analyse_headers(raw)
+        assert len(store) == 4
+
+
+def test_warm_runs_dont_analyse(store, monkeypatch):
+    list(store.analyse_many(MESSAGES, workers=1))
+
+    def fail(*args):
+        raise AssertionError("analysed again")
+
+    monkeypatch.setattr(store_module, "analyse_chunks", lambda *args: iter(()))
+    monkeypatch.setattr(store_module, "trail_from_headers", fail)
+    results = dict(store.analyse_many(MESSAGES, workers=1))
+    assert results[0] == analyse_headers(MESSAGES[0])
+    assert store.analyse(MESSAGES[1]) == analyse_headers(MESSAGES[1])
+
+
+def test_key_covers_headers_limits_and_version(store, monkeypatch):
+    store.analyse(MESSAGES[0])
+    store.analyse(MESSAGES[0].replace("<1@a.com>", "<2@a.com>"))
+    store.analyse(MESSAGES[0].replace("c.com", "x.com"))
+    store.analyse(MESSAGES[0], Limits(max_received=1))
+    # not part of the trail
+    store.analyse(MESSAGES[0].replace("body", "other body"))
+    store.analyse("Subject: hi\n" + MESSAGES[0])
+    assert len(store) == 4
+
+    monkeypatch.setattr(store_module, "__version__", __version__ + ".post1")
+    store.analyse(MESSAGES[0])
+    assert len(store) == 5
+
+
+def test_time_budget_cuts_arent_stored(store):
+    trail = store.analyse(MESSAGES[0], Limits(time_budget=0.0))
+    assert trail.truncated
+    assert len(store) == 0
+
+
+def test_stored_on_disk(tmp_path):
+    path = str(tmp_path / "trails.sqlite")
+    with TrailStore(path) as store:
+        store.analyse(MESSAGES[0])
+    assert sqlite3.connect(path).execute("SELECT COUNT(*) FROM trails").fetchone() == (
+        1,
+    )
+    with TrailStore(path) as store:
+        assert len(store) == 1
+        store.clear()
+        assert len(store) == 0
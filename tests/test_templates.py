@@ -0,0 +1,55 @@
+import pytest
+
+from emailtrail.module import tokenize_received_header, tokenize_with_templates
+from emailtrail.templates import set_template_cache, template_cache, template_stats
+
+from .test_tokenizer import HEADERS, generated_headers
+
+POSTFIX = "from %s (%s [10.0.0.%d])\n\tby mx.example.com (Postfix) with ESMTPS id %s\n\tfor <%s>; Tue, 12 Jan 2016 19:18:40 +0100"
+
+
+@pytest.fixture
+def templates():
+    set_template_cache(64)
+    yield template_cache
+    set_template_cache(0)
+
+
+def test_same_clauses_as_generic_tokenizer(templates):
+    headers = HEADERS + list(generated_headers(1000))
+    expected = [tokenize_received_header(header) for header in headers]
+    for _ in range(2):
+        assert [tokenize_with_templates(header) for header in headers] == expected
+
+
+def test_layouts_are_learned_once(templates):
+    for n in range(10):
+        host = "relay%d.example.org" % n
+        clauses = tokenize_with_templates(
+            POSTFIX % (host, host, n, "Q%dX" % n, "r%d@example.com" % n)
+        )
+        assert clauses.from_host == host
+        assert clauses.received_by_host == "mx.example.com"
+        assert clauses.protocol == "ESMTPS"
+        assert clauses.id == "Q%dX" % n
+        assert clauses.recipient == "<r%d@example.com>" % n
+    [(example, hits)] = template_stats()
+    assert hits == 10
+    assert "relay0.example.org" in example
+
+
+@pytest.mark.parametrize(
+    "host",
+    [
+        "identity.example.org",  # variable words can't contain keywords
+        "a by b",  # nor change the layout
+    ],
+)
+def test_other_headers_fall_back_to_the_generic_tokenizer(templates, host):
+    tokenize_with_templates(POSTFIX % ("a.example.org", "a", 1, "Q1", "r@example.com"))
+    header = POSTFIX % (host, host, 2, "Q2", "r@example.com")
+    assert tokenize_with_templates(header) == tokenize_received_header(header)
+    # learned as a layout of its own
+    hits = dict(template_stats())
+    assert hits[header] == 1
+    assert hits[POSTFIX % ("a.example.org", "a", 1, "Q1", "r@example.com")] == 1
@@ -0,0 +1,118 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier, Event
+
+import pytest
+
+from benchmarks.corpus import generate_messages
+from emailtrail import analyse_headers, analyse_many, instrument
+from emailtrail.instrument import profile, recording
+from emailtrail.memo import set_hops_cache
+from emailtrail.templates import set_template_cache
+from emailtrail.timestamps import (
+    parse_with_dateparser,
+    timestamp_cache,
+    timestamp_stats,
+)
+
+from .test_memo import campaign_message
+
+THREADS = 8
+MESSAGES = list(generate_messages(40, seed=5)) + [
+    campaign_message(n) for n in range(20)
+]
+
+
+@pytest.fixture
+def caches():
+    set_hops_cache(64)
+    set_template_cache(64)
+    yield
+    set_hops_cache(0)
+    set_template_cache(0)
+    timestamp_cache.clear()
+
+
+def analyse_all(messages):
+    return [analyse_headers(message) for message in messages]
+
+
+def test_threads_match_a_single_thread(caches):
+    expected = analyse_all(MESSAGES)
+    set_hops_cache(64)
+    set_template_cache(64)
+    timestamp_cache.clear()
+    timestamp_stats.clear()
+
+    start = Barrier(THREADS)
+
+    def run(offset):
+        start.wait()
+        # every thread in a different order, so they race on the same cache entries
+        order = MESSAGES[offset:] + MESSAGES[:offset]
+        with recording(recorded):
+            return analyse_all(order), offset
+
+    with profile() as recorded:
+        with ThreadPoolExecutor(THREADS) as pool:
+            results = list(pool.map(run, range(0, THREADS * 7, 7)))
+
+    for trails, offset in results:
+        assert trails == expected[offset:] + expected[:offset]
+    assert recorded.stages["analyse_headers"].calls == THREADS * len(MESSAGES)
+    assert sum(timestamp_stats.values()) > 0
+
+
+def test_dateparser_in_many_threads():
+    timestrings = [
+        "2017-10-10 01:17:02 +0000",
+        "Tue Oct 10 01:17:02 2017 -0700",
+        "not a date at all",
+    ] * 20
+    expected = [parse_with_dateparser(timestring) for timestring in timestrings]
+    with ThreadPoolExecutor(THREADS) as pool:
+        assert list(pool.map(parse_with_dateparser, timestrings)) == expected
+
+
+def test_stats_counters_are_exact():
+    timestamp_stats.clear()
+    with ThreadPoolExecutor(THREADS) as pool:
+        list(pool.map(lambda _: timestamp_stats.increment("native"), range(10000)))
+    assert timestamp_stats["native"] == 10000
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_analyse_many_on_threads(ordered):
+    results = dict(
+        analyse_many(
+            MESSAGES, workers=4, chunksize=8, ordered=ordered, executor="thread"
+        )
+    )
+    assert [results[index] for index in range(len(MESSAGES))] == analyse_all(MESSAGES)
+
+
+def test_unknown_executor():
+    with pytest.raises(ValueError):
+        list(analyse_many(MESSAGES, executor="fibers"))
+
+
+def test_overlapping_profiles_in_threads():
+    # every thread opens its own profile, they're all open at once and close in order
+    entered = Barrier(THREADS)
+    closed = [Event() for _ in range(THREADS)]
+
+    def run(thread):
+        with profile() as recorded:
+            entered.wait()
+            analyse_all(MESSAGES[: thread + 1])
+            if thread:
+                closed[thread - 1].wait()
+        closed[thread].set()
+        return recorded
+
+    with ThreadPoolExecutor(THREADS) as pool:
+        results = list(pool.map(run, range(THREADS)))
+
+    analyse_headers(MESSAGES[0])
+    assert instrument.active.get() is None
+    for thread, recorded in enumerate(results):
+        assert recorded.stages["analyse_headers"].calls == thread + 1
@@ -0,0 +1,91 @@
+import subprocess
+import sys
+
+import pytest
+
+from emailtrail import get_timestamp
+from emailtrail.timestamps import (
+    parse_rfc5322_timestamp,
+    parse_with_dateparser,
+    resolve_timestamp,
+    set_dateparser_languages,
+    timestamp_stats,
+)
+
+
+@pytest.mark.parametrize(
+    "timestring",
+    [
+        "Wed, 16 Dec 2015 16:34:34 -0600",
+        "Wed, 16 Dec 2015 22:19:22.596 +0000",
+        "Fri, 18 Dec 2015 15:37:27 GMT",
+        "Tue, 10 Oct 2017 01:17:02 UT",
+        "16 Dec 2015 16:34 -0600",
+        "Wed,16 dec 2015 16:34:34 +0530",
+        "Wed, 16 Dec 2015 16:34:34 EST",
+        "Wed, 16 Dec 2015 16:34:34 PDT",
+        "Wed, 16 Dec 15 16:34:34 -0600",
+        "Sat, 29 Feb 2020 23:59:59 -1200",
+    ],
+)
+def test_native_parser_agrees_with_dateparser(timestring):
+    timestamp = parse_rfc5322_timestamp(timestring)
+    assert timestamp is not None
+    assert timestamp == parse_with_dateparser(timestring)
+
+
+def test_negative_zero_offset_is_utc():
+    assert 1450283674 == parse_rfc5322_timestamp("Wed, 16 Dec 2015 16:34:34 -0000")
+
+
+def test_military_zones_are_treated_as_utc():
+    assert 1450283674 == parse_rfc5322_timestamp("Wed, 16 Dec 2015 16:34:34 A")
+
+
+@pytest.mark.parametrize(
+    "timestring",
+    [
+        "2015-12-16 19:35:09.561998041 +0000",
+        "Wed, 16 Dec 2015 16:34:34",
+        "Wed, 16 Dec 2015 16:34:34 +0575",
+        "Wed, 31 Feb 2015 16:34:34 +0000",
+        "Wed, 16 Dec 2015 24:34:34 +0000",
+        "Wed, 16 Dec 2015 16:34:34 CET",
+        "time is 12:30 pm, blah",
+    ],
+)
+def test_native_parser_rejects_other_forms(timestring):
+    assert None is parse_rfc5322_timestamp(timestring)
+
+
+def test_fallbacks_are_counted():
+    timestamp_stats.clear()
+    resolve_timestamp("Wed, 16 Dec 2015 16:34:34 -0600")
+    resolve_timestamp("2015-12-16 19:35:09.561998041 +0000")
+    resolve_timestamp("time is 12:30 pm, blah")
+    assert timestamp_stats == {"native": 1, "fallback": 2, "unparsed": 1}
+
+
+def test_long_timestrings_are_not_parsed():
+    timestamp_stats.clear()
+    assert None is resolve_timestamp("Wed, 16 Dec 2015 16:34:34 -0600 " + "x" * 200)
+    assert timestamp_stats == {"unparsed": 1}
+
+
+def test_import_does_not_load_dateparser():
+    code = "import sys, emailtrail; emailtrail.get_timestamp('Fri, 18 Dec 2015 15:37:27 GMT'); print('dateparser' in sys.modules)"
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    assert output.strip() == "False"
+
+
+def test_limiting_dateparser_languages():
+    try:
+        set_dateparser_languages(["en"])
+        assert 1450283709 == get_timestamp("2015-12-16 16:35:09 +0000")
+        set_dateparser_languages(["es"])
+        assert None is get_timestamp("16 December 2015 16:35:09 +0000")
+    finally:
+        set_dateparser_languages(None)
+    assert 1450283709 == get_timestamp("16 December 2015 16:35:09 +0000")
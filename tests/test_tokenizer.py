@@ -0,0 +1,140 @@
+import random
+
+import pytest
+
+from emailtrail import (
+    tokenize_received_header,
+    extract_from_label,
+    extract_received_by_label,
+    extract_protocol,
+    extract_timestring,
+)
+from emailtrail.utils import cleanup_text
+
+HEADERS = [
+    "from mail-vk0-x233.google.com (mail-vk0-x233.google.com. [2607:f8b0:400c:c05::233])\n        by mx.google.com with ESMTPS id d124si110912930vka.142.2016.01.12.10.20.45\n        for <support@peacedojo.com>\n        (version=TLS1_2 cipher=ECDHE-RSA-AES128-GCM-SHA256 bits=128/128);\n        Wed, 16 Dec 2015 16:34:34 -0600",
+    "by mailr.blah.com for <sales@hohoho.com>; Fri, 18 Dec 2015 15:37:27 GMT",
+    "from laughingbuddha.com ([5.175.233.84]:53519 helo=5.175.233.84)\n\tby ivyfpysq.laughingbuddha.com with esmtpa (Exim 4.86)\n\t(envelope-from <newsletter@indiaretailnews.com>)\n\tid 1aJ3Wi-0007QT-T2\n\tfor careers@peacedojo.com; Tue, 12 Jan 2016 19:18:40 +0100",
+    "from www.ramayan.nl ([212.178.196.87])\nby smtp.ramayan.nl (Kerio Connect 8.1.2)\nfor sales@peacedojo.com;\n Fri, 18 Dec 2015 10:11:37 +0100",
+    "from MBX7.superpower2020.com (2002:2eaf:356b::2eaf:356b) by\n MBX5.superpower2020.com (2002:2eaf:3569::2eaf:3569) with Microsoft SMTP\n Server (TLS) id 15.0.1104.5; Tue, 12 Jan 2016 17:39:59 +0000",
+    "from BLU179-W55 ([65.55.111.73]) by BLU004-OMC2S38.hotmail.com over TLS secured channel with Microsoft SMTPSVC(7.5.7601.23008);\n\t Tue, 12 Jan 2016 09:44:09 -0800",
+    "from [127.0.0.1] (localhost [52.2.54.97])\\n\\tby ismtpd0002p1iad1.sendgrid.net (SG) with ESMTP id p3iTfjpIQMuPA35Cjv4UrQ\\n\\tfor <support+chat@pandakungfu.com>; Wed, 16 Dec 2015 22:19:22.596 +0000 (UTC)",
+    "by filter0552p1mdw1.sendgrid.net with SMTP id filter0552p1mdw1.16694.5671BCED35\\n        2015-12-16 19:35:09.561998041 +0000 UTC",
+    "by mx0032p1mdw1.sendgrid.net with SMTP id mpeXBqGIOM Sat, 16 Dec 2017 07:12:45 +0000 (UTC)",
+    "by relay.example.com (Postfix, from userid 1000) id 3F2A; Sat, 16 Dec 2017 07:12:45 +0000",
+    "from a.example.com by b.example.com with ESMTP for <david@example.com>; Sat, 16 Dec 2017 07:12:45 +0000",
+    "from  by x with SMTP; Sat, 16 Dec 2017 07:12:45 +0000",
+    "from  by by x  with SMTP; Sat, 16 Dec 2017 07:12:45 +0000",
+    "from by x with SMTP; Sat, 16 Dec 2017 07:12:45 +0000",
+    "by  with x; Sat, 16 Dec 2017 07:12:45 +0000",
+    "fromage by cheese with LMTP; Sat, 16 Dec 2017 07:12:45 +0000",
+    "fromage from a.example.com by b.example.com with ESMTP id x; Sat, 16 Dec 2017 07:12:45 +0000",
+    "bystander standby b.example.com via HTTP; Sat, 16 Dec 2017 07:12:45 +0000",
+    "fromage (a) from a\\n by b\\n with LMTP; Sat, 16 Dec 2017 07:12:45 +0000",
+    "by",
+    "from blah",
+    "from",
+    "",
+]
+
+FROM_PARTS = [
+    "",
+    "from mail.example.com",
+    "from mail.example.com (mail.example.com [10.0.0.1])",
+    "from [127.0.0.1] (helo=x) (Authenticated sender: a@b.com)",
+    "from  mail.example.com",
+    "from unknown (HELO identity.example.com) (10.2.3.4)",
+]
+BY_PARTS = [
+    "by mx.example.com",
+    "by mx.example.com (Postfix)",
+    "by  mx.example.com",
+    "by 10.31.236.194",
+    "",
+]
+WITH_PARTS = [
+    "",
+    "with ESMTPS",
+    "with esmtp (Exim 4.86)",
+    "via HTTP",
+    "with Microsoft SMTP Server (TLS)",
+    "with LMTP (dovecot)",
+    "with ESMTP for <david@example.com>",
+]
+TAIL_PARTS = [
+    "",
+    "id 1aJ3Wi-0007QT-T2",
+    "id identity.42 for <r@example.com>",
+    "for <r@example.com>",
+    "(version=TLS1_2 cipher=ECDHE-RSA-AES128-GCM-SHA256 bits=128/128)",
+]
+DATE_PARTS = [
+    "; Tue, 12 Jan 2016 19:18:40 +0100",
+    ";\n\tTue, 12 Jan 2016 19:18:40 -0800 (PST)",
+    "\n        2015-12-16 19:35:09.561998041 -0000 UTC",
+    " Sat, 16 Dec 2017 07:12:45 +0000 (UTC)",
+    "",
+]
+SEPARATORS = [" ", "\n        ", "\n\t", "  ", "\\n\\t"]
+
+
+def generated_headers(count=2000, seed=5322):
+    rng = random.Random(seed)
+    for _ in range(count):
+        parts = [
+            rng.choice(FROM_PARTS),
+            rng.choice(BY_PARTS),
+            rng.choice(WITH_PARTS),
+            rng.choice(TAIL_PARTS),
+        ]
+        header = ""
+        for part in parts:
+            if part:
+                header += (rng.choice(SEPARATORS) if header else "") + part
+        yield header + rng.choice(DATE_PARTS)
+
+
+def legacy_clauses(header):
+    return (
+        extract_from_label(header),
+        extract_received_by_label(header),
+        extract_protocol(header),
+        extract_timestring(header),
+    )
+
+
+def clauses(header):
+    result = tokenize_received_header(header)
+    return (
+        result.from_host,
+        result.received_by_host,
+        result.protocol,
+        result.timestring,
+    )
+
+
+@pytest.mark.parametrize("header", HEADERS)
+def test_same_clauses_as_extract_functions(header):
+    assert clauses(header) == legacy_clauses(header)
+
+
+def test_same_clauses_as_extract_functions_on_generated_corpus():
+    for header in generated_headers():
+        for variant in (header, cleanup_text(header)):
+            assert clauses(variant) == legacy_clauses(variant), variant
+
+
+def test_id_and_recipient():
+    result = tokenize_received_header(HEADERS[2])
+    assert result.id == "1aJ3Wi-0007QT-T2"
+    assert result.recipient == "careers@peacedojo.com"
+
+
+def test_by_host_across_literal_newlines():
+    rng = random.Random(3)
+    pieces = ["from", "by", "a", "fromx", "xfrom", "\\n", " ", "  ", "\n", "\t"]
+    for _ in range(20000):
+        header = "".join(rng.choice(pieces) for _ in range(rng.randrange(12)))
+        assert tokenize_received_header(
+            header
+        ).received_by_host == extract_received_by_label(header), header